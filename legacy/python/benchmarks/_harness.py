@@ -0,0 +1,277 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Shared fixtures for the benchmarks: timing, a scriptable stub apt, a
+throwaway target root, and a local artifact server."""
+
+# external imports
+#...
+
+# internal imports
+#...
+
+# standard imports
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+import os, re, sys, shutil, tempfile, threading, statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+
+__all__ = [
+	"measure",
+	"BenchEnvironment",
+]
+
+
+# Sleeps, optionally while holding a lock like dpkg's frontend lock, then
+# logs how it was called, unless told to fail. --print-uris answers with
+# $STUB_APT_URIS, without the lock, like apt. Configured through the
+# environment so the same binary serves every benchmark.
+STUB_APT = """#!/bin/sh
+# Fails calls containing $STUB_APT_FAIL, like apt meeting a missing package.
+case " $* " in *" $STUB_APT_FAIL "*)
+	[ -n "$STUB_APT_FAIL" ] && { echo "E: Unable to locate package" >&2; exit 100; };;
+esac
+case " $* " in *" --print-uris "*)
+	[ -n "$STUB_APT_URIS" ] && cat "$STUB_APT_URIS"
+	exit 0;;
+esac
+if [ -n "$STUB_APT_LOCK" ]; then
+	exec 9>>"$STUB_APT_LOCK"
+	flock 9
+fi
+[ "${STUB_APT_LATENCY:-0}" != "0" ] && sleep "$STUB_APT_LATENCY"
+[ -n "$STUB_APT_LOG" ] && echo "$*" >> "$STUB_APT_LOG"
+# Reports each package's progress like apt does, when given a Status-Fd.
+for argument in "$@"; do
+	case "$argument" in APT::Status-Fd=*) status="${argument#*=}";; esac
+done
+if [ -n "$status" ]; then
+	action=; count=0
+	for argument in "$@"; do
+		case "$argument" in
+		install|remove|purge) action="$argument";;
+		-*|*=*) ;;
+		*) [ -n "$action" ] && count=$((count + 1)) && \
+			echo "pmstatus:$argument:$((count * 10)):Setting up $argument" >> "/dev/fd/$status";;
+		esac
+	done
+fi
+if [ -n "$STUB_APT_PROMPT" ]; then
+	case " $* " in *" -y "*|*" --yes "*|*"Assume-Yes=true"*) ;;
+	*" install "*|*" remove "*|*" purge "*)
+		echo "Do you want to continue? [Y/n]"
+		read answer || { echo "Abort."; exit 1; };;
+	esac
+fi
+exit 0
+"""
+
+OS_RELEASE = """NAME="Ubuntu"
+VERSION="22.04.3 LTS (Jammy Jellyfish)"
+ID=ubuntu
+ID_LIKE=debian
+VERSION_ID="22.04"
+VERSION_CODENAME=jammy
+UBUNTU_CODENAME=jammy
+"""
+
+
+def measure(function, number=1, rounds=5, setup=None):
+	"""Seconds per call of function, over rounds of number calls each."""
+	times = []
+	for _ in range(rounds):
+		if setup is not None: setup()
+		start = perf_counter()
+		for _ in range(number): function()
+		times.append((perf_counter() - start) / number)
+
+	return {
+		"best": min(times),
+		"median": statistics.median(times),
+		"rounds": rounds,
+		"number": number,
+	}
+
+
+class _ArtifactHandler(SimpleHTTPRequestHandler):
+	"""Serves files with keep-alive, ETags, conditional GETs and (unless
+	disabled) byte ranges, counting requests in server.requests.
+	delay is added before every response, and after stall_after bytes of a
+	response the server goes quiet, like a congested or broken mirror; after
+	cut_after bytes it hangs up instead, like a dropped connection."""
+	protocol_version = "HTTP/1.1"
+	ranges = True
+	delay = 0
+	stall_after = None
+	cut_after = None
+
+	def send_head(self):
+		self.server.requests += 1
+		if self.delay: sleep(self.delay)
+		path = self.translate_path(self.path)
+		if not os.path.isfile(path):
+			self.send_error(404)
+			return None
+
+		file = open(path, "rb")
+		stat = os.fstat(file.fileno())
+		etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+		modified = self.date_time_string(int(stat.st_mtime))
+		if self.headers.get("If-None-Match") == etag or (not "If-None-Match" in self.headers
+				and self.headers.get("If-Modified-Since") == modified):
+			file.close()
+			self.send_response(304)
+			self.send_header("ETag", etag)
+			self.end_headers()
+			return None
+
+		start, end = 0, stat.st_size - 1
+		match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+		if match and self.ranges:
+			start = int(match.group(1))
+			# NOTE: like real servers, ranges past the end stop at it.
+			end = min(int(match.group(2)), end) if match.group(2) else end
+			self.send_response(206)
+			self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+		else:
+			self.send_response(200)
+
+		if self.ranges: self.send_header("Accept-Ranges", "bytes")
+		self.send_header("Content-Length", str(end - start + 1))
+		self.send_header("ETag", etag)
+		self.send_header("Last-Modified", modified)
+		self.end_headers()
+		file.seek(start)
+		self._remaining = end - start + 1
+		return file
+
+	def copyfile(self, source, destination):
+		sent = 0
+		while self._remaining > 0:
+			if self.stall_after is not None and sent >= self.stall_after:
+				destination.flush()
+				sleep(3600)
+			elif self.cut_after is not None and sent >= self.cut_after:
+				self.close_connection = True
+				return
+
+			size = min(1 << 16, self._remaining)
+			if self.cut_after is not None: size = min(size, self.cut_after - sent)
+			chunk = source.read(size)
+			if not chunk: break
+			destination.write(chunk)
+			self._remaining -= len(chunk)
+			sent += len(chunk)
+
+	def log_message(self, *args): pass
+
+
+class BenchEnvironment():
+	"""A temporary cache directory, a fake Ubuntu target root, a stub apt on
+	PATH and local artifact servers. Restores the environment on exit."""
+
+	def __init__(self, installed=2000):
+		self.installed = installed
+		self.servers = {}
+
+	def __enter__(self):
+		from strapon._host_facts import set_target_root
+
+		self.directory = tempfile.mkdtemp(prefix="strapon-bench-")
+		self._environ = dict(os.environ)
+
+		self.root = self.path("root")
+		os.makedirs(os.path.join(self.root, "etc/apt"))
+		os.makedirs(os.path.join(self.root, "var/lib/dpkg"))
+		with open(os.path.join(self.root, "etc/os-release"), "wt") as file:
+			file.write(OS_RELEASE)
+		with open(os.path.join(self.root, "var/lib/dpkg/status"), "wt") as file:
+			for i in range(self.installed):
+				file.write(f"Package: installed{i}\nStatus: install ok installed\n"
+					f"Architecture: amd64\nVersion: 1.{i}-0ubuntu1\n\n")
+
+		stubs = self.path("bin")
+		os.makedirs(stubs)
+		for name in ("apt", "apt-get", "add-apt-repository", "chroot"):
+			with open(os.path.join(stubs, name), "wt") as file:
+				file.write(STUB_APT)
+			os.chmod(os.path.join(stubs, name), 0o755)
+
+		os.environ["PATH"] = f"{stubs}{os.pathsep}{os.environ.get('PATH', '')}"
+		os.environ["STRAPON_CACHE_DIR"] = self.path("cache")
+		os.environ.pop("STRAPON_HOST_FACTS", None)
+		self.stub(latency=0)
+		set_target_root(self.root)
+		return self
+
+	def __exit__(self, *error):
+		from strapon._host_facts import set_target_root
+		from strapon import _backend
+
+		# NOTE: a worker started in here has this environment's PATH and root.
+		if _backend._backend is not None: _backend._backend.close()
+
+		for server in self.servers.values():
+			server.shutdown()
+			server.server_close()
+
+		os.environ.clear()
+		os.environ.update(self._environ)
+		set_target_root(os.environ.get("STRAPON_ROOT"))
+		shutil.rmtree(self.directory, ignore_errors=True)
+		return False
+
+	def path(self, *parts):
+		return os.path.join(self.directory, *parts)
+
+	def stub(self, latency=0, lock=False, log=False, prompt=False):
+		"""Reconfigures the stub apt: seconds of latency per call, whether
+		calls serialize on a shared lock, whether they're logged, and whether
+		changes without -y ask for confirmation on stdin like apt does."""
+		os.environ["STUB_APT_LATENCY"] = str(latency)
+		os.environ["STUB_APT_LOCK"] = self.path("apt.lock") if lock else ""
+		os.environ["STUB_APT_LOG"] = self.path("apt.log") if log else ""
+		os.environ["STUB_APT_PROMPT"] = "1" if prompt else ""
+
+	def serve(self, ranges=True, delay=0, stall_after=None, cut_after=None):
+		"""Base URL of a local server for self.path("www"), see _ArtifactHandler."""
+		key = (ranges, delay, stall_after, cut_after)
+		if not key in self.servers:
+			os.makedirs(self.path("www"), exist_ok=True)
+			handler = type("Handler", (_ArtifactHandler,),
+				{"ranges": ranges, "delay": delay, "stall_after": stall_after, "cut_after": cut_after})
+			directory = self.path("www")
+			server = ThreadingHTTPServer(("127.0.0.1", 0),
+				lambda *args: handler(*args, directory=directory))
+			server.daemon_threads = True
+			server.requests = 0
+			threading.Thread(target=server.serve_forever, daemon=True).start()
+			self.servers[key] = server
+
+		return f"http://127.0.0.1:{self.servers[key].server_address[1]}"
+
+	def requests(self, ranges=True, delay=0, stall_after=None, cut_after=None):
+		"""How many requests the matching serve() server has answered."""
+		return self.servers[(ranges, delay, stall_after, cut_after)].requests
@@ -0,0 +1,194 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Benchmarks for strapon's in-process hot paths: host facts matching,
+decorator evaluation, Installer.exec dispatch and batch planning, and the
+cold start of the CLI."""
+
+# external imports
+#...
+
+# internal imports
+from _harness import measure
+
+# standard imports
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import os, sys, subprocess
+
+
+
+__all__ = [
+	"BENCHMARKS",
+]
+
+
+# A synthetic strapon module, shaped like krita.py with a few extra guards.
+MODULE_TEMPLATE = """
+from strapon import *
+
+@strapon(SystemInstaller.default())
+@SystemInstaller.register_repository("ppa:bench/ppa{index}", os_name="ubuntu")
+@SystemInstaller.stage_package("package{index}", os_version=">=20.04")
+@SystemInstaller.stage_package("installed{index}", os_name="debian")
+@SystemInstaller.fallback_package("fallback{index}", os_name="debian")
+@SystemInstaller.stage_package("preferred{index}", os_name="ubuntu")
+def system(installer, namespace):
+	installer.exec(namespace)
+"""
+
+
+def _modules(env, count):
+	"""Writes count synthetic modules, returning their compiled code."""
+	directory = env.path("modules")
+	os.makedirs(directory, exist_ok=True)
+	codes = []
+	for index in range(count):
+		path = os.path.join(directory, f"bench{index}.py")
+		source = MODULE_TEMPLATE.format(index=index)
+		with open(path, "wt") as file:
+			file.write(source)
+		codes.append((f"bench{index}", compile(source, path, "exec")))
+
+	return codes
+
+
+def _evaluate(codes):
+	"""Runs each module body, which is where every decorator evaluates."""
+	from types import ModuleType
+
+	modules = []
+	for name, code in codes:
+		module = ModuleType(name)
+		module.__file__ = code.co_filename
+		exec(code, module.__dict__)
+		modules.append(module)
+
+	return modules
+
+
+def host_facts(env):
+	from strapon._host_facts import HostFacts, get_host_facts
+
+	facts = get_host_facts()
+	query = dict(os_name="ubuntu", os_version=">=20.04 <24", cpu=facts.cpu)
+	return {
+		"matching_ALL_memoized": measure(lambda : facts.matching_ALL(**query), number=10000),
+		"matching_ALL_cold": measure(lambda : HostFacts(id="ubuntu", id_like="debian",
+			version_id="22.04").matching_ALL(**query), number=2000),
+	}
+
+
+def decorators(env):
+	results = {}
+	for count in (100, 500):
+		codes = _modules(env, count)
+		timing = measure(lambda : _evaluate(codes), rounds=5)
+		timing["per_module"] = timing["best"] / count
+		results[f"modules_{count}"] = timing
+
+	return results
+
+
+def exec_dispatch(env):
+	from strapon import SystemInstaller
+
+	installer = SystemInstaller("apt")
+	installer.metadata["index_before_action"] = False
+	installer.metadata["packages"] = ["installed1", "installed2"]
+	satisfied = Namespace(action="install", plan=False)
+
+	staged = SystemInstaller("apt")
+	staged.metadata["index_before_action"] = False
+	staged.metadata["packages"] = ["missing1", "installed2"]
+
+	return {
+		# Everything already installed: planning short-circuits the action.
+		"satisfied": measure(lambda : installer.exec(satisfied), number=2000),
+		# One stub apt process per call.
+		"native": measure(lambda : staged.exec(satisfied), number=20),
+	}
+
+
+def planning(env):
+	from strapon._batch import BatchPlan
+
+	modules = _evaluate(_modules(env, 300))
+
+	def plan():
+		batch = BatchPlan()
+		for module in modules:
+			batch.add_module(module.__name__, module)
+		return batch.report("install")
+
+	return {"batch_300_modules": measure(plan, rounds=5)}
+
+
+def native_contention(env, calls=8, latency=0.05):
+	"""Wall time of concurrent stub apt calls serializing on one lock, as
+	with dpkg's frontend lock, against the same calls without it."""
+	from strapon._runtime import Command
+
+	apt = Command("apt")
+	results = {}
+	for lock in (False, True):
+		env.stub(latency=latency, lock=lock)
+		start = perf_counter()
+		with ThreadPoolExecutor(max_workers=calls) as executor:
+			for job in [executor.submit(apt, "install", f"p{i}") for i in range(calls)]: job.result()
+		results["locked" if lock else "unlocked"] = {"wall": perf_counter() - start,
+			"calls": calls, "latency": latency}
+
+	env.stub(latency=0)
+	return results
+
+
+def startup(env, rounds=20):
+	"""Cold `python -m strapon --help` in development mode, STRAPON_OPTIMIZE
+	and python -O, against a bare interpreter. Mostly imports, so this is
+	what catches a heavy module (sh, dpcontracts, ssl, ...) loaded eagerly
+	again."""
+	python = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	environment = {**os.environ, "PYTHONPATH": python}
+	environment.pop("STRAPON_OPTIMIZE", None)
+	variants = {
+		"bare": ([sys.executable, "-c", "pass"], environment),
+		"development": ([sys.executable, "-m", "strapon", "--help"], environment),
+		"optimize": ([sys.executable, "-m", "strapon", "--help"], {**environment, "STRAPON_OPTIMIZE": "1"}),
+		"python_O": ([sys.executable, "-O", "-m", "strapon", "--help"], environment),
+	}
+
+	def run(argv, variant_environment):
+		subprocess.run(argv, env=variant_environment, cwd=python, check=True, stdout=subprocess.DEVNULL)
+
+	return {name: measure(lambda : run(*variant), rounds=rounds) for name, variant in variants.items()}
+
+
+BENCHMARKS = {
+	"host_facts": host_facts,
+	"decorators": decorators,
+	"exec_dispatch": exec_dispatch,
+	"planning": planning,
+	"native_contention": native_contention,
+	"startup": startup,
+}
@@ -0,0 +1,118 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Runs the benchmark suite, writing the results as JSON.
+
+Run from legacy/python:
+
+    python benchmarks/run.py -o before.json
+    python benchmarks/run.py -o after.json --compare before.json
+    python benchmarks/run.py decorators planning
+"""
+
+# external imports
+#...
+
+# internal imports
+from _harness import BenchEnvironment
+import core, transfer, versions
+
+# standard imports
+from argparse import ArgumentParser
+import os, sys, json, time, platform, subprocess
+
+
+
+SUITES = (core, transfer, versions)
+BENCHMARKS = {name: function for suite in SUITES for name, function in suite.BENCHMARKS.items()}
+
+
+def _metrics(results, prefix=""):
+	"""Flattens nested results into {"a.b.best": number}."""
+	for key, value in results.items():
+		if isinstance(value, dict):
+			yield from _metrics(value, f"{prefix}{key}.")
+		elif isinstance(value, (int, float)) and not isinstance(value, bool):
+			yield f"{prefix}{key}", value
+
+
+def _revision():
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+			text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+	except OSError:
+		return None
+
+
+def compare(previous, current):
+	"""Lines of timing changes between two result files; ratios above 1 are
+	slower for times and faster for throughput."""
+	old = dict(_metrics(previous["results"]))
+	lines = []
+	for key, value in _metrics(current["results"]):
+		if not key in old or not old[key] or key.endswith((".rounds", ".number", ".calls", ".latency")):
+			continue
+
+		lines.append(f"{key:<60} {old[key]:>12.6g} -> {value:>12.6g}  x{value / old[key]:.2f}")
+
+	return "\n".join(lines)
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser(prog="benchmarks/run.py", description=__doc__.split("\n")[0])
+	parser.add_argument("benchmarks", nargs="*", choices=[[], *BENCHMARKS], metavar="benchmark",
+		help=f"any of {', '.join(BENCHMARKS)} (default: all)")
+	parser.add_argument("-o", "--output", default=None, help="JSON file (default: stdout)")
+	parser.add_argument("--compare", default=None, metavar="JSON",
+		help="Print changes against an earlier result file")
+	args = parser.parse_args()
+
+	from strapon._runtime import OPTIMIZED
+
+	report = {
+		"meta": {
+			# Contract checks dominate decorator timings unless optimized.
+			"optimized": OPTIMIZED,
+			"revision": _revision(),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"cpus": os.cpu_count(),
+			"time": time.time(),
+		},
+		"results": {},
+	}
+
+	with BenchEnvironment() as env:
+		for name in args.benchmarks or BENCHMARKS:
+			print(f"running {name}", file=sys.stderr)
+			report["results"][name] = BENCHMARKS[name](env)
+
+	if args.output is None:
+		json.dump(report, sys.stdout, indent="\t")
+		print()
+	else:
+		with open(args.output, "wt") as file:
+			json.dump(report, file, indent="\t")
+
+	if args.compare is not None:
+		with open(args.compare, "rt") as file:
+			print(compare(json.load(file), report), file=sys.stderr)
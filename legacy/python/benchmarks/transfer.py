@@ -0,0 +1,283 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Benchmarks for fetching artifacts from a local server: segmented and
+single stream downloads, cached fetches, download plus extraction (one
+after the other and streamed), mirror selection and failover against
+servers with injected delays, prefetching native package archives,
+resolving versions from a release index, and block level delta updates."""
+
+# external imports
+#...
+
+# internal imports
+from _harness import measure
+
+# standard imports
+import os, io, json, shutil, tarfile, hashlib
+
+
+
+__all__ = [
+	"BENCHMARKS",
+]
+
+
+SIZE = 32 << 20
+
+
+def _artifacts(env):
+	www = env.path("www")
+	os.makedirs(www, exist_ok=True)
+	if not os.path.exists(os.path.join(www, "big.bin")):
+		with open(os.path.join(www, "big.bin"), "wb") as file:
+			file.write(os.urandom(SIZE))
+
+		with tarfile.open(os.path.join(www, "tree.tar.gz"), "w:gz") as archive:
+			for i in range(200):
+				data = os.urandom(1 << 14) * 4
+				info = tarfile.TarInfo(f"tree/{i // 20}/file{i}")
+				info.size = len(data)
+				archive.addfile(info, io.BytesIO(data))
+
+
+def _throughput(timing, size):
+	timing["mb_per_second"] = size / timing["best"] / (1 << 20)
+	return timing
+
+
+def download(env):
+	from strapon._download import download as fetch
+
+	_artifacts(env)
+	destination = env.path("download.bin")
+	def clean():
+		if os.path.exists(destination): os.remove(destination)
+
+	return {
+		"segmented": _throughput(measure(lambda : fetch(f"{env.serve()}/big.bin", destination),
+			rounds=3, setup=clean), SIZE),
+		"single_stream": _throughput(measure(lambda : fetch(f"{env.serve(ranges=False)}/big.bin",
+			destination), rounds=3, setup=clean), SIZE),
+	}
+
+
+def cached_fetch(env):
+	from strapon import WebInstaller
+	from strapon._artifact_cache import ArtifactCache
+
+	_artifacts(env)
+	installer = WebInstaller(f"{env.serve()}/big.bin", root="/")
+	cache = ArtifactCache(env.path("artifacts"))
+	destination = env.path("cached.bin")
+	installer.fetch(destination, cache=cache)
+	# A hit only costs a HEAD request and a link.
+	return {"hit": measure(lambda : installer.fetch(destination, cache=cache), number=20)}
+
+
+def download_extract(env):
+	from strapon._artifact_cache import ArtifactCache
+	from strapon._extract import extract_url
+
+	_artifacts(env)
+	url = f"{env.serve()}/tree.tar.gz"
+	size = os.path.getsize(env.path("www", "tree.tar.gz"))
+	def clean():
+		shutil.rmtree(env.path("artifacts-cold"), ignore_errors=True)
+		shutil.rmtree(env.path("extracted"), ignore_errors=True)
+
+	def run():
+		path = ArtifactCache(env.path("artifacts-cold")).fetch(url)
+		with tarfile.open(path) as archive:
+			archive.extractall(env.path("extracted"), filter="data")
+
+	# Unpacked while downloading, without the archive ever landing on disk.
+	streamed = lambda : extract_url(url, env.path("extracted"))
+	return {
+		"cold": _throughput(measure(run, rounds=3, setup=clean), size),
+		"streamed": _throughput(measure(streamed, rounds=3, setup=clean), size),
+	}
+
+
+def mirrors(env):
+	from strapon._mirrors import MirrorSelector
+	from strapon._download import download as fetch
+
+	_artifacts(env)
+	slow, fast, medium = env.serve(delay=0.2), env.serve(delay=0), env.serve(delay=0.05)
+	groups = {f"{slow}/": {"mirrors": [f"{slow}/", f"{medium}/", f"{fast}/"], "probe": "big.bin"}}
+	def selector():
+		if os.path.exists(env.path("mirrors.json")): os.remove(env.path("mirrors.json"))
+		return MirrorSelector(groups, env.path("mirrors.json"))
+
+	ranked = selector().candidates(f"{slow}/big.bin")
+	warm = selector()
+	warm.rewrite(f"{slow}/big.bin")
+
+	# The first mirror stops sending after 1MiB, the download should carry on
+	# from the next one once the stall timeout passes.
+	destination = env.path("failover.bin")
+	stalled = env.serve(stall_after=1 << 20)
+	def clean():
+		for path in (destination, f"{destination}.part", f"{destination}.part.json"):
+			if os.path.exists(path): os.remove(path)
+
+	failover = measure(lambda : fetch(f"{stalled}/big.bin", destination,
+		mirrors=[f"{fast}/big.bin"], stall_timeout=0.5), rounds=3, setup=clean)
+	return {
+		"picked_fastest": ranked[0] == f"{fast}/big.bin",
+		"cold_probe": measure(lambda : selector().rewrite(f"{slow}/big.bin"), rounds=3),
+		"warm_rewrite": measure(lambda : warm.rewrite(f"{slow}/big.bin"), number=1000),
+		"stalled_failover": _throughput(failover, SIZE),
+	}
+
+
+def prefetch(env, archives=24, size=512 << 10):
+	"""Download-ahead of archives the stub apt lists with --print-uris, from
+	a server adding 20ms per request, with one worker against the default."""
+	from strapon import SystemInstaller
+	from strapon._artifact_cache import ArtifactCache
+
+	pool = env.path("www", "pool")
+	os.makedirs(pool, exist_ok=True)
+	server = env.serve(delay=0.02)
+	with open(env.path("uris"), "wt") as listing:
+		for i in range(archives):
+			data = os.urandom(size)
+			with open(os.path.join(pool, f"p{i}_1.0_amd64.deb"), "wb") as file:
+				file.write(data)
+			listing.write(f"'{server}/pool/p{i}_1.0_amd64.deb' p{i}_1.0_amd64.deb {size} "
+				f"SHA256:{hashlib.sha256(data).hexdigest()}\n")
+
+	os.environ["STUB_APT_URIS"] = env.path("uris")
+	installer = SystemInstaller("apt", env.root)
+	placed = os.path.join(env.root, "var/cache/apt/archives")
+	def clean():
+		shutil.rmtree(placed, ignore_errors=True)
+		shutil.rmtree(env.path("prefetch-cache"), ignore_errors=True)
+		os.makedirs(placed)
+
+	packages = [f"p{i}" for i in range(archives)]
+	cold = lambda workers : lambda : installer._download(*packages,
+		cache=ArtifactCache(env.path("prefetch-cache")), workers=workers)
+	results = {
+		"serial": measure(cold(1), rounds=3, setup=clean),
+		"concurrent": measure(cold(8), rounds=3, setup=clean),
+		# Everything already placed, only the --print-uris query remains.
+		"warm": measure(cold(8), rounds=5),
+	}
+
+	os.environ.pop("STUB_APT_URIS")
+	return results
+
+
+def release_index(env, releases=2000):
+	"""Resolving versions from a synthetic nodejs style dist/index.json:
+	the first fetch, a revalidation past the TTL (one 304) and a load within
+	it (no requests), then queries against the sorted index."""
+	from strapon._releases import fetch_release_index
+
+	dist = env.path("www", "dist")
+	os.makedirs(dist, exist_ok=True)
+	with open(os.path.join(dist, "index.json"), "wt") as file:
+		json.dump([{"version": f"v{i // 100}.{i // 10 % 10}.{i % 10}", "date": "2020-01-01",
+			"files": ["linux-x64", "src"], "lts": f"Line{i // 100}" if i // 100 % 2 == 0 else False}
+			for i in reversed(range(releases))], file)
+
+	url = f"{env.serve()}/dist/index.json"
+	def clean():
+		shutil.rmtree(env.path("cache", "releases"), ignore_errors=True)
+
+	def requests(function):
+		before = env.requests()
+		function()
+		return env.requests() - before
+
+	cold = lambda : fetch_release_index(url)
+	revalidate = lambda : fetch_release_index(url, ttl=0)
+	index = cold()
+	return {
+		"cold": measure(cold, rounds=3, setup=clean),
+		"revalidate": measure(revalidate, rounds=5),
+		"cached": measure(cold, rounds=5),
+		"requests": {"revalidate": requests(revalidate), "cached": requests(cold)},
+		"resolve": {query.replace(" ", "_"): measure(lambda : index.resolve(query), number=1000)
+			for query in ("latest", "lts", "^12", "lts >=4 <9")},
+	}
+
+
+def delta(env, size=8 << 20):
+	"""Updating an installed artifact to a new version that overwrote,
+	inserted and dropped a few stretches, through its .zsync control file,
+	against downloading the new version outright."""
+	from strapon._delta import make_control, delta_update
+	from strapon._download import download as fetch
+
+	www = env.path("www")
+	os.makedirs(www, exist_ok=True)
+	old = bytearray(os.urandom(size))
+	new = bytearray(old)
+	new[size // 8:size // 8 + (128 << 10)] = os.urandom(128 << 10)
+	new[size // 2:size // 2] = os.urandom(64 << 10)
+	del new[size * 3 // 4:size * 3 // 4 + (32 << 10)]
+	with open(os.path.join(www, "app-2.bin"), "wb") as file:
+		file.write(new)
+	with open(os.path.join(www, "app-2.bin.zsync"), "wb") as file:
+		file.write(make_control(os.path.join(www, "app-2.bin"), "app-2.bin"))
+
+	url = f"{env.serve()}/app-2.bin"
+	installed = env.path("installed.bin")
+	def install_old():
+		with open(installed, "wb") as file:
+			file.write(old)
+
+	# NOTE: no minimum rate, so the matching itself gets timed even where
+	#       delta_update() would rather download the whole file.
+	reports = []
+	timing = measure(lambda : reports.append(delta_update(url, installed, minimum_rate=0)),
+		rounds=3, setup=install_old)
+	full = measure(lambda : fetch(url, installed), rounds=3, setup=install_old)
+	report = reports[-1].to_dict()
+	install_old()
+	return {
+		"delta": timing,
+		"full": full,
+		"bytes_fetched": report["fetched"],
+		"bytes_saved": report["saved"],
+		"requests": report["requests"],
+		"verified": report["fallback"] is None,
+		# Matching blocks costs CPU, a delta beats the full download on links
+		# slower than this.
+		"faster_below_mb_per_second": report["saved"] / timing["best"] / (1 << 20),
+		"falls_back_by_default": delta_update(url, installed).fallback is not None,
+	}
+
+
+BENCHMARKS = {
+	"download": download,
+	"cached_fetch": cached_fetch,
+	"download_extract": download_extract,
+	"mirrors": mirrors,
+	"prefetch": prefetch,
+	"release_index": release_index,
+	"delta": delta,
+}
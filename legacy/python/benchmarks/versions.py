@@ -0,0 +1,103 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""Per-check cost of os_version constraints as decorated packages grow.
+
+Run from legacy/python: `python benchmarks/versions.py`, or as part of
+the suite through benchmarks/run.py
+"""
+
+# external imports
+#...
+
+# internal imports
+#...
+
+# standard imports
+from time import perf_counter
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from strapon._host_facts import HostFacts
+from strapon._versions import compile_constraint, version_key
+
+
+
+# The kinds of constraints modules actually write, reused across packages.
+CONSTRAINTS = ("<=2", ">=18.04 <22", "focal", "^20", "jammy || focal",
+	"18.04 - 20.10", "!=19.10", ">=1:2.0~rc1", "~20.04", "<18 || >=22")
+
+
+def per_check(packages, rounds=5):
+	"""Best-of-rounds nanoseconds per matching_VERSION call, one per package."""
+	host = HostFacts(id="ubuntu", id_like="debian", version_id="20.04", version_codename="focal")
+	constraints = [CONSTRAINTS[i % len(CONSTRAINTS)] for i in range(packages)]
+
+	best = None
+	for _ in range(rounds):
+		start = perf_counter()
+		for constraint in constraints:
+			host.matching_VERSION(constraint)
+		elapsed = (perf_counter() - start) / packages
+		best = elapsed if best is None else min(best, elapsed)
+
+	return best * 1e9
+
+
+def bulk(versions, rounds=5):
+	"""Nanoseconds per version for Constraint.filter() and select_sorted()."""
+	constraint = compile_constraint(">=1.2 <1.8 || 3.x")
+	names = [f"{i // 100}.{i % 100}-{i % 7}" for i in range(versions)]
+	keys = sorted(map(version_key, names))
+
+	def measure(function):
+		best = None
+		for _ in range(rounds):
+			start = perf_counter()
+			function()
+			elapsed = (perf_counter() - start) / versions
+			best = elapsed if best is None else min(best, elapsed)
+		return best * 1e9
+
+	return measure(lambda : constraint.filter(names)), measure(lambda : constraint.select_sorted(keys))
+
+
+def constraints(env):
+	results = {f"ns_per_check_{n}": per_check(n) for n in (10, 1000, 100000)}
+	for versions in (1000, 100000):
+		results[f"ns_filter_{versions}"], results[f"ns_select_sorted_{versions}"] = bulk(versions)
+
+	return results
+
+
+BENCHMARKS = {
+	"constraints": constraints,
+}
+
+
+if __name__ == "__main__":
+	print("packages  ns/check")
+	for packages in (10, 100, 1000, 10000, 100000):
+		print(f"{packages:>8}  {per_check(packages):8.1f}")
+
+	print("\nversions  ns/filter  ns/select_sorted")
+	for versions in (1000, 10000, 100000):
+		print(f"{versions:>8}  {{:9.1f}}  {{:15.1f}}".format(*bulk(versions)))
@@ -29,21 +29,169 @@
 
 # standard imports
 from pathlib import Path
+import os, tempfile
+
+# Regions are blocks of lines fenced by these markers, so we can find and
+# rewrite what we added to a dotfile without touching the user's own lines.
+REGION_START = "###+{}+###"
+REGION_END = "###-{}-###"
+
+_chunk_size = 1 << 16
+
+
+def index_regions(filename):
+	"""Scans a file once, returning {name: [(start, end), ...]} byte offsets of
+	each region including its marker lines. Missing files have no regions,
+	overlapping or nested ones raise ValueError."""
+	regions, opened, last = {}, {}, (None, 0)
+	try:
+		file = open(filename, "rb")
+	except FileNotFoundError:
+		return regions
+
+	with file:
+		offset = 0
+		for line in file:
+			marker = line.strip()
+			if marker.startswith(b"###+") and marker.endswith(b"+###") and len(marker) > 8:
+				opened[marker[4:-4].decode()] = offset
+			elif marker.startswith(b"###-") and marker.endswith(b"-###") and len(marker) > 8:
+				name = marker[4:-4].decode()
+				# NOTE: an end marker without a start is the user's, leave it be.
+				if name in opened:
+					start = opened.pop(name)
+					# NOTE: regions end in file order, so any overlap shows
+					#       up against the one that ended last.
+					if start < last[1]:
+						raise ValueError(f"Regions '{last[0]}' and '{name}' overlap in '{filename}'.")
+					last = (name, offset + len(line))
+					regions.setdefault(name, []).append((start, last[1]))
+
+			offset += len(line)
+
+	return regions
+
+
+def _render(name, body):
+	if body and not body.endswith("\n"): body += "\n"
+	return f"{REGION_START.format(name)}\n{body}{REGION_END.format(name)}\n".encode()
+
+
+def _read_span(file, start, end):
+	file.seek(start)
+	return file.read(end - start)
+
+
+def _copy_span(source, destination, start, end):
+	source.seek(start)
+	remaining = end - start
+	while remaining > 0:
+		chunk = source.read(min(_chunk_size, remaining))
+		if not chunk: break
+		destination.write(chunk)
+		remaining -= len(chunk)
+
+
+def edit_regions(filename, operations):
+	"""Applies a batch of region operations in one pass over filename:
+
+	    ("add", name, body)      adds the region unless it's already there
+	    ("replace", name, body)  adds the region, or replaces its body
+	    ("remove", name)         removes every copy of the region
+
+	The file is only rewritten, through a temporary file and a rename, when
+	its content would change. Returns True when it was rewritten.
+	"""
+	regions = index_regions(filename)
+	edits, appended = {}, {}
+	for operation, name, *body in operations:
+		if operation == "add":
+			present = name in regions and edits.get(name, True) is not None
+			if not present and not name in appended: appended[name] = _render(name, body[0])
+		elif operation == "replace":
+			if name in regions: edits[name] = _render(name, body[0])
+			else: appended[name] = _render(name, body[0])
+		elif operation == "remove":
+			edits[name] = None
+			appended.pop(name, None)
+		else:
+			raise ValueError(f"Unknown region operation '{operation}'.")
+
+	# NOTE: collect (start, end, replacement) for every span we'd change, so
+	#       identical replacements never cost a write.
+	spans = []
+	if edits and regions:
+		with open(filename, "rb") as file:
+			for name, rendered in edits.items():
+				for i, (start, end) in enumerate(regions.get(name, ())):
+					replacement = rendered if i == 0 else None
+					if replacement is None or _read_span(file, start, end) != replacement:
+						spans.append((start, end, replacement))
+
+	if not spans and not appended:
+		return False
+
+	# NOTE: a symlinked dotfile keeps its link, the file it points to changes.
+	path = Path(os.path.realpath(filename))
+	descriptor, temporary = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+	try:
+		with os.fdopen(descriptor, "wb") as output:
+			size = 0
+			if not path.exists():
+				# NOTE: mkstemp() makes 0600 files, new dotfiles get the umask.
+				umask = os.umask(0); os.umask(umask)
+				os.chmod(temporary, 0o666 & ~umask)
+			else:
+				# Root editing a user's rc file mustn't leave it root's.
+				status = os.stat(path)
+				if (status.st_uid, status.st_gid) != (os.geteuid(), os.getegid()):
+					try:
+						os.chown(temporary, status.st_uid, status.st_gid)
+					except PermissionError:
+						# NOTE: only root can give files away.
+						pass
+				os.chmod(temporary, status.st_mode & 0o7777)
+				with open(path, "rb") as source:
+					size = os.fstat(source.fileno()).st_size
+					position = 0
+					for start, end, replacement in sorted(spans, key=lambda s: s[0]):
+						_copy_span(source, output, position, start)
+						if replacement is not None: output.write(replacement)
+						position = end
+					_copy_span(source, output, position, size)
+
+					if appended and size:
+						source.seek(size - 1)
+						if source.read(1) != b"\n": output.write(b"\n")
+
+			for rendered in appended.values():
+				output.write(rendered)
+
+			output.flush()
+			os.fsync(output.fileno())
+
+		os.replace(temporary, path)
+	except BaseException:
+		os.unlink(temporary)
+		raise
+
+	return True
+
 
 def has_region(filename, name):
-	# NOTE: weak validation, but good enough for now.
-	has_start_flag = False
-	with open(filename, 'rt') as file:
-		while True:
-			line = file.readline()
-			if line.length == 0: return False
-			elif line == f"###+{name}+###": has_start_flag=True
-			elif line == f"###-{name}-###" and has_start_flag: return True
+	return name in index_regions(filename)
+
 
 def add_region(filename, region_name, region):
-	if has_region(region_name): return False
-	with open(filename, 'at') as file:
-		file.write(f"###+{region_name}+###{region}###-{region_name}-###\n")
+	return edit_regions(filename, [("add", region_name, region)])
+
+
+def replace_region(filename, region_name, region):
+	return edit_regions(filename, [("replace", region_name, region)])
+
+
+def remove_region(filename, region_name):
+	return edit_regions(filename, [("remove", region_name)])
 
 
 if __name__ == "__main__":
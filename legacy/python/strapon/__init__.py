@@ -21,18 +21,25 @@
 
 
 # external imports
-import semver
-from sh import Command
-from dpcontracts import require, types
+# NOTE: sh and dpcontracts come through _runtime, which defers or (in
+#       production mode) skips them entirely.
 
 # internal imports
+from ._runtime import require, types, Command
 from ._large_functions import *
+from ._index_state import index_once, invalidate_index
+from ._host_facts import get_host_facts, get_target_root, set_target_root
+from ._dpkg_status import plan_changes
+from ._trace import span
+from ._plan import compile_plan
+from . import _trace
 
 # standard imports
 from importlib import import_module
 from argparse import ArgumentParser, REMAINDER as ARG_REMAINDER
 from urllib.parse import urlparse
-import os, sys, shlex, platform, inspect
+from types import MappingProxyType
+import os, sys
 
 
 
@@ -50,52 +57,110 @@ __all__ = [
 	"matching_OS",
 	"matching_CPU",
 	"matching_VERSION",
-	"update_package_repositories",
-	"register_system_repository",
+	"matching_ALL",
+	"get_host_facts",
+	"get_target_root",
+	"set_target_root",
 	"Installer",
+	"SystemInstaller",
+	"WebInstaller",
+	"GitInstaller",
+	"strap_on",
+	"strapon",
 	"singleton_CLI",
 ]
 
 
 
 #CONSTANTS
-try:
-	OS_NAME = os.environ["NAME"]
-	OS_VERSION = os.environ["VERSION"]
-	OS_VERSION_ID = os.environ["VERSION_ID"]
-	OS_VERSION_CODENAME = os.environ["VERSION_CODENAME"]
-	OS_ID = os.environ["ID"]
-	OS_IDLIKE = os.environ["ID_LIKE"].split(" ")
-	OS_UBUNTU_CODENAME = os.environ["UBUNTU_CODENAME"]
-except(Exception):
-	# if we didn't get the variables exported via the shell just directly
-	# read them out of the os-release file (in case we wind up being run)
-	# by the user and not by the shell.
-	for line in open("/etc/os-release", "r"):
-		assignment_trigger = line.index("=", 1)
-		assignment = line[:assignment_trigger]
-		# use shlex to parse string since it implements basic posix shell
-		value = shlex.split(line[assignment_trigger+1:])[0]
-		globals()[f"OS_{assignment}"] = value
-
-	# Special transformations
-	if "OS_ID_LIKE" in globals():
-		global OS_IDLIKE
-		OS_IDLIKE = OS_ID_LIKE.split(" ")
-		del OS_ID_LIKE
+# NOTE: the OS_* constants are resolved on first access from the host facts
+#       snapshot (see _host_facts.py) instead of at import time.
+_os_constants = {
+	"OS_NAME": lambda facts : facts.name,
+	"OS_VERSION": lambda facts : facts.version,
+	"OS_VERSION_ID": lambda facts : facts.version_id,
+	"OS_VERSION_CODENAME": lambda facts : facts.version_codename,
+	"OS_ID": lambda facts : facts.id,
+	"OS_IDLIKE": lambda facts : list(facts.id_like),
+	"OS_UBUNTU_CODENAME": lambda facts : facts.ubuntu_codename,
+}
+
+def __getattr__(name):
+	if name in _os_constants:
+		return _os_constants[name](get_host_facts())
+
+	raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+# NOTE: decorators run as soon as a module is imported, long before
+#       singleton_CLI parses --trace; $STRAPON_TRACE covers them too.
+_trace.trace_from_environment()
 
 
 _nos = (type(None), str)
-_os_id_list = OS_IDLIKE.insert(0, OS_ID) if "OS_IDLIKE" in globals() else [OS_ID]
 
 
+class decorator():
+	"""Base Decorator class for type checking features."""
+	# NOTE: add arguments to the init for decorator capture
+	def __init__(self, *args, **kwargs): pass
+	def __call__(self, f): pass
+
+class storage_decorator(decorator):
+	def __init__(self, **kwargs): self.storage = kwargs
+	def __call__(self, f):
+		with span(f"@{type(self).__name__}", "decorator", function=getattr(f, "__qualname__", None)):
+			if not hasattr(f, "meta"):
+				f.meta = {}
+
+			for key, value in self.storage.items():
+				if not key in f.meta:
+					f.meta[key] = value
+				else:
+					if isinstance(f.meta[key], list):
+						# NOTE: decorators apply bottom up, prepend to keep source order.
+						f.meta[key][:0] = value if isinstance(value, list) else [value]
+					else:
+						f.meta[key] = value
+
+			return f
+
+# Maps "<file>-<group>" to the OS id currently holding the group.
+_groups = {}
+# Frames callerfile() looks past: ours, and contract check wrappers.
+_internal_files = {__file__, getattr(sys.modules.get("dpcontracts"), "__file__", None)}
+
+class key_storage_decorator(storage_decorator):
+	key=None
+	# When set, values are accumulated into a list instead of replaced.
+	multiple=False
+
+	@types(os_name=_nos, os_version=_nos, cpu=_nos)
+	def __init__(self, value, group=None, os_name=None, os_version=None, cpu=None):
+		self.storage = {}
+		with span(f"{type(self).__name__}()", "decorator",
+				value=value if isinstance(value, str) else type(value).__name__):
+			if group is not None:
+				group = f"{callerfile()}-{group}"
+				facts = get_host_facts()
+				if group in _groups and facts.rank(os_name) > facts.rank(_groups[group]):
+					return
+				_groups[group] = os_name
+
+			def function(): self.storage = {self.key: [value] if self.multiple else value}
+			os_dependent_action(function, os_name=os_name, os_version=os_version, cpu=cpu)
+
+	def __call__(self, f):
+		return storage_decorator.__call__(self, f)
+
 class Installer():
 	"""A base class for installer inheritance and standards"""
 	# Called the metadta preprocessors because they execute before the
 	# final action is made. Not because they happen on instantiation or
 	# before the main UI.
-	metadata_preprocessors = {}
-	metadata = {}
+	# NOTE: read-only, every installer instance sets up its own.
+	metadata_preprocessors = MappingProxyType({})
+	metadata = MappingProxyType({})
 	def __init__(self): raise NotImplementedError()
 
 	# Must implement all of the following to be a valid installer class
@@ -103,27 +168,68 @@ class Installer():
 	# _remove()
 	# _purge()
 	# _index()
+	# and optionally
+	# _download(), fetching what _install() needs ahead of time
 
 	def exec(self, namespace):
-		for key, function in metadata_preprocessors.items():
-			function(self.metadata[key])
-
-		if self.metadata["index_before_action"]:
-			self._index()
+		# An empty plan means everything is already in the requested state,
+		# so there's no need to register, index or call the native tool.
+		changes = self.plan(namespace.action)
+		if getattr(namespace, "plan", False):
+			if changes is None:
+				print(f"{namespace.action}: (can't be planned ahead)")
+			for change in changes or ():
+				print(f"{namespace.action}: {change}")
+			if changes == []:
+				print(f"{namespace.action}: nothing to do")
+			return changes
+		elif changes == []:
+			return changes
+
+		for key, function in self.metadata_preprocessors.items():
+			with span(f"preprocess {key}", "phase"):
+				function()
+
+		if self.metadata.get("index_before_action", False):
+			# NOTE: skipped when the index is still fresh, see _index_state.py
+			with span("index", "phase") as phase:
+				phase.set(refreshed=index_once(self))
+
+		# NOTE: downloads happen here, outside of the native installer's
+		#       lock, so the action only holds it to unpack and configure.
+		if namespace.action == "install" and getattr(self, "_download", None) is not None:
+			with span("download", "phase") as phase:
+				phase.set(archives=len(self._download(*(changes or ()))))
 
 		action = getattr(self, f"_{namespace.action}")
-		action()
-
-class SystemInstaller():
-	def __init__(self, name):
+		with span(namespace.action, "phase", packages=len(changes or ())):
+			action(*(changes or ()))
+		return changes
+
+	# Returns what the action would change, or None if that can't be known
+	# before running it.
+	def plan(self, action):
+		return None
+
+class SystemInstaller(Installer):
+	# root is the filesystem to provision, defaulting to the target root
+	# (see set_target_root()) which is usually just "/".
+	def __init__(self, name, root=None):
 		#self._native = import_module(name, package="sh")
-		self._native = Command(name)
+		self.name = name
+		self.root = os.path.abspath(root) if root else get_target_root()
+		self._native = Command(name, privileged=True).bake(*get_installer_root_options(name, self.root))
+		self._package_list = []
 		map_known_installer(name, self)
 		self.registrar = get_installer_repository_registrar(self)
 
+		# NOTE: shadow the class level dictionaries, otherwise every installer
+		#       instance shares (and clobbers) the same handlers and metadata.
+		self.metadata_preprocessors = {}
+		self.metadata = {}
+
 		# Initialize links to metadata handlers
 		self.metadata_preprocessors["repositories"] = self._meta_repository_handle
-		self.metadata_preprocessors["packages"] = self._meta_package_handle
 
 		# Initialize the metadata structures to make use of the
 		# storage_decorator special features.
@@ -140,45 +246,59 @@ class SystemInstaller():
 
 
 	def __eq__(self, i2):
-		return isinstance(i2, SystemInstaller) and self._native == i2._native
+		return isinstance(i2, SystemInstaller) and (self.name, self.root) == (i2.name, i2.root)
+
+	def __hash__(self):
+		return hash((self.name, self.root))
 
 	def _meta_repository_handle(self):
-		if self.registrar.is_multiplexer:
+		if not self.metadata["repositories"]:
+			return
+		elif self.registrar is None:
+			raise RuntimeError(f"No repository registrar is known for '{self.name}'.")
+		elif self.registrar.is_multiplexer:
 			self.registrar(*self.metadata["repositories"])
 		else:
 			for repository in self.metadata["repositories"]:
-				self.register_repository(repository)
+				self.registrar(repository)
+
+	# Only the staged packages that aren't already in the requested state,
+	# according to the native package database when we know how to read it.
+	def plan(self, action):
+		packages = list(dict.fromkeys(self.metadata["packages"] + self._package_list))
+		status = get_installer_status(self.name, self.root)
+		if status is None:
+			return packages
 
-	def _meta_package_handle(self):
-		self._install = self._install.bake(*self.metadata["packages"])
-		self._remove = self._remove.bake(*self.metadata["packages"])
-		self._purge = self._purge.bake(*self.metadata["packages"])
-		self._package_list += self.metadata["packages"]
+		return plan_changes(status, action, packages)
 
-	@staticfunction
-	def default():
+	@staticmethod
+	def default(root=None):
 		name = get_default_system_installer()
-		return SystemInstaller(name)
+		return SystemInstaller(name, root)
 
 	# Called when installing a system managed package. If the package is
 	# unlikely to be held in the OS native package repositories, use this
 	# to add the best known package repository for the app.
 	@types(repository=str)
 	def add_repository(self, repository):
-		self.registrar(repository)
+		with span("register", "phase", repository=repository):
+			self.registrar(repository)
 		# Make sure if the flag was unset by the main manager, we
 		# reset this flag so the packages which the repository implements
 		# can be located upon install.
 		self.metadata["index_before_action"] = True
+		# NOTE: multiplexed registrars keep the index fresh themselves.
+		if not self.registrar.is_multiplexer:
+			invalidate_index(self)
 
 	@types(package=str)
 	def add_package(self, package):
-		self._install = self._install.bake(package)
-		self._remove = self._remove.bake(package)
-		self._purge = self._purge.bake(package)
+		self._package_list.append(package)
 
 	class register_repository(key_storage_decorator):
 		key="repositories"
+		multiple=True
 
 		@types(package_repository=str)
 		def __init__(self, package_repository, **kwargs):
@@ -186,24 +306,26 @@ class SystemInstaller():
 
 	class stage_package(key_storage_decorator):
 		key="packages"
+		multiple=True
 
 		@types(package=str)
 		def __init__(self, package, **kwargs):
-			if "os_name" in kwargs: self.os_name = kwargs["os_name"]
+			self.os_name = kwargs.get("os_name")
 			key_storage_decorator.__init__(self, package, **kwargs)
 
 		def __call__(self, f):
 			if hasattr(f, "os_name") and hasattr(f, "fallback_package"):
-				if _os_id_list.index(f.os_name) <= _os_id_list.index(self.os_name):
+				facts = get_host_facts()
+				if facts.rank(f.os_name) <= facts.rank(self.os_name):
 					del f.os_name
 					del f.fallback_package
-					return
+					return f
 				else:
 					self.storage["packages"] = f.fallback_package
 					del f.os_name
 					del f.fallback_package
 
-			storage_decorator.__call__(self, f)
+			return storage_decorator.__call__(self, f)
 
 	class fallback_package(stage_package):
 		key="packages"
@@ -212,143 +334,226 @@ class SystemInstaller():
 		# accommodate for progenetor OS fallback, and OEM precedence
 		def __call__(self, f):
 			if hasattr(f, "os_name"):
-				if _os_id_list.index(f.os_name) <= _os_id_list.index(self.os_name):
-					self.storage.pop("packages")
-					return
+				facts = get_host_facts()
+				if facts.rank(f.os_name) <= facts.rank(self.os_name):
+					self.storage.pop("packages", None)
+					return f
 			else:
 				f.os_name = self.os_name
 
-			f.fallback_package = self.storage.pop("packages")
+			f.fallback_package = self.storage.pop("packages", None)
+			return f
 
 
 class WebInstaller(Installer):
-	def __init__(self, resource, type=None):
-		url = urlparse(resource)
+	def __init__(self, resource, type=None, root=None):
+		self.resource = resource
+		self.url = urlparse(resource)
+		self.type = type
+		self.root = os.path.abspath(root) if root else get_target_root()
+		self.metadata_preprocessors = {}
+		self.metadata = {}
+
+	# A WebInstaller for the file matching the glob asset in the release of
+	# a project's release index matching query, eg.
+	# WebInstaller.from_release("https://nodejs.org/dist/index.json", "lts ^18",
+	#     "*-linux-x64.tar.xz"). See _releases.py for queries and formats.
+	@classmethod
+	def from_release(cls, index, query, asset, type=None, root=None, **kwargs):
+		from ._releases import fetch_release_index
+
+		release = fetch_release_index(index, **kwargs).resolve(query)
+		installer = cls(release.asset(asset), type, root)
+		installer.release = release
+		return installer
+
+	# Absolute destinations are inside the target root.
+	def target_path(self, destination):
+		return os.path.join(self.root, os.path.abspath(destination).lstrip("/"))
+
+	# Places the resource at destination through the artifact cache, so a
+	# repeat install is a reflink/hardlink instead of a download. Configured
+	# mirrors are tried fastest first. mode is destination's permissions,
+	# by default executable for AppImages and the cache's read only copy
+	# otherwise. Without a destination it only makes sure the resource is
+	# cached, returning its path. See _download.py, _mirrors.py and
+	# _artifact_cache.py for options.
+	def fetch(self, destination=None, cache=None, mode=None, **kwargs):
+		# Pulls in http.client, ssl and friends, so only when downloading.
+		from ._artifact_cache import ArtifactCache, link_file
+		from ._mirrors import get_mirror_selector
+
+		if cache is None: cache = ArtifactCache()
+		selector = get_mirror_selector()
+		url = selector.canonical(self.resource)
+		with span("fetch", "phase", url=self.resource) as phase:
+			mirrors = selector.candidates(url)
+			path = cache.fetch(url, mirrors=mirrors if mirrors != [url] else None,
+				failed=selector.demote, **kwargs)
+			if destination is None:
+				return path
+			if mode is None and (self.type == "AppImage" or self.url.path.endswith(".AppImage")):
+				mode = 0o755
+			method = link_file(path, self.target_path(destination), mode=mode)
+			phase.set(method=method)
+			return method
+
+	# Downloads and unpacks the resource at destination in one pass, the
+	# archive itself never touching the disk. type is the format, eg.
+	# "tar.xz", "zip" or "AppImage", detected from the first bytes when None.
+	# See _extract.py
+	def unpack(self, destination, **kwargs):
+		from ._extract import extract_url
+		from ._mirrors import get_mirror_selector
+
+		selector = get_mirror_selector()
+		url = selector.canonical(self.resource)
+		with span("unpack", "phase", url=self.resource) as phase:
+			first, *mirrors = selector.candidates(url)
+			container = extract_url(first, self.target_path(destination), self.type,
+				mirrors=mirrors, failed=selector.demote, **kwargs)
+			phase.set(container=container)
+			return container
+
+
+	# Brings the copy of the resource installed at destination up to date,
+	# fetching only the blocks that changed when a zsync control file (the
+	# AppImage's own update information, or <resource>.zsync) describes it,
+	# and the whole file otherwise. Returns a DeltaReport, see _delta.py
+	def update(self, destination, controls=None, **kwargs):
+		from ._delta import delta_update
+		from ._mirrors import get_mirror_selector
+
+		selector = get_mirror_selector()
+		url = selector.canonical(self.resource)
+		with span("update", "phase", url=self.resource) as phase:
+			first, *mirrors = selector.candidates(url)
+			report = delta_update(first, self.target_path(destination), controls,
+				mirrors=mirrors, failed=selector.demote, **kwargs)
+			phase.set(fetched=report.fetched, saved=report.saved, fallback=report.fallback)
+			return report
 
 
 class GitInstaller(Installer):
 	def __init__(self, repo, branch, build_system=None):
-		pass
+		self.repo = repo
+		self.branch = branch
+		self.build_system = build_system
+		self._mirror = None
+		self.metadata_preprocessors = {}
+		self.metadata = {}
 
+	@property
+	def mirror(self):
+		if self._mirror is None:
+			from ._git_mirror import GitMirror
+			self._mirror = GitMirror(self.repo)
 
-class decorator():
-	"""Base Decorator class for type checking features."""
-	# NOTE: add arguments to the init for decorator capture
-	def __init__(self, *args, **kwargs): pass
-	def __call__(self, f): pass
+		return self._mirror
 
-class storage_decorator(decorator):
-	def __init__(self, **kwargs): self.storage = kwargs
-	def __call__(self, f):
-		if not hasattr(f, "meta"):
-			f.meta = {}
+	# Where the source format is checked out and built.
+	@property
+	def tree(self):
+		return os.path.join(get_cache_directory("src"), os.path.basename(self.mirror.path)[:-4])
 
-		for key, value in self.storage.items():
-			if not key in f.meta:
-				f.meta[key] = value
-			else:
-				if isinstance(f.meta[key], list):
-					f.meta[key].append(value)
-				else:
-					f.meta[key] = value
+	# mode is one of "mirror" (default, near free on repeat builds), or
+	# "shallow"/"blobless" for one-off builds. See _git_mirror.py
+	def fetch(self, destination, mode="mirror", depth=1):
+		return self.mirror.checkout(destination, self.branch, mode=mode, depth=depth)
 
-			return f
+	# Configures (only when it's inputs changed), builds with a jobserver
+	# sized to the host, then installs. See _build.py
+	def build(self, tree, prefix=None, until="install"):
+		from ._build import BuildPipeline
 
-class key_storage_decorator(storage_decorator):
-	key=None
+		return BuildPipeline(tree, self.build_system, prefix=prefix).run(until)
 
-	@types(os_name=_nos, os_version=_nos, cpu=_nos)
-	def __init__(self, value, **kwargs):
-		global groups
-		if group is not None:
-			group = f"{callerfile()}-{group}"
-			if group in groups:
-				if groups.index(kwargs["os_name"]) > groups.index(groups[group]):
-					return
-				else:
-					groups[group] = kwargs["os_name"]
-			else:
-				groups[group] = kwargs["os_name"]
+	def _install(self):
+		self.build(self.fetch(self.tree))
 
-		function = lambda : self.storage = {self.key: value}
-		os_dependent_action(function, **kwargs)
-
-	def __call__(self, f):
-		storage_decorator.__call__(self, f)
 
 class strap_on(key_storage_decorator):
 	key="installer"
 
-	@require("'installer' must be a type of 'Installer' class.",
-		lambda args: isinstance(args.installer, type) and Installer in args.installer.__mro__)
+	@require("'installer' must be an 'Installer' or a type of 'Installer' class.",
+		lambda args: isinstance(args.installer_class, Installer) or
+			(isinstance(args.installer_class, type) and Installer in args.installer_class.__mro__))
 	@types(default=bool)
 	def __init__(self, installer_class, *args, default=False, **kwargs):
 		installer = None
 
 		depconf = dictionary_extract(kwargs, ("group", "os_name", "os_version", "cpu"))
 
-		if default:
-			if hasattr(installer_class, "default"):
-				installer = installer_class.default()
+		with span("installer", "decorator", installer=getattr(installer_class, "__name__",
+				type(installer_class).__name__)):
+			if isinstance(installer_class, Installer):
+				installer = installer_class
+			elif default:
+				if hasattr(installer_class, "default"):
+					installer = installer_class.default()
+				else:
+					raise TypeError(f"'{installer_class.__name__}' has no default installer.")
 			else:
-				pass # TODO: throw error no default method for this class
-		else:
-			installer_class(*args, **kwargs)
+				installer = installer_class(*args, **kwargs)
 
 
 		key_storage_decorator.__init__(self, installer, **depconf)
 
 	def __call__(self, f):
+		if not "installer" in self.storage or "installer" in getattr(f, "meta", {}):
+			return f
+
 		key_storage_decorator.__call__(self, f)
+		target = self.storage["installer"]
+		target.metadata.update(f.meta)
 
-		if "installer" in self.storage and not "installer" in f.meta:
-			target = self.storage["installer"]
-			target.metadata = f.meta
-			return lambda *args, **kwargs : f(target, *args, **kwargs)
-		else:
-			return f
+		def strapped(*args, **kwargs): return f(target, *args, **kwargs)
+		# Exposed so batch tooling can read what was staged without running f.
+		strapped.installer = target
+		strapped.meta = f.meta
+		# Frozen and cacheable, see _plan.py
+		strapped.plan = compile_plan(strapped, f.__module__.rpartition(".")[2], f.__name__)
+		return strapped
+
+# Matches the spelling used throughout the installer modules.
+strapon = strap_on
 
 @require("'targets' must be strings.", lambda args : all(isinstance(v, str) for v in args.targets))
 def matching_OS(*targets):
-	for id in target_list:
-		if id in _os_id_list:
-			return True;
-
-	return False;
+	return get_host_facts().matching_OS(*targets)
 
 @types()
 def matching_CPU(*cpu_arch_list):
-	return platform.processor() in cpu_arch_list
+	return get_host_facts().matching_CPU(*cpu_arch_list)
 
 def matching_VERSION(*version_list):
 	# NOTE: parse cannonical and version codenames together
-	pass
+	return get_host_facts().matching_VERSION(*version_list)
 
 def matching_ALL(**kwargs):
-	return os_dependent_action(lambda : True, **kwargs)
+	return get_host_facts().matching_ALL(**kwargs)
 
 
 def os_dependent_action(action, os_name=None, os_version=None, cpu=None):
-	matches = (True, True, True)
-
-	if os_name is not None: matches[0] = matching_OS(os_name)
-	if os_version is not None: matches[1] = matching_VERSION(os_version)
-	if cpu is not None: matches[2] = matching_CPU(cpu)
-
-	if all(matches):
+	if matching_ALL(os_name=os_name, os_version=os_version, cpu=cpu):
 		action()
 
 def dictionary_extract(d, keys):
 	newd = {}
 	for key in keys:
-		newd[key] = d.pop(key)
+		if key in d: newd[key] = d.pop(key)
 
 	return newd
 
+# The file of the first frame outside of strapon and its contract checks,
+# ie. the module applying a decorator. Walks frames directly; inspect.stack()
+# would read source context for the entire stack on every call.
 def callerfile():
-	frame = inspect.stack()[1]
-	filename = frame[0].f_code.co_filename
-	return filename
+	frame = sys._getframe(1)
+	while frame is not None and frame.f_code.co_filename in _internal_files:
+		frame = frame.f_back
+
+	return frame.f_code.co_filename if frame is not None else None
 
 def add_installer_cli_stub(parser):
 	subparsers = parser.add_subparsers(
@@ -357,16 +562,21 @@ def add_installer_cli_stub(parser):
 		dest="action",
 		required=True,
 	)
-	install = subparsers.add_parser("install")
-	remove = subparsers.add_parser("remove")
-	purge = subparsers.add_parser("purge")
+	for action in ("install", "remove", "purge"):
+		subparsers.add_parser(action).add_argument("--plan", action="store_true",
+			help="Only show what would change")
 
 def singleton_CLI(file, standalone_fn=None, system_fn=None, source_fn=None):
 	parser = ArgumentParser(
-		name=f"strapon.{os.path.basename(file)[:-3]}",
+		prog=f"strapon.{os.path.basename(file)[:-3]}",
 		description="A bundled package from the yadm dotfiles host.",
 	)
 
+	parser.add_argument("--trace", metavar="FILE", default=None,
+		help="Write a Chrome trace of every phase to FILE, and summarize it")
+	parser.add_argument("--progress", action="store_true",
+		help="Show what package managers are doing as they go")
+
 	subparsers = parser.add_subparsers(
 		title="format",
 		description="package installation format options",
@@ -390,9 +600,14 @@ def singleton_CLI(file, standalone_fn=None, system_fn=None, source_fn=None):
 		add_installer_cli_stub(source_parser)
 
 	args = parser.parse_args()
+	if args.trace is not None:
+		_trace.trace_to(args.trace)
+	if args.progress:
+		from ._progress import subscribe, ProgressPrinter
+		subscribe(ProgressPrinter())
 
-	target = local()[f"{args.format}_fn"]
+	target = locals()[f"{args.format}_fn"]
 	if target is not None:
 		target(args)
 	else:
-		raise f"Unknown command '{args.format}'."
+		raise ValueError(f"Unknown command '{args.format}'.")
@@ -24,11 +24,121 @@
 #...
 
 # internal imports
-#...
+from ._manifest import load_manifest
 
 # standard imports
-#...
+from importlib import import_module
+from argparse import ArgumentParser
+
 
 
 # MAIN CODE
-# TODO: use dynamic import to import all the installers from here programatically.
+# NOTE: modules are only imported once we know which one was asked for, the
+#       manifest (see _manifest.py) is enough to build the whole CLI.
+manifest = load_manifest()
+
+parser = ArgumentParser(
+	prog="strapon",
+	description="A bundled package manager from the yadm dotfiles host.",
+)
+
+parser.add_argument("--trace", metavar="FILE", default=None,
+	help="Write a Chrome trace of every phase to FILE, and summarize it")
+parser.add_argument("--progress", action="store_true",
+	help="Show what package managers are doing as they go")
+
+subparsers = parser.add_subparsers(dest="command", required=True)
+
+subparsers.add_parser("list", help="List the available modules and their formats")
+
+batch_parser = subparsers.add_parser("batch",
+	help="Merge the system format of many modules into one native transaction")
+batch_parser.add_argument("action", choices=("install", "remove", "purge"))
+batch_parser.add_argument("modules", nargs="+", metavar="module[:format]",
+	help="format defaults to system, standalone and source formats run alongside it")
+batch_parser.add_argument("-j", "--jobs", type=int, default=None,
+	help="Steps allowed to run at once")
+batch_parser.add_argument("--plan", action="store_true",
+	help="Only print what would change, and which module it came from")
+batch_parser.add_argument("--root", action="append", default=[], metavar="ROOT",
+	help="Provision this root filesystem instead of the host, may be repeated")
+batch_parser.add_argument("-P", "--processes", type=int, default=None,
+	help="Roots provisioned at once (defaults to one per core)")
+
+cache_parser = subparsers.add_parser("cache", help="Inspect the downloaded artifact cache")
+cache_subparsers = cache_parser.add_subparsers(dest="cache_command", required=True)
+cache_subparsers.add_parser("stats", help="Show the cache size and entry counts")
+prune_parser = cache_subparsers.add_parser("prune",
+	help="Evict old and least recently used artifacts")
+prune_parser.add_argument("--max-size", type=int, default=None, help="in bytes")
+prune_parser.add_argument("--max-age", type=float, default=None, help="in seconds")
+
+for name, description in manifest.items():
+	if not description["formats"]:
+		continue
+
+	module_parser = subparsers.add_parser(name, help=", ".join(description["formats"]))
+	format_subparsers = module_parser.add_subparsers(dest="format", required=True)
+	for format in description["formats"]:
+		format_parser = format_subparsers.add_parser(format)
+		format_parser.add_argument("action", choices=("install", "remove", "purge"))
+		format_parser.add_argument("--plan", action="store_true",
+			help="Only show what would change")
+		format_parser.add_argument("--root", default=None,
+			help="Act on this root filesystem instead of the host")
+
+args = parser.parse_args()
+if args.trace is not None:
+	from ._trace import trace_to
+	trace_to(args.trace)
+if args.progress:
+	from ._progress import subscribe, ProgressPrinter
+	subscribe(ProgressPrinter())
+
+if args.command == "list":
+	for name, description in manifest.items():
+		packages = ", ".join(p["name"] for p in description["packages"])
+		print(f"{name}: {', '.join(description['formats']) or '(nothing implemented)'}"
+			+ (f" [{packages}]" if packages else ""))
+
+elif args.command == "batch" and args.root:
+	from ._multiroot import provision_roots
+
+	failed = 0
+	for result in provision_roots(args.root, args.action, args.modules,
+			processes=args.processes, jobs=args.jobs, plan_only=args.plan, progress=args.progress):
+		print(f"== {result.root}")
+		if result.report: print(result.report)
+		if result.error is not None:
+			print(f"failed: {result.error}")
+			failed += 1
+
+	if failed:
+		raise SystemExit(f"{failed} of {len(args.root)} roots failed.")
+
+elif args.command == "batch":
+	from ._batch import plan_modules
+
+	plan = plan_modules(args.modules)
+	print(plan.report(args.action))
+	if not args.plan:
+		plan.exec(args.action, workers=args.jobs)
+
+elif args.command == "cache":
+	from ._artifact_cache import ArtifactCache
+
+	cache = ArtifactCache()
+	if args.cache_command == "stats":
+		for key, value in cache.stats().items():
+			print(f"{key}: {value}")
+	elif args.cache_command == "prune":
+		removed = cache.prune(max_size=args.max_size, max_age=args.max_age)
+		print(f"removed {len(removed)} artifacts")
+
+else:
+	if args.root is not None:
+		from ._host_facts import set_target_root
+		set_target_root(args.root)
+
+	module = import_module(f".{args.command}", package=__package__)
+	getattr(module, args.format)(args)
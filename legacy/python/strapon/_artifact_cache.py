@@ -0,0 +1,319 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._large_functions import get_cache_directory
+from ._download import ConnectionPool, DownloadError, probe_first, download
+
+# standard imports
+from contextlib import contextmanager
+import os, json, stat, time, fcntl, shutil, hashlib
+
+
+
+__all__ = [
+	"ArtifactCache",
+	"link_file",
+	"sha256_file",
+]
+
+
+DEFAULT_MAX_SIZE = 10 << 30
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+# Seconds after being handed out that an object counts as in use, so a
+# prune in another process can't remove it before it's been placed.
+IN_USE_WINDOW = 10 * 60
+# linux/fs.h FICLONE, shares extents on btrfs/xfs instead of copying them.
+_FICLONE = 0x40049409
+
+
+def sha256_file(path):
+	digest = hashlib.sha256()
+	with open(path, "rb") as file:
+		for chunk in iter(lambda : file.read(1 << 20), b""):
+			digest.update(chunk)
+
+	return digest.hexdigest()
+
+
+def link_file(source, destination, hardlink=True, mode=None):
+	"""Places source at destination as a reflink, hardlink or (last resort)
+	copy, replacing whatever was there atomically. Returns the method used.
+
+	mode sets destination's permission bits, source's are kept when None.
+	Destination is only a hardlink when it can share source's inode as is:
+	same mode and owner. Without hardlink it's always a file of its own,
+	for when it mustn't share an inode with source, eg. across a privilege
+	boundary.
+	"""
+	temporary = f"{destination}.{os.getpid()}.link"
+	method = None
+
+	if hardlink:
+		status = os.stat(source)
+		hardlink = status.st_uid == os.geteuid() and \
+			(mode is None or mode == stat.S_IMODE(status.st_mode))
+
+	try:
+		with open(source, "rb") as src, open(temporary, "wb") as dst:
+			fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+		method = "reflink"
+	except OSError:
+		try:
+			os.remove(temporary)
+		except FileNotFoundError:
+			pass
+
+	if method is None and hardlink:
+		try:
+			os.link(source, temporary)
+			method = "hardlink"
+		except OSError:
+			pass
+
+	if method is None:
+		shutil.copyfile(source, temporary)
+		method = "copy"
+
+	if method != "hardlink":
+		if mode is not None:
+			os.chmod(temporary, mode)
+		else:
+			shutil.copymode(source, temporary)
+
+	os.replace(temporary, destination)
+	return method
+
+
+class ArtifactCache():
+	"""Content addressed store for WebInstaller downloads.
+
+	<root>/objects/<sha256>  the artifacts themselves
+	<root>/index.json        "<url> <validator>" -> sha256, and per object
+	                         size and last use for LRU eviction
+	<root>/lock              flock guarding index.json between processes
+	"""
+
+	def __init__(self, root=None, max_size=None, max_age=None):
+		if root is None: root = get_cache_directory("artifacts")
+		if max_size is None:
+			max_size = int(os.environ.get("STRAPON_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE))
+		if max_age is None:
+			max_age = float(os.environ.get("STRAPON_CACHE_MAX_AGE", DEFAULT_MAX_AGE))
+
+		self.root = root
+		self.max_size = max_size
+		self.max_age = max_age
+		self.objects = os.path.join(root, "objects")
+		self.temporary = os.path.join(root, "tmp")
+		os.makedirs(self.objects, exist_ok=True)
+		os.makedirs(self.temporary, exist_ok=True)
+
+	@contextmanager
+	def _index(self, write=False):
+		with open(os.path.join(self.root, "lock"), "a") as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+			try:
+				with open(os.path.join(self.root, "index.json"), "rt") as file:
+					index = json.load(file)
+			except (OSError, ValueError):
+				index = {"urls": {}, "objects": {}}
+
+			yield index
+
+			if write:
+				path = os.path.join(self.root, "index.json")
+				with open(f"{path}.tmp", "wt") as file:
+					json.dump(index, file)
+				os.replace(f"{path}.tmp", path)
+
+	def object_path(self, digest):
+		return os.path.join(self.objects, digest)
+
+	@staticmethod
+	def _key(url, validator):
+		return f"{url} {validator}"
+
+	def lookup(self, url, validator):
+		"""Returns the cached object path for url at validator, or None."""
+		if validator is None:
+			return None
+
+		with self._index(write=True) as index:
+			digest = index["urls"].get(self._key(url, validator))
+			if digest is None or not os.path.exists(self.object_path(digest)):
+				return None
+
+			index["objects"][digest]["used"] = time.time()
+			return self.object_path(digest)
+
+	def _cached(self, url, validator, sha256=None):
+		"""lookup(), except objects that don't match sha256 aren't hits."""
+		cached = self.lookup(url, validator)
+		# NOTE: objects are named after their SHA256.
+		if cached is not None and sha256 is not None and os.path.basename(cached) != sha256.lower():
+			return None
+		return cached
+
+	def store(self, url, validator, path, sha256=None):
+		"""Moves a finished download into the cache and returns its object path.
+		When sha256 is given, a download with any other digest is discarded
+		with a DownloadError instead."""
+		digest = sha256_file(path)
+		if sha256 is not None and digest != sha256.lower():
+			os.remove(path)
+			raise DownloadError(f"{url} doesn't match its SHA256 ({digest} != {sha256}).")
+
+		target = self.object_path(digest)
+
+		with self._index(write=True) as index:
+			if os.path.exists(target):
+				os.remove(path)
+			else:
+				# NOTE: read only, since installs may hardlink to it.
+				os.chmod(path, 0o444 | (os.stat(path).st_mode & 0o111))
+				os.replace(path, target)
+
+			if validator is not None:
+				index["urls"][self._key(url, validator)] = digest
+			index["objects"][digest] = {"size": os.path.getsize(target), "used": time.time()}
+
+		self.prune(keep=(digest,))
+		return target
+
+	@staticmethod
+	@contextmanager
+	def _exclusive(path):
+		"""An flock on path, which is removed again once released."""
+		while True:
+			lock = open(path, "a")
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			# NOTE: whoever held it before may have removed it meanwhile,
+			#       and then a third process could be locking a new one.
+			try:
+				current = os.stat(path)
+			except FileNotFoundError:
+				current = None
+			if current is not None and os.path.samestat(current, os.fstat(lock.fileno())):
+				break
+
+			lock.close()
+
+		try:
+			yield
+		finally:
+			os.remove(path)
+			lock.close()
+
+	def fetch(self, url, pool=None, mirrors=None, failed=None, sha256=None, **kwargs):
+		"""Returns a cached path for url, downloading it only when the remote
+		ETag/Last-Modified isn't already in the cache.
+
+		When given, mirrors are the places url is actually fetched from, in
+		order (see _mirrors.py); url then only names the artifact, so every
+		mirror's copy is cached under the same entry. Downloads are only
+		cached once they're as long as the server said, and match sha256
+		when that's known.
+		"""
+		owns_pool = pool is None
+		if owns_pool: pool = ConnectionPool()
+
+		try:
+			sources = list(mirrors) if mirrors else [url]
+			resource = probe_first(sources, pool, failed)
+			key = url if mirrors else resource.url
+			cached = self._cached(key, resource.validator, sha256)
+			if cached is not None:
+				return cached
+
+			# Named after the URL so an interrupted download resumes next time.
+			name = hashlib.sha256(key.encode()).hexdigest()
+			partial = os.path.join(self.temporary, name)
+			# Only one process downloads a given URL, the rest wait for it.
+			with self._exclusive(f"{partial}.lock"):
+				cached = self._cached(key, resource.validator, sha256)
+				if cached is not None:
+					return cached
+
+				resource = download(resource.url, partial, pool=pool, failed=failed,
+					mirrors=[s for s in sources if s != resource.url], **kwargs)
+				size = os.path.getsize(partial)
+				if resource.size is not None and size != resource.size:
+					os.remove(partial)
+					raise DownloadError(f"{resource.url} is {size} bytes, not {resource.size}.")
+
+				return self.store(key, resource.validator, partial, sha256)
+		finally:
+			if owns_pool: pool.close()
+
+	def install(self, url, destination, mode=None, **kwargs):
+		return link_file(self.fetch(url, **kwargs), destination, mode=mode)
+
+	def stats(self):
+		with self._index() as index:
+			objects = index["objects"]
+			return {
+				"root": self.root,
+				"objects": len(objects),
+				"urls": len(index["urls"]),
+				"size": sum(o["size"] for o in objects.values()),
+				"max_size": self.max_size,
+				"max_age": self.max_age,
+			}
+
+	def prune(self, max_size=None, max_age=None, now=None, keep=()):
+		"""Evicts objects unused for max_age seconds, then least recently used
+		objects until the cache fits in max_size bytes. Returns what was removed.
+
+		Objects handed out in the last IN_USE_WINDOW seconds, and the digests
+		in keep, stay whatever their size.
+		"""
+		if max_size is None: max_size = self.max_size
+		if max_age is None: max_age = self.max_age
+		if now is None: now = time.time()
+
+		removed = []
+		with self._index(write=True) as index:
+			objects = index["objects"]
+			total = sum(o["size"] for o in objects.values())
+
+			for digest, entry in sorted(objects.items(), key=lambda item : item[1]["used"]):
+				if total <= max_size and now - entry["used"] <= max_age:
+					break
+				elif digest in keep or now - entry["used"] < IN_USE_WINDOW:
+					continue
+
+				try:
+					os.remove(self.object_path(digest))
+				except FileNotFoundError:
+					pass
+
+				total -= entry["size"]
+				removed.append(digest)
+
+			for digest in removed: del objects[digest]
+			index["urls"] = {k: v for k, v in index["urls"].items() if v in objects}
+
+		return removed
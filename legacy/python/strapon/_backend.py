@@ -0,0 +1,418 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from ._trace import span
+from ._progress import ProgressEvent, RETAINED_LINES, run_streaming, publish, subscribed
+
+# standard imports
+from contextlib import contextmanager
+from threading import Lock, local
+from itertools import count
+import os, sys, json, shlex, atexit, subprocess
+
+
+
+__all__ = [
+	"BackendError",
+	"Backend",
+	"InProcessBackend",
+	"NativeAction",
+	"backend_enabled",
+	"get_backend",
+	"current_backend",
+	"perform",
+	"serve",
+]
+
+
+# "direct" runs every command as its own subprocess like before, anything
+# else (the default) routes privileged commands through one worker per run.
+MODE_VARIABLE = "STRAPON_BACKEND"
+# How the worker is elevated when we aren't root; empty to never elevate.
+SUDO_VARIABLE = "STRAPON_SUDO"
+
+_backend = None
+_backend_lock = Lock()
+
+
+class BackendError(Exception):
+	"""A command the worker ran failed, or the worker itself went away."""
+
+	def __init__(self, message, exit_code=None, stdout="", stderr=""):
+		Exception.__init__(self, message)
+		self.exit_code = exit_code
+		self.stdout = stdout
+		self.stderr = stderr
+
+
+# WORKER SIDE
+# NOTE: everything below up to the client runs in the (privileged) worker,
+#       one JSON request per line on stdin, one JSON response per line on
+#       stdout. Commands get their own pipes so they can't corrupt that.
+#       Requests asking to "stream" get {"event": ...} lines (see
+#       _progress.py) ahead of their response.
+
+_local = local()
+
+
+@contextmanager
+def _emitting(emit, stream="lines"):
+	if emit is not None and stream != "lines":
+		emit = (lambda emit : lambda event : event.kind != "line" and emit(event))(emit)
+
+	_local.emit = emit
+	try:
+		yield
+	finally:
+		_local.emit = None
+
+
+def _run(argv, status=None, retain=None):
+	"""Runs argv, streaming its events to whoever asked. Keeps all of
+	stdout (like sh) unless told to retain fewer lines."""
+	return run_streaming(argv, status, getattr(_local, "emit", None), retain)
+
+
+def _native(argv, installer, root, action, packages):
+	"""Runs argv + packages, first dropping packages the worker's (warm)
+	copy of the package database says are already in the requested state."""
+	from ._large_functions import get_installer_status, get_installer_progress_options
+	from ._dpkg_status import plan_changes
+
+	status = get_installer_status(installer, root) if action != "index" else None
+	if status is not None:
+		packages = plan_changes(status, action, packages)
+		if not packages:
+			return {"exit_code": 0, "stdout": "", "stderr": "", "changed": []}
+
+	# NOTE: apt upgrades can print megabytes, only the tail is worth keeping.
+	return {**_run([*argv, *packages], get_installer_progress_options(installer), RETAINED_LINES),
+		"changed": packages}
+
+
+def _write_files(files):
+	"""Writes each {"path", "content", "mode"} atomically, skipping files
+	that already hold the same content. Returns the paths written."""
+	written = []
+	for entry in files:
+		path, content = entry["path"], entry["content"].encode()
+		try:
+			with open(path, "rb") as file:
+				if file.read() == content: continue
+		except FileNotFoundError:
+			pass
+
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		temporary = f"{path}.{os.getpid()}.tmp"
+		with open(temporary, "wb") as file:
+			file.write(content)
+		os.chmod(temporary, entry.get("mode", 0o644))
+		os.replace(temporary, path)
+		written.append(path)
+
+	return {"written": written}
+
+
+def _refresh_sources(argv, root, content):
+	"""Runs an index refresh (argv) against only the given sources, instead
+	of every source list on the system."""
+	# NOTE: inside the root, since apt resolves this under its RootDir too.
+	listed = "/etc/apt/strapon-refresh.list"
+	path = os.path.join(root, listed.lstrip("/"))
+	with open(path, "wt") as file:
+		file.write(content)
+
+	try:
+		return _run([*argv,
+			"-o", f"Dir::Etc::sourcelist={listed}",
+			"-o", "Dir::Etc::sourceparts=-",
+			"-o", "APT::Get::List-Cleanup=0",
+		], retain=RETAINED_LINES)
+	finally:
+		os.remove(path)
+
+
+def _place_files(files):
+	"""Copies each {"source", "path", "size", "algorithm", "digest"} into
+	place, eg. downloaded archives into a package cache only the worker can
+	write to, checking the copy against its hash.
+
+	NOTE: sources belong to whoever asked, so they're never hardlinked; the
+	      placed file is a new one of our own, verified after it's written
+	      so a source rewritten in between is caught.
+	"""
+	from ._artifact_cache import link_file
+	from ._prefetch import Archive
+
+	placed = []
+	for entry in files:
+		method = link_file(entry["source"], entry["path"], hardlink=False)
+		archive = Archive(entry["source"], os.path.basename(entry["path"]), entry["size"],
+			entry.get("algorithm"), entry.get("digest"))
+		if not archive.verify(entry["path"]):
+			os.remove(entry["path"])
+			raise ValueError(f"{entry['path']} doesn't match its published hash once placed.")
+
+		placed.append(method)
+
+	return {"placed": placed}
+
+
+_handlers = {
+	"ping": lambda : {"pid": os.getpid(), "euid": os.geteuid()},
+	"run": _run,
+	"native": _native,
+	"write_files": _write_files,
+	"refresh_sources": _refresh_sources,
+	"place_files": _place_files,
+	"shutdown": lambda : {},
+}
+
+
+def serve(requests=None, responses=None):
+	"""The worker loop; returns once asked to shut down or stdin closes."""
+	if requests is None: requests = sys.stdin.buffer
+	if responses is None: responses = sys.stdout.buffer
+
+	def emit(event, id):
+		responses.write(json.dumps({"id": id, "event": event.to_dict()}).encode() + b"\n")
+		responses.flush()
+
+	for line in requests:
+		request = json.loads(line)
+		id = request.get("id")
+		try:
+			stream = request.get("stream")
+			with _emitting((lambda event : emit(event, id)) if stream else None, stream):
+				response = _handlers[request["op"]](**request.get("args", {}))
+			response["ok"] = True
+		except Exception as error:
+			response = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+
+		response["id"] = id
+		responses.write(json.dumps(response).encode() + b"\n")
+		responses.flush()
+		if request["op"] == "shutdown":
+			break
+
+
+# CLIENT SIDE
+
+def _worker_command():
+	package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	code = f"import sys; sys.path.insert(0, {package_parent!r}); " \
+		"from strapon._backend import serve; serve()"
+	argv = [sys.executable, *(["-O"] if sys.flags.optimize else []), "-c", code]
+
+	sudo = os.environ.get(SUDO_VARIABLE, "sudo")
+	if os.geteuid() != 0 and sudo:
+		argv = [*shlex.split(sudo), *argv]
+
+	return argv
+
+
+class Backend():
+	"""A long lived worker running package manager operations for this
+	process, so elevation and setup happen once instead of per command.
+
+	Requests are serialized; native package managers take an exclusive
+	lock of their own anyway.
+	"""
+
+	def __init__(self, command=None):
+		self.command = command or _worker_command()
+		self.pid = None
+		self._process = None
+		self._lock = Lock()
+		self._ids = count()
+
+	def start(self):
+		with self._lock:
+			self._start()
+
+		return self
+
+	def _start(self):
+		if self._process is not None:
+			return
+
+		with span("backend start", "backend"):
+			self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+			self.pid = self._exchange("ping", {})["pid"]
+
+	def _exchange(self, op, args, events=None):
+		request = {"id": next(self._ids), "op": op, "args": args}
+		if events is not None: request["stream"] = subscribed()
+		try:
+			self._process.stdin.write(json.dumps(request).encode() + b"\n")
+			self._process.stdin.flush()
+		except BrokenPipeError:
+			pass
+
+		while True:
+			try:
+				line = self._process.stdout.readline()
+			except BrokenPipeError:
+				line = b""
+
+			if not line:
+				self._process.wait()
+				code = self._process.returncode
+				self._process = None
+				raise BackendError(f"The backend worker exited ({code}).", code)
+
+			response = json.loads(line)
+			if not "event" in response:
+				break
+
+			events(ProgressEvent.from_dict(response["event"]))
+
+		if not response.pop("ok"):
+			raise BackendError(f"The backend worker failed '{op}': {response['error']}")
+
+		return response
+
+	def call(self, op, events=None, **args):
+		"""Runs op in the worker; events(event) is handed every ProgressEvent
+		it streams back on the way."""
+		with self._lock:
+			self._start()
+			return self._exchange(op, args, events)
+
+	@staticmethod
+	def _check(argv, result):
+		if result["exit_code"] != 0:
+			raise BackendError(f"'{shlex.join(argv)}' exited with {result['exit_code']}:\n"
+				+ result["stderr"].strip(), result["exit_code"], result["stdout"], result["stderr"])
+
+		return result["stdout"]
+
+	def run(self, argv):
+		"""Runs argv in the worker, returning its output like sh would."""
+		argv = [str(a) for a in argv]
+		with span(shlex.join(argv), "command", backend=True) as trace:
+			result = self.call("run", _listener(), argv=argv)
+			trace.set(exit_code=result["exit_code"], pid=self.pid)
+			return self._check(argv, result)
+
+	def native(self, argv, installer, root, action, packages):
+		"""Runs a package manager action, letting the worker skip packages
+		already in the requested state. Returns the packages it acted on."""
+		argv = [str(a) for a in argv]
+		with span(shlex.join([*argv, *packages]), "command", backend=True) as trace:
+			result = self.call("native", _listener(), argv=argv, installer=installer, root=root,
+				action=action, packages=list(packages))
+			trace.set(exit_code=result["exit_code"], pid=self.pid, changed=len(result["changed"]))
+			self._check([*argv, *result["changed"]], result)
+			return result["changed"]
+
+	def close(self):
+		with self._lock:
+			if self._process is None:
+				return
+
+			try:
+				self._exchange("shutdown", {})
+			except BackendError:
+				pass
+
+			if self._process is not None:
+				self._process.stdin.close()
+				self._process.wait()
+				self._process = None
+
+
+class InProcessBackend(Backend):
+	"""Runs the same operations in this process, when the worker is
+	disabled (STRAPON_BACKEND=direct)."""
+
+	def __init__(self):
+		self.command = None
+		self.pid = os.getpid()
+
+	def start(self):
+		return self
+
+	def call(self, op, events=None, **args):
+		with _emitting(events, subscribed()):
+			return _handlers[op](**args)
+
+	def close(self):
+		pass
+
+
+def _listener():
+	"""Where streamed events go; nowhere (and so not streamed) unless
+	someone subscribed, see _progress.py"""
+	return publish if subscribed() else None
+
+
+class NativeAction():
+	"""One of an installer's _install/_remove/_purge/_index actions, run
+	by the backend worker when it's enabled."""
+
+	def __init__(self, installer, action, command):
+		self.installer = installer
+		self.action = action
+		self.command = command
+
+	def __call__(self, *packages):
+		return current_backend().native(self.command.argv(), self.installer.name,
+			self.installer.root, self.action, packages)
+
+	def __repr__(self):
+		return f"NativeAction({self.action!r}, {self.command!r})"
+
+
+def perform(op, **args):
+	"""Runs a worker operation, in the worker when the backend is enabled
+	and in this process otherwise."""
+	return current_backend().call(op, _listener(), **args)
+
+
+def backend_enabled():
+	return os.environ.get(MODE_VARIABLE, "worker") != "direct"
+
+
+def get_backend():
+	"""The worker for this process, started on first use and shut down at
+	exit."""
+	global _backend
+	with _backend_lock:
+		if _backend is None:
+			_backend = Backend()
+			atexit.register(_backend.close)
+
+	return _backend
+
+
+_in_process = InProcessBackend()
+
+
+def current_backend():
+	"""The worker, or this process when the worker is disabled."""
+	return get_backend() if backend_enabled() else _in_process
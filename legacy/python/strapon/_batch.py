@@ -0,0 +1,228 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from . import WebInstaller, GitInstaller
+from ._index_state import index_once
+from ._large_functions import get_installer_status
+from ._dpkg_status import plan_changes
+from ._scheduler import Scheduler
+from ._plan import load_plan
+
+# standard imports
+from importlib import import_module
+from argparse import Namespace
+
+
+
+__all__ = [
+	"BatchPlan",
+	"plan_modules",
+]
+
+
+class BatchPlan():
+	"""Merges the system format of many strapon modules into one transaction
+	per native installer, instead of one transaction per module."""
+
+	def __init__(self):
+		# installer name -> {
+		#   "installer": a SystemInstaller built from the first plan for that name,
+		#   "packages": {package: [module, ...]},
+		#   "repositories": {repository: [module, ...]},
+		#   "index_before_action": bool,
+		# }
+		# NOTE: dicts keep insertion order, so packages stay in the order
+		#       the modules were requested.
+		self.backends = {}
+		# [(module name, format, strapped format function)] for the
+		# standalone and source formats, which can't be merged.
+		self.formats = []
+		# module name -> reason it wasn't merged into the plan
+		self.skipped = {}
+
+	def add_module(self, name, module=None, format="system"):
+		if format != "system":
+			if module is None:
+				try:
+					module = import_module(f".{name}", package=__package__)
+				except ModuleNotFoundError as error:
+					if error.name != f"{__package__}.{name}": raise
+					self.skipped[name] = "no such module"
+					return False
+
+			function = getattr(module, format, None)
+			if not isinstance(getattr(function, "installer", None), (WebInstaller, GitInstaller)):
+				self.skipped[name] = f"no {format} format strapped onto a Web or Git installer"
+				return False
+
+			self.formats.append((name, format, function))
+			return True
+
+		# NOTE: the system format comes from the cached plan when there is one,
+		#       without importing the module. See _plan.py
+		if module is None:
+			try:
+				plan = load_plan(name)
+			except FileNotFoundError:
+				self.skipped[name] = "no such module"
+				return False
+		else:
+			plan = getattr(getattr(module, "system", None), "plan", None)
+
+		if plan is None:
+			self.skipped[name] = "no system format strapped onto a SystemInstaller"
+			return False
+
+		return self.add_plan(plan, name)
+
+	def add_plan(self, plan, name=None):
+		if name is None: name = plan.module
+
+		backend = self.backends.get(plan.installer)
+		if backend is None:
+			backend = self.backends[plan.installer] = {
+				"installer": plan.system_installer(),
+				"packages": {},
+				"repositories": {},
+				"index_before_action": False,
+			}
+
+		for repository in plan.repositories:
+			backend["repositories"].setdefault(repository, []).append(name)
+		for package in plan.packages:
+			backend["packages"].setdefault(package, []).append(name)
+
+		backend["index_before_action"] |= plan.index_before_action
+		return True
+
+	def origins(self):
+		"""Yields (installer name, package, modules) for every planned package."""
+		for backend_name, backend in self.backends.items():
+			for package, modules in backend["packages"].items():
+				yield backend_name, package, modules
+
+	def changes(self, backend_name, action):
+		"""The packages of a backend the action would actually change."""
+		backend = self.backends[backend_name]
+		packages = list(backend["packages"])
+		status = get_installer_status(backend_name, backend["installer"].root)
+		return packages if status is None else plan_changes(status, action, packages)
+
+	def report(self, action=None):
+		lines = []
+		changes = {}
+		if action is not None:
+			changes = {name: set(self.changes(name, action)) for name in self.backends}
+
+		for backend_name, package, modules in self.origins():
+			unchanged = action is not None and not package in changes[backend_name]
+			lines.append(f"{backend_name}: {package} <- {', '.join(modules)}"
+				+ (" (already satisfied)" if unchanged else ""))
+		for name, format, function in self.formats:
+			installer = function.installer
+			source = getattr(installer, "resource", None) or getattr(installer, "repo", None)
+			lines.append(f"{format}: {name} <- {source}")
+		for name, reason in self.skipped.items():
+			lines.append(f"skipped {name}: {reason}")
+
+		return "\n".join(lines)
+
+	def schedule(self, action, scheduler=None):
+		"""Adds every step of the plan to a Scheduler as a dependency graph.
+
+		native:   register -> index -> download -> action, all but the
+		          download holding the installer lock
+		standalone: download -> action
+		source:   fetch -> build -> action
+		"""
+		if scheduler is None: scheduler = Scheduler()
+
+		for backend_name, backend in self.backends.items():
+			packages = self.changes(backend_name, action)
+			if not packages:
+				continue
+
+			installer = backend["installer"]
+			lock = f"native:{backend_name}"
+			requires = []
+			# NOTE: repositories only matter for locating packages to install,
+			#       removal works off of what's already on the system.
+			if action == "install":
+				if backend["repositories"]:
+					def register(installer=installer, backend=backend):
+						installer.metadata["repositories"] = list(backend["repositories"])
+						installer._meta_repository_handle()
+
+					requires = [scheduler.add(f"register:{backend_name}", register,
+						requires, exclusive=lock).name]
+
+				if backend["index_before_action"] or backend["repositories"]:
+					requires = [scheduler.add(f"index:{backend_name}",
+						lambda installer=installer : index_once(installer),
+						requires, exclusive=lock).name]
+
+				# NOTE: runs alongside every other step, without the lock.
+				if getattr(installer, "_download", None) is not None:
+					requires = [scheduler.add(f"download:{backend_name}",
+						lambda installer=installer, packages=packages : installer._download(*packages),
+						requires).name]
+
+			native = getattr(installer, f"_{action}")
+			scheduler.add(f"{action}:{backend_name}",
+				lambda native=native, packages=packages : native(*packages),
+				requires, exclusive=lock)
+
+		for name, format, function in self.formats:
+			installer = function.installer
+			requires = []
+			if action == "install" and isinstance(installer, WebInstaller):
+				requires = [scheduler.add(f"download:{name}",
+					lambda installer=installer : installer.fetch()).name]
+			elif action == "install" and isinstance(installer, GitInstaller):
+				fetch = scheduler.add(f"fetch:{name}",
+					lambda installer=installer : installer.fetch(installer.tree))
+				requires = [scheduler.add(f"build:{name}",
+					lambda installer=installer : installer.build(installer.tree, until="build"),
+					[fetch.name]).name]
+
+			namespace = Namespace(format=format, action=action)
+			scheduler.add(f"{action}:{name}",
+				lambda function=function, namespace=namespace : function(namespace), requires)
+
+		return scheduler
+
+	def exec(self, action, workers=None):
+		return self.schedule(action, Scheduler(workers)).run()
+
+
+def plan_modules(names):
+	"""Plans each "<module>[:<format>]", format defaulting to system."""
+	plan = BatchPlan()
+	for name in names:
+		name, _, format = name.partition(":")
+		plan.add_module(name, format=format or "system")
+
+	return plan
@@ -0,0 +1,265 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._runtime import Command
+from ._large_functions import get_cache_directory
+
+# standard imports
+from shutil import which
+from glob import glob
+import os, json, hashlib
+
+
+
+__all__ = [
+	"BUILD_SYSTEMS",
+	"detect_build_system",
+	"job_count",
+	"BuildPipeline",
+]
+
+
+BUILD_SYSTEMS = ("autotools", "cmake", "meson", "cargo", "make")
+# Rough peak resident memory of one compiler job, used to cap parallelism.
+MEMORY_PER_JOB = int(os.environ.get("STRAPON_MEMORY_PER_JOB", 1 << 30))
+# Out of tree build directory used by cmake and meson.
+BUILD_DIRECTORY = "_strapon_build"
+# Variables configure scripts record and refuse to see changed (autoconf's
+# "precious" variables), so their results depend on them.
+CONFIGURE_VARIABLES = ("CC", "CFLAGS", "CPP", "CPPFLAGS", "CXX", "CXXFLAGS", "CXXCPP",
+	"LDFLAGS", "LIBS", "PKG_CONFIG", "PKG_CONFIG_PATH", "PKG_CONFIG_LIBDIR")
+# Changes whenever packages (and so the libraries configure looks for) do.
+PACKAGE_DATABASE = "/var/lib/dpkg/status"
+
+
+def detect_build_system(tree):
+	def has(*names): return any(os.path.exists(os.path.join(tree, n)) for n in names)
+
+	if has("configure.ac", "configure.in", "bootstrap.sh", "autogen.sh", "configure"):
+		return "autotools"
+	elif has("meson.build"):
+		return "meson"
+	elif has("CMakeLists.txt"):
+		return "cmake"
+	elif has("Cargo.toml"):
+		return "cargo"
+	elif has("Makefile", "makefile", "GNUmakefile"):
+		return "make"
+
+	raise ValueError(f"Couldn't detect the build system used by '{tree}'.")
+
+
+def _available_memory():
+	try:
+		with open("/proc/meminfo", "rt") as file:
+			for line in file:
+				if line.startswith("MemAvailable:"):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+
+	return None
+
+
+def job_count():
+	"""Parallel jobs the host can take: one per usable core, unless there
+	isn't enough free memory to feed them all."""
+	try:
+		cores = len(os.sched_getaffinity(0))
+	except AttributeError:
+		cores = os.cpu_count() or 1
+
+	memory = _available_memory()
+	if memory is not None:
+		cores = min(cores, max(1, memory // MEMORY_PER_JOB))
+
+	return cores
+
+
+class BuildPipeline():
+	"""Turns a source tree into configure/build/install steps for its build
+	system, run in parallel and through a compiler cache when one exists."""
+
+	def __init__(self, tree, build_system=None, prefix=None, jobs=None):
+		self.tree = os.path.abspath(tree)
+		self.build_system = build_system or detect_build_system(self.tree)
+		if not self.build_system in BUILD_SYSTEMS:
+			raise ValueError(f"Unknown build system '{self.build_system}', expected one of {BUILD_SYSTEMS}.")
+
+		self.prefix = prefix
+		self.jobs = jobs or job_count()
+		self.env = self._environment()
+
+	def _environment(self):
+		env = dict(os.environ)
+		env["MAKEFLAGS"] = f"-j{self.jobs} {env.get('MAKEFLAGS', '')}".strip()
+		env["CMAKE_BUILD_PARALLEL_LEVEL"] = str(self.jobs)
+		env["CARGO_BUILD_JOBS"] = str(self.jobs)
+
+		# NOTE: prefer ccache for C/C++, sccache also covers rustc.
+		ccache, sccache = which("ccache"), which("sccache")
+		self.launcher = ccache or sccache
+		if ccache:
+			env["CCACHE_DIR"] = get_cache_directory("ccache")
+		if sccache:
+			env["SCCACHE_DIR"] = get_cache_directory("sccache")
+			env["RUSTC_WRAPPER"] = sccache
+		if self.launcher and self.build_system in ("autotools", "make"):
+			env["CC"] = f"{self.launcher} {env.get('CC', 'cc')}"
+			env["CXX"] = f"{self.launcher} {env.get('CXX', 'c++')}"
+
+		return env
+
+	def _configure_environment(self):
+		"""What configure's results depend on besides the tree itself."""
+		try:
+			stat = os.stat(PACKAGE_DATABASE)
+			packages = [stat.st_mtime_ns, stat.st_size]
+		except OSError:
+			packages = None
+
+		return {"variables": {name: self.env.get(name) for name in CONFIGURE_VARIABLES},
+			"prefix": self.prefix, "packages": packages}
+
+	def _configure_cache(self):
+		# NOTE: kept per tree and named by the environment, results from
+		#       other flags or since changed libraries are never reused.
+		key = hashlib.sha256(json.dumps(self._configure_environment(), sort_keys=True).encode())
+		directory = os.path.join(self.tree, BUILD_DIRECTORY)
+		name = f"config-{key.hexdigest()[:16]}.cache"
+		if os.path.isdir(directory):
+			for old in glob(os.path.join(directory, "config-*.cache")):
+				if os.path.basename(old) != name: os.remove(old)
+		else:
+			os.makedirs(directory)
+
+		return os.path.join(directory, name)
+
+	def _configure_stamp(self, arguments):
+		"""A digest of what configure saw, so unchanged trees skip it."""
+		# NOTE: meson only takes --reconfigure once it's configured, which
+		#       would make the first run's stamp never match.
+		arguments = [a for a in arguments if a != "--reconfigure"]
+		digest = hashlib.sha256(json.dumps([arguments, self._configure_environment()],
+			sort_keys=True).encode())
+		for name in ("configure", "configure.ac", "configure.in", "CMakeLists.txt",
+				"meson.build", "meson_options.txt"):
+			path = os.path.join(self.tree, name)
+			if os.path.exists(path):
+				with open(path, "rb") as file: digest.update(file.read())
+
+		return digest.hexdigest()
+
+	def _configured(self):
+		build = os.path.join(self.tree, BUILD_DIRECTORY)
+		product = {
+			"autotools": os.path.join(self.tree, "Makefile"),
+			"cmake": os.path.join(build, "CMakeCache.txt"),
+			"meson": os.path.join(build, "build.ninja"),
+		}.get(self.build_system)
+
+		return product is not None and os.path.exists(product)
+
+	def steps(self):
+		"""Returns [(name, argv, stamped)], stamped steps being skippable."""
+		prefix = [] if self.prefix is None else [self.prefix]
+		build = os.path.join(self.tree, BUILD_DIRECTORY)
+		jobs = str(self.jobs)
+
+		if self.build_system == "autotools":
+			steps = []
+			if not os.path.exists(os.path.join(self.tree, "configure")):
+				for script in ("bootstrap.sh", "autogen.sh"):
+					if os.path.exists(os.path.join(self.tree, script)):
+						steps.append(("bootstrap", [os.path.join(self.tree, script)], False))
+						break
+				else:
+					steps.append(("bootstrap", ["autoreconf", "-fi"], False))
+
+			configure = [os.path.join(self.tree, "configure"), f"--cache-file={self._configure_cache()}"]
+			configure += [f"--prefix={p}" for p in prefix]
+			return steps + [
+				("configure", configure, True),
+				("build", ["make", f"-j{jobs}"], False),
+				("install", ["make", "install"], False),
+			]
+		elif self.build_system == "cmake":
+			configure = ["cmake", "-S", self.tree, "-B", build]
+			configure += [f"-DCMAKE_INSTALL_PREFIX={p}" for p in prefix]
+			if self.launcher:
+				configure += [f"-DCMAKE_C_COMPILER_LAUNCHER={self.launcher}",
+					f"-DCMAKE_CXX_COMPILER_LAUNCHER={self.launcher}"]
+			return [
+				("configure", configure, True),
+				("build", ["cmake", "--build", build, "--parallel", jobs], False),
+				("install", ["cmake", "--install", build], False),
+			]
+		elif self.build_system == "meson":
+			# NOTE: ninja reruns meson by itself when meson.build changes.
+			configure = ["meson", "setup", build]
+			configure += [f"--prefix={p}" for p in prefix]
+			if self._configured(): configure.append("--reconfigure")
+			return [
+				("configure", configure, True),
+				("build", ["meson", "compile", "-C", build, "-j", jobs], False),
+				("install", ["meson", "install", "-C", build], False),
+			]
+		elif self.build_system == "cargo":
+			install = ["cargo", "install", "--path", self.tree, "-j", jobs]
+			install += [f"--root={p}" for p in prefix]
+			return [
+				("build", ["cargo", "build", "--release", "-j", jobs], False),
+				("install", install, False),
+			]
+		else:
+			install = ["make", "install"] + [f"PREFIX={p}" for p in prefix]
+			return [
+				("build", ["make", f"-j{jobs}"], False),
+				("install", install, False),
+			]
+
+	def run(self, until="install"):
+		stamp_path = os.path.join(self.tree, ".strapon-configure")
+		ran = []
+
+		for name, argv, stamped in self.steps():
+			if stamped and self._configured():
+				stamp = self._configure_stamp(argv)
+				try:
+					with open(stamp_path, "rt") as file:
+						if file.read() == stamp: continue
+				except OSError:
+					pass
+
+			Command(argv[0])(*argv[1:], _cwd=self.tree, _env=self.env, _fg=True)
+			ran.append(name)
+
+			if stamped:
+				with open(stamp_path, "wt") as file: file.write(self._configure_stamp(argv))
+			if name == until:
+				break
+
+		return ran
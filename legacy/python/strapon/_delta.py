@@ -0,0 +1,652 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._download import (ConnectionPool, DownloadError, STALL_TIMEOUT, DEFAULT_SEGMENTS,
+	MAXIMUM_REDIRECTS, _Sources, _PartialDownload, _probe_sources, _fetch_segment, download)
+from ._trace import span
+
+# standard imports
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from itertools import accumulate, compress
+from urllib.parse import urlsplit, urljoin
+import os, mmap, math, time, struct, hashlib
+
+
+
+__all__ = [
+	"DeltaError",
+	"DeltaReport",
+	"ControlFile",
+	"make_control",
+	"appimage_update_information",
+	"delta_update",
+]
+
+
+# Missing blocks closer together than this are fetched in one request; a
+# round trip costs more than a few KiB of transfer.
+MERGE_GAP = 16 << 10
+# The most of an unmatched stretch of the old file hashed in one go while
+# looking for the next matching block.
+MAXIMUM_SCAN = 1 << 20
+# Bytes of the target matched per second below which a delta isn't worth
+# it: about the link speed it has to beat. Matching runs in Python, so a
+# delta pays off on slow links and large mostly unchanged files, while on
+# fast links (or without OpenSSL's MD4) a full download usually wins.
+MINIMUM_RATE = 8 << 20
+# The fraction of the target which has to be found locally; fetching most
+# of a file as ranges gains nothing over one plain request.
+MINIMUM_REUSE = 0.5
+
+
+class DeltaError(Exception): pass
+
+
+# CHECKSUMS
+# NOTE: the same weak rolling checksum and MD4 strong checksum as zsync
+#       0.6.2, so existing .zsync files work.
+
+def _rsum(block):
+	"""zsync's weak checksum of a block as one int, (a << 16) | b."""
+	return (sum(block) & 0xffff) << 16 | (sum(accumulate(block)) & 0xffff)
+
+
+def _weak_keys(data, blocksize, mask):
+	"""The masked weak checksum of every blocksize window of data."""
+	a = sum(data[:blocksize])
+	b = sum(accumulate(data[:blocksize]))
+	keys = [((a & mask) << 16) | (b & 0xffff)]
+	append = keys.append
+	for old, new in zip(data, data[blocksize:]):
+		a += new - old
+		b += a - blocksize * old
+		append(((a & mask) << 16) | (b & 0xffff))
+
+	return keys
+
+
+def _md4_python(data):
+	def rotate(x, n):
+		x &= 0xffffffff
+		return ((x << n) | (x >> (32 - n))) & 0xffffffff
+
+	length = len(data)
+	data = bytes(data) + b"\x80" + b"\x00" * ((55 - length) % 64) + struct.pack("<Q", length * 8)
+	a, b, c, d = 0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476
+	for offset in range(0, len(data), 64):
+		x = struct.unpack_from("<16I", data, offset)
+		aa, bb, cc, dd = a, b, c, d
+		for i in (0, 4, 8, 12):
+			a = rotate(a + ((b & c) | (~b & d)) + x[i], 3)
+			d = rotate(d + ((a & b) | (~a & c)) + x[i + 1], 7)
+			c = rotate(c + ((d & a) | (~d & b)) + x[i + 2], 11)
+			b = rotate(b + ((c & d) | (~c & a)) + x[i + 3], 19)
+		for i in (0, 1, 2, 3):
+			a = rotate(a + ((b & c) | (b & d) | (c & d)) + x[i] + 0x5a827999, 3)
+			d = rotate(d + ((a & b) | (a & c) | (b & c)) + x[i + 4] + 0x5a827999, 5)
+			c = rotate(c + ((d & a) | (d & b) | (a & b)) + x[i + 8] + 0x5a827999, 9)
+			b = rotate(b + ((c & d) | (c & a) | (d & a)) + x[i + 12] + 0x5a827999, 13)
+		for i in (0, 2, 1, 3):
+			a = rotate(a + (b ^ c ^ d) + x[i] + 0x6ed9eba1, 3)
+			d = rotate(d + (a ^ b ^ c) + x[i + 8] + 0x6ed9eba1, 9)
+			c = rotate(c + (d ^ a ^ b) + x[i + 4] + 0x6ed9eba1, 11)
+			b = rotate(b + (c ^ d ^ a) + x[i + 12] + 0x6ed9eba1, 15)
+		a, b, c, d = (a + aa) & 0xffffffff, (b + bb) & 0xffffffff, (c + cc) & 0xffffffff, (d + dd) & 0xffffffff
+
+	return struct.pack("<4I", a, b, c, d)
+
+
+def _md4_openssl(data):
+	return hashlib.new("md4", data).digest()
+
+
+# NOTE: OpenSSL 3 only has MD4 in its legacy provider, without it blocks
+#       are checked in Python at a fraction of the speed.
+try:
+	_md4_openssl(b"")
+	_md4 = _md4_openssl
+except ValueError:
+	_md4 = _md4_python
+
+
+class ControlFile():
+	"""A parsed .zsync file: the target's length, SHA-1 and per-block weak
+	and strong checksums."""
+
+	def __init__(self, headers, blocks, url):
+		self.headers = headers
+		self.length = int(headers["Length"])
+		self.blocksize = int(headers["Blocksize"])
+		self.seq_matches, self.rsum_bytes, self.checksum_bytes = (int(n)
+			for n in headers.get("Hash-Lengths", "1,4,16").split(","))
+		self.sha1 = headers.get("SHA-1")
+		# Where the target is, relative to the control file itself.
+		self.url = urljoin(url, headers["URL"]) if "URL" in headers else None
+		self.weak = [key for key, _ in blocks]
+		self.strong = [checksum for _, checksum in blocks]
+
+	@property
+	def count(self):
+		return len(self.weak)
+
+	@property
+	def mask(self):
+		"""The bits of the weak checksum's "a" half the file actually holds."""
+		return {4: 0xffff, 3: 0xff}.get(self.rsum_bytes, 0)
+
+	@classmethod
+	def parse(cls, data, url=None):
+		headers = {}
+		position = 0
+		while True:
+			end = data.find(b"\n", position)
+			if end < 0:
+				raise DeltaError("Truncated zsync control file.")
+
+			line = data[position:end].decode("utf-8", "replace").rstrip("\r")
+			position = end + 1
+			if not line:
+				break
+
+			key, _, value = line.partition(":")
+			headers[key.strip()] = value.strip()
+
+		if not "zsync" in headers or not "Length" in headers or not "Blocksize" in headers:
+			raise DeltaError("Not a zsync control file.")
+
+		control = cls(headers, (), url)
+		width = control.rsum_bytes + control.checksum_bytes
+		count = -(-control.length // control.blocksize)
+		if len(data) - position < count * width:
+			raise DeltaError("Truncated zsync control file.")
+
+		blocks = []
+		for offset in range(position, position + count * width, width):
+			weak = int.from_bytes(data[offset:offset + control.rsum_bytes], "big")
+			blocks.append((weak, data[offset + control.rsum_bytes:offset + width]))
+
+		control.weak = [key for key, _ in blocks]
+		control.strong = [checksum for _, checksum in blocks]
+		return control
+
+
+def make_control(path, url, blocksize=None):
+	"""A zsync 0.6.2 control file for path, like zsyncmake's, which clients
+	download url through. Hash lengths follow zsyncmake's heuristics."""
+	length = os.path.getsize(path)
+	if blocksize is None: blocksize = 2048 if length < 100 << 20 else 4096
+
+	seq_matches = 2 if length > blocksize else 1
+	bits = (math.log(max(length, 1)) + math.log(blocksize)) / math.log(2) - 8.6
+	rsum_bytes = min(4, max(2, math.ceil(bits / seq_matches / 8)))
+	checksum_bytes = math.ceil((20 + (math.log(max(length, 1)) + math.log(1 + length / blocksize))
+		/ math.log(2)) / seq_matches / 8)
+	checksum_bytes = min(16, max(checksum_bytes, int((7.9 + 20 + math.log(1 + length / blocksize)
+		/ math.log(2)) / 8)))
+
+	sha1 = hashlib.sha1()
+	sums = bytearray()
+	with open(path, "rb") as file:
+		while True:
+			block = file.read(blocksize)
+			if not block: break
+			sha1.update(block)
+			# NOTE: the last block is checksummed padded out with zeros.
+			block = block.ljust(blocksize, b"\x00")
+			sums += _rsum(block).to_bytes(4, "big")[4 - rsum_bytes:]
+			sums += _md4(block)[:checksum_bytes]
+
+	headers = (
+		"zsync: 0.6.2\n"
+		f"Filename: {os.path.basename(urlsplit(url).path)}\n"
+		f"MTime: {formatdate(os.path.getmtime(path))}\n"
+		f"Blocksize: {blocksize}\n"
+		f"Length: {length}\n"
+		f"Hash-Lengths: {seq_matches},{rsum_bytes},{checksum_bytes}\n"
+		f"URL: {url}\n"
+		f"SHA-1: {sha1.hexdigest()}\n"
+		"\n"
+	)
+	return headers.encode() + bytes(sums)
+
+
+# APPIMAGES
+
+def appimage_update_information(path):
+	"""The update information embedded in an AppImage's .upd_info section,
+	eg. "zsync|https://example.org/App-latest.AppImage.zsync", or None."""
+	try:
+		with open(path, "rb") as file:
+			ident = file.read(16)
+			if len(ident) < 16 or ident[:4] != b"\x7fELF":
+				return None
+
+			order = "<" if ident[5] == 1 else ">"
+			if ident[4] == 2:
+				header, section = struct.Struct(order + "HHIQQQIHHHHHH"), struct.Struct(order + "IIQQQQIIQQ")
+			else:
+				header, section = struct.Struct(order + "HHIIIIIHHHHHH"), struct.Struct(order + "IIIIIIIIII")
+
+			fields = header.unpack(file.read(header.size))
+			offset, count, names = fields[5], fields[11], fields[12]
+			file.seek(offset)
+			sections = [section.unpack(file.read(section.size)) for _ in range(count)]
+			if names >= len(sections):
+				return None
+
+			file.seek(sections[names][4])
+			strings = file.read(sections[names][5])
+			for entry in sections:
+				name = strings[entry[0]:strings.find(b"\x00", entry[0])]
+				if name == b".upd_info":
+					file.seek(entry[4])
+					information = file.read(entry[5]).split(b"\x00", 1)[0].decode("utf-8", "replace")
+					return information.strip() or None
+	except (OSError, struct.error):
+		pass
+
+	return None
+
+
+def _embedded_controls(path):
+	"""Control file URLs an AppImage's update information leads to."""
+	information = appimage_update_information(path)
+	if information is None:
+		return []
+
+	kind, *fields = information.split("|")
+	if kind == "zsync" and fields:
+		return [fields[0]]
+	elif kind == "gh-releases-zsync" and len(fields) == 4:
+		from ._releases import fetch_release_index, ReleaseError
+
+		owner, repository, tag, pattern = fields
+		try:
+			index = fetch_release_index(f"https://api.github.com/repos/{owner}/{repository}/releases")
+			release = index.resolve() if tag == "latest" else \
+				next(r for r in index.releases if r.version == tag)
+			return [release.asset(pattern)]
+		except (StopIteration, OSError, DownloadError, ReleaseError):
+			return []
+
+	return []
+
+
+# MATCHING
+
+class _Matcher():
+	"""Finds the target's blocks in the old file, zsync style: rolling the
+	weak checksum over stretches that don't match, and stepping a block at
+	a time while consecutive blocks keep matching."""
+
+	def __init__(self, control, old, deadline=None):
+		self.control = control
+		self.old = old
+		self.deadline = deadline
+		self.blocksize = control.blocksize
+		self.pairs = control.seq_matches > 1
+		self.found = [None] * control.count
+		self.remaining = control.count
+
+		weak = control.weak
+		self.weak = set(weak)
+		self.table = {}
+		if self.pairs:
+			for index in range(control.count - 1):
+				self.table.setdefault(weak[index] << 32 | weak[index + 1], []).append(index)
+		else:
+			for index, key in enumerate(weak):
+				self.table.setdefault(key, []).append(index)
+
+	def _block(self, index, position):
+		"""The old file's bytes at position, as long as block index."""
+		if index == self.control.count - 1 and self.control.length % self.blocksize:
+			# NOTE: the last block is checksummed padded out with zeros.
+			tail = self.control.length % self.blocksize
+			return self.old[position:position + tail].ljust(self.blocksize, b"\x00")
+
+		return self.old[position:position + self.blocksize]
+
+	def _key(self, index, position):
+		return _rsum(self._block(index, position)) & (self.control.mask << 16 | 0xffff)
+
+	def _strong(self, index, position):
+		return _md4(self._block(index, position))[:self.control.checksum_bytes] == self.control.strong[index]
+
+	def _mark(self, index, position):
+		if self.found[index] is None:
+			self.found[index] = position
+			self.remaining -= 1
+
+	def _check_deadline(self):
+		if self.deadline is not None and time.perf_counter() > self.deadline:
+			raise DeltaError("Matching blocks is slower than downloading them.")
+
+	def _scan(self, position):
+		"""The first (position, blocks) at or after position, or None."""
+		size = 4 * self.blocksize
+		span = self.blocksize * (2 if self.pairs else 1)
+		while position + span <= len(self.old):
+			self._check_deadline()
+			data = self.old[position:min(len(self.old), position + size + span)]
+			keys = _weak_keys(data, self.blocksize, self.control.mask)
+			limit = len(keys) - (self.blocksize if self.pairs else 0)
+			for i in compress(range(limit), map(self.weak.__contains__, keys)):
+				key = keys[i] << 32 | keys[i + self.blocksize] if self.pairs else keys[i]
+				blocks = [b for b in self.table.get(key, ()) if self._strong(b, position + i)]
+				if blocks:
+					return position + i, blocks
+
+			position += limit
+			size = min(size * 2, MAXIMUM_SCAN)
+
+		return None
+
+	def run(self):
+		old, blocksize, weak = self.old, self.blocksize, self.control.weak
+		position, expected, ahead = 0, None, None
+		last = self.control.count - 1
+		tail = self.control.length - last * blocksize
+		while self.remaining and position + min(blocksize, tail) <= len(old):
+			self._check_deadline()
+			if expected is not None and expected <= last and \
+					position + (tail if expected == last else blocksize) <= len(old):
+				# NOTE: in sync, the next block is most likely the next one.
+				key = ahead if ahead is not None else self._key(expected, position)
+				ahead = None
+				matched = key == weak[expected]
+				if matched and self.pairs and expected < last:
+					following = position + blocksize
+					if following + (tail if expected + 1 == last else blocksize) <= len(old):
+						ahead = self._key(expected + 1, following)
+					matched = ahead == weak[expected + 1]
+
+				if matched and self._strong(expected, position):
+					self._mark(expected, position)
+					position += blocksize
+					expected += 1
+					continue
+
+			expected, ahead = None, None
+			if position + blocksize > len(old):
+				break
+
+			match = self._scan(position)
+			if match is None:
+				break
+
+			position, blocks = match
+			for index in blocks:
+				self._mark(index, position)
+			position += blocksize
+			expected = max(blocks) + 1
+
+		return self.found
+
+
+def _ranges(found, blocksize, length):
+	"""[start, end) byte ranges of the target still to fetch."""
+	ranges = []
+	for index, position in enumerate(found):
+		if position is not None:
+			continue
+
+		start, end = index * blocksize, min(length, (index + 1) * blocksize)
+		if ranges and start - ranges[-1][1] <= MERGE_GAP:
+			ranges[-1][1] = end
+		else:
+			ranges.append([start, end])
+
+	return ranges
+
+
+def _copy_found(found, old, file, blocksize, length):
+	"""Writes the matched blocks of old into file, a run at a time."""
+	index = 0
+	while index < len(found):
+		position = found[index]
+		if position is None:
+			index += 1
+			continue
+
+		end = index + 1
+		while end < len(found) and found[end] == position + (end - index) * blocksize:
+			end += 1
+
+		start = index * blocksize
+		stop = min(length, end * blocksize)
+		os.pwrite(file.fileno(), old[position:position + stop - start], start)
+		index = end
+
+
+# UPDATES
+
+class DeltaReport():
+	"""What a delta update reused, fetched and how."""
+	__slots__ = ("url", "control", "length", "reused", "fetched", "requests", "fallback")
+
+	def __init__(self, url, control=None, length=0, reused=0, fetched=0, requests=0, fallback=None):
+		self.url = url
+		self.control = control
+		self.length = length
+		self.reused = reused
+		self.fetched = fetched
+		self.requests = requests
+		# Why the whole file was downloaded instead, or None.
+		self.fallback = fallback
+
+	@property
+	def saved(self):
+		return max(0, self.length - self.fetched)
+
+	def to_dict(self):
+		return {**{slot: getattr(self, slot) for slot in self.__slots__}, "saved": self.saved}
+
+
+def _get(pool, url):
+	for _ in range(MAXIMUM_REDIRECTS):
+		connection, response = pool.request("GET", url)
+		body = response.read()
+		split = urlsplit(url)
+		pool.release(split.scheme, split.netloc, connection)
+
+		if response.status in (301, 302, 303, 307, 308):
+			url = urljoin(url, response.getheader("Location"))
+			continue
+		elif response.status >= 400:
+			raise DownloadError(f"GET {url} failed with {response.status} {response.reason}.")
+
+		return body, url
+
+	raise DownloadError(f"Too many redirects fetching {url}.")
+
+
+def _control_for(url, destination, controls, pool):
+	"""The first of controls (by default the AppImage's own update
+	information, then <url>.zsync) which describes url, and its URL."""
+	if controls is None:
+		controls = [*_embedded_controls(destination), f"{url}.zsync"]
+
+	for candidate in dict.fromkeys(controls):
+		try:
+			data, location = _get(pool, candidate)
+			control = ControlFile.parse(data, location)
+		except (OSError, DownloadError, DeltaError):
+			continue
+
+		# NOTE: update information names the publisher's latest release,
+		#       which isn't necessarily the version asked for.
+		if control.url in (None, url):
+			return control, candidate
+
+	return None, None
+
+
+def _sha1(path):
+	sha1 = hashlib.sha1()
+	with open(path, "rb") as file:
+		while chunk := file.read(1 << 20):
+			sha1.update(chunk)
+
+	return sha1.hexdigest()
+
+
+_seconds_per_byte = None
+
+
+def _block_cost(blocksize):
+	"""Rough seconds to match one block of the target while in sync: its
+	weak and strong checksums. Timed once, on this host's MD4."""
+	global _seconds_per_byte
+	if _seconds_per_byte is None:
+		block = bytes(2048)
+		start = time.perf_counter()
+		for _ in range(4): _rsum(block), _md4(block)
+		_seconds_per_byte = (time.perf_counter() - start) / 4 / len(block)
+
+	return _seconds_per_byte * blocksize
+
+
+def _delta(url, destination, control, pool, sources, workers, stall_timeout, minimum_rate, report):
+	# NOTE: without the SHA-1 nothing checks the reassembled file.
+	if control.sha1 is None:
+		raise DeltaError("The control file has no SHA-1 to check the result against.")
+	elif os.path.getsize(destination) == control.length and _sha1(destination) == control.sha1.lower():
+		report.reused = control.length
+		return
+
+	# Even with every block in place, matching has to beat the download.
+	budget = control.length / minimum_rate if minimum_rate else None
+	if budget is not None and control.count * _block_cost(control.blocksize) > budget:
+		raise DeltaError("Matching blocks is slower than downloading them.")
+
+	resource = _probe_sources(sources, pool)
+	report.requests += 1
+	if not resource.accepts_ranges or resource.size != control.length:
+		raise DeltaError(f"{resource.url} doesn't match its control file or can't serve ranges.")
+
+	with open(destination, "rb") as file, span("match blocks", "download") as trace:
+		size = os.fstat(file.fileno()).st_size
+		old = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+		try:
+			found = _Matcher(control, old, None if budget is None else time.perf_counter() + budget).run()
+			matched = sum(p is not None for p in found)
+			trace.set(blocks=control.count, matched=matched)
+			if matched < control.count * MINIMUM_REUSE:
+				raise DeltaError(f"Only {matched} of {control.count} blocks are unchanged.")
+
+			ranges = _ranges(found, control.blocksize, control.length)
+
+			partial = _PartialDownload(destination, resource, 1, resume=False)
+			partial.segments = [[start, end, 0] for start, end in ranges]
+			with open(partial.path, "r+b") as output:
+				_copy_found(found, old, output, control.blocksize, control.length)
+		finally:
+			if size: old.close()
+
+	try:
+		with ThreadPoolExecutor(max_workers=workers) as executor:
+			jobs = [executor.submit(_fetch_segment, pool, partial, segment, True, sources, stall_timeout)
+				for segment in partial.segments]
+			for job in jobs: job.result()
+
+		report.requests += len(partial.segments)
+		report.fetched = sum(end - start for start, end in ranges)
+		report.reused = control.length - report.fetched
+
+		if _sha1(partial.path) != control.sha1.lower():
+			raise DeltaError(f"The result of the delta update doesn't match {url}'s SHA-1.")
+
+		os.chmod(partial.path, os.stat(destination).st_mode & 0o7777)
+		partial.finish(destination)
+	except BaseException:
+		for path in (partial.path, partial.state_path):
+			if os.path.exists(path): os.remove(path)
+		raise
+
+
+def delta_update(url, destination, controls=None, pool=None, mirrors=(), failed=None,
+		workers=DEFAULT_SEGMENTS, stall_timeout=STALL_TIMEOUT, minimum_rate=MINIMUM_RATE):
+	"""Updates the file at destination to url, reusing whatever blocks of
+	it are unchanged and fetching only the rest as byte ranges.
+
+	Blocks are found with a zsync control file: the AppImage's embedded
+	update information when it has some and it describes url, otherwise
+	<url>.zsync, or any of controls when given. The result is checked
+	against the control file's SHA-1 before replacing destination.
+
+	url is downloaded in full instead without a usable control file (or
+	one without a SHA-1), when less than MINIMUM_REUSE of the file is
+	unchanged, when matching can't keep up with minimum_rate bytes per
+	second (0 for no limit), or when the delta fails. That download is
+	checked against the control file's SHA-1 too, raising DeltaError when
+	it doesn't match. Returns a DeltaReport.
+	"""
+	owns_pool = pool is None
+	if owns_pool: pool = ConnectionPool()
+
+	report = DeltaReport(url)
+	try:
+		with span("delta update", "download", url=url) as trace:
+			control = None
+			if os.path.isfile(destination):
+				control, report.control = _control_for(url, destination, controls, pool)
+				report.requests += 1 if control is not None else 0
+
+			if control is None:
+				report.fallback = "no control file" if os.path.isfile(destination) else "nothing to update"
+			else:
+				report.length = control.length
+				sources = _Sources([url, *mirrors], failed)
+				try:
+					_delta(url, destination, control, pool, sources, workers, stall_timeout,
+						minimum_rate, report)
+				except (OSError, DownloadError, DeltaError) as error:
+					report.fallback = str(error)
+
+			if report.fallback is not None:
+				os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+				mode = os.stat(destination).st_mode & 0o7777 if os.path.isfile(destination) else None
+				# NOTE: with a SHA-1 to check, the download only replaces
+				#       destination once it matches.
+				checked = control is not None and control.sha1 is not None
+				target = f"{destination}.new" if checked else destination
+				resource = download(url, target, pool=pool, mirrors=mirrors, failed=failed,
+					stall_timeout=stall_timeout)
+				if checked and _sha1(target) != control.sha1.lower():
+					os.remove(target)
+					raise DeltaError(f"{url} doesn't match the SHA-1 in its control file.")
+				if mode is not None: os.chmod(target, mode)
+				if checked: os.replace(target, destination)
+				report.length = report.fetched = resource.size or os.path.getsize(destination)
+				report.reused = 0
+
+			trace.set(**report.to_dict())
+
+		return report
+	finally:
+		if owns_pool: pool.close()
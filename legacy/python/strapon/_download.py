@@ -0,0 +1,474 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._trace import span
+
+# standard imports
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from urllib.parse import urlsplit, urljoin
+from threading import Lock, RLock
+import os, json
+
+
+
+__all__ = [
+	"DownloadError",
+	"ConnectionPool",
+	"RemoteResource",
+	"probe",
+	"probe_first",
+	"download",
+	"stream",
+]
+
+
+CHUNK_SIZE = 1 << 16
+# Files smaller than this aren't worth splitting into ranged segments.
+MINIMUM_SEGMENT_SIZE = 8 << 20
+DEFAULT_SEGMENTS = 4
+MAXIMUM_REDIRECTS = 8
+# Partial state is flushed to disk every time this many bytes arrive.
+CHECKPOINT_INTERVAL = 4 << 20
+# Seconds without a byte before a mirror counts as stalled.
+STALL_TIMEOUT = 15
+
+
+class DownloadError(Exception): pass
+
+
+class ConnectionPool():
+	"""Keeps idle HTTP connections alive per host so segments reuse them."""
+
+	def __init__(self, timeout=30):
+		self.timeout = timeout
+		self._idle = {}
+		self._lock = Lock()
+
+	def acquire(self, scheme, netloc):
+		with self._lock:
+			idle = self._idle.get((scheme, netloc))
+			if idle:
+				return idle.pop()
+
+		return self._connect(scheme, netloc)
+
+	def _connect(self, scheme, netloc):
+		if scheme == "https":
+			return HTTPSConnection(netloc, timeout=self.timeout)
+		elif scheme == "http":
+			return HTTPConnection(netloc, timeout=self.timeout)
+
+		raise DownloadError(f"Unsupported URL scheme '{scheme}'.")
+
+	def release(self, scheme, netloc, connection):
+		with self._lock:
+			self._idle.setdefault((scheme, netloc), []).append(connection)
+
+	def request(self, method, url, headers={}):
+		"""Returns (connection, response); the body must be read before the
+		connection is handed back with release()."""
+		url = urlsplit(url)
+		path = url.path or "/"
+		if url.query: path = f"{path}?{url.query}"
+
+		connection = self.acquire(url.scheme, url.netloc)
+		try:
+			connection.request(method, path, headers=headers)
+			return connection, connection.getresponse()
+		except (OSError, HTTPException):
+			# NOTE: a kept alive connection may have been closed by the server
+			#       while idle, retry once on a fresh one.
+			connection.close()
+			connection = self._connect(url.scheme, url.netloc)
+			connection.request(method, path, headers=headers)
+			return connection, connection.getresponse()
+
+	def close(self):
+		with self._lock:
+			for idle in self._idle.values():
+				for connection in idle: connection.close()
+
+			self._idle.clear()
+
+
+class RemoteResource():
+	"""What a HEAD request told us about a URL, after following redirects."""
+
+	def __init__(self, url, size=None, accepts_ranges=False, etag=None, last_modified=None):
+		self.url = url
+		self.size = size
+		self.accepts_ranges = accepts_ranges
+		self.etag = etag
+		self.last_modified = last_modified
+
+	@property
+	def validator(self):
+		return self.etag or self.last_modified
+
+
+def probe(url, pool):
+	for _ in range(MAXIMUM_REDIRECTS):
+		connection, response = pool.request("HEAD", url)
+		response.read()
+		split = urlsplit(url)
+		pool.release(split.scheme, split.netloc, connection)
+
+		if response.status in (301, 302, 303, 307, 308):
+			url = urljoin(url, response.getheader("Location"))
+			continue
+		elif response.status >= 400:
+			raise DownloadError(f"HEAD {url} failed with {response.status} {response.reason}.")
+
+		length = response.getheader("Content-Length")
+		return RemoteResource(url,
+			size=int(length) if length is not None else None,
+			accepts_ranges=response.getheader("Accept-Ranges", "none").lower() == "bytes",
+			etag=response.getheader("ETag"),
+			last_modified=response.getheader("Last-Modified"),
+		)
+
+	raise DownloadError(f"Too many redirects fetching {url}.")
+
+
+class _Sources():
+	"""Equivalent URLs for one file in order of preference. Segments move on
+	to the next one whenever a mirror errors or stalls."""
+
+	def __init__(self, urls, failed=None):
+		self.urls = list(dict.fromkeys(urls))
+		self.failed = failed
+		self.errors = []
+		self._lock = Lock()
+
+	def current(self):
+		with self._lock:
+			if self.urls:
+				return self.urls[0]
+			elif len(self.errors) == 1:
+				raise self.errors[0][1]
+
+			raise DownloadError("Every mirror failed:\n" +
+				"\n".join(f"  {url}: {error}" for url, error in self.errors))
+
+	def fail(self, url, error):
+		with self._lock:
+			if not url in self.urls:
+				return
+
+			self.urls.remove(url)
+			self.errors.append((url, error))
+
+		if self.failed is not None: self.failed(url, error)
+
+	def resolve(self, url, resolved):
+		"""Swaps url for where it redirected to."""
+		with self._lock:
+			self.urls = list(dict.fromkeys(resolved if u == url else u for u in self.urls))
+
+
+# NOTE: anything the network or a misbehaving mirror can throw at us.
+_mirror_errors = (OSError, HTTPException, DownloadError)
+
+
+def _probe_sources(sources, pool):
+	while True:
+		url = sources.current()
+		try:
+			resource = probe(url, pool)
+		except _mirror_errors as error:
+			sources.fail(url, error)
+			continue
+
+		sources.resolve(url, resource.url)
+		return resource
+
+
+def probe_first(urls, pool, failed=None):
+	"""probe() the first of several equivalent URLs that answers."""
+	return _probe_sources(_Sources(urls, failed), pool)
+
+
+class _PartialDownload():
+	"""Segment bookkeeping for <destination>.part, persisted beside it as
+	<destination>.part.json so an interrupted download can resume."""
+
+	def __init__(self, destination, resource, segments, resume=True):
+		self.path = f"{destination}.part"
+		self.state_path = f"{self.path}.json"
+		self.resource = resource
+		self._lock = RLock()
+		self._unsaved = 0
+
+		state = self._load() if resume else None
+		if state is not None:
+			self.segments = state["segments"]
+		else:
+			self.segments = self._split(resource.size, segments)
+			with open(self.path, "wb") as file:
+				if resource.size is not None: file.truncate(resource.size)
+
+	def _load(self):
+		try:
+			with open(self.state_path, "rt") as file:
+				state = json.load(file)
+		except (OSError, ValueError):
+			return None
+
+		# Only resume if we're provably looking at the same remote file.
+		if state.get("url") != self.resource.url or \
+			state.get("size") != self.resource.size or \
+			state.get("validator") != self.resource.validator or \
+			not os.path.exists(self.path):
+			return None
+
+		return state
+
+	@staticmethod
+	def _split(size, count):
+		if size is None:
+			return [[0, None, 0]]
+		elif size == 0:
+			return [[0, 0, 0]]
+
+		step = -(-size // count)
+		return [[start, min(start + step, size), 0] for start in range(0, size, step)]
+
+	def advance(self, segment, length):
+		with self._lock:
+			segment[2] += length
+			self._unsaved += length
+			if self._unsaved >= CHECKPOINT_INTERVAL:
+				self.save()
+
+	def save(self):
+		with self._lock:
+			self._unsaved = 0
+			with open(self.state_path, "wt") as file:
+				json.dump({
+					"url": self.resource.url,
+					"size": self.resource.size,
+					"validator": self.resource.validator,
+					"segments": self.segments,
+				}, file)
+
+	def pending(self):
+		return [s for s in self.segments if s[1] is None or s[0] + s[2] < s[1]]
+
+	def restart(self, segment):
+		with self._lock:
+			segment[2] = 0
+
+	def finish(self, destination):
+		os.replace(self.path, destination)
+		try:
+			os.remove(self.state_path)
+		except FileNotFoundError:
+			pass
+
+
+def _fetch_segment_from(pool, partial, segment, ranged, url, stall_timeout):
+	split = urlsplit(url)
+	start, end, done = segment
+
+	headers = {}
+	if ranged:
+		headers["Range"] = f"bytes={start + done}-{end - 1}"
+
+	connection, response = pool.request("GET", url, headers)
+	try:
+		if ranged and response.status != 206:
+			raise DownloadError(f"{url} ignored the range request ({response.status}).")
+		elif response.status >= 400:
+			raise DownloadError(f"GET {url} failed with {response.status} {response.reason}.")
+		elif ranged and not response.getheader("Content-Range", "").endswith(f"/{partial.resource.size}"):
+			# A mirror which is out of sync has a different file under the same name.
+			raise DownloadError(f"{url} doesn't have the same file ({response.getheader('Content-Range')}).")
+
+		# NOTE: reads raise a timeout once the mirror goes quiet this long.
+		if connection.sock is not None: connection.sock.settimeout(stall_timeout)
+
+		with open(partial.path, "r+b") as file:
+			file.seek(start + done)
+			while True:
+				chunk = response.read(CHUNK_SIZE)
+				if not chunk: break
+				file.write(chunk)
+				partial.advance(segment, len(chunk))
+
+			# An earlier mirror may have streamed further before failing.
+			if not ranged: file.truncate()
+
+		# NOTE: http.client hands back b"" rather than raising when a body
+		#       stops short of its Content-Length.
+		if end is not None and start + segment[2] != end:
+			raise DownloadError(f"{url} sent {segment[2]} of segment {start}-{end}'s {end - start} bytes.")
+	except BaseException:
+		connection.close()
+		raise
+
+	pool.release(split.scheme, split.netloc, connection)
+
+
+def _fetch_segment(pool, partial, segment, ranged, sources, stall_timeout):
+	while True:
+		url = sources.current()
+		try:
+			return _fetch_segment_from(pool, partial, segment, ranged, url, stall_timeout)
+		except _mirror_errors as error:
+			sources.fail(url, error)
+			# NOTE: ranged segments resume where the last mirror stopped.
+			if not ranged: partial.restart(segment)
+
+
+def download(url, destination, segments=DEFAULT_SEGMENTS, pool=None, workers=None,
+		mirrors=(), failed=None, stall_timeout=STALL_TIMEOUT):
+	"""Downloads url into destination, returning its RemoteResource.
+
+	Large files on servers that accept byte ranges are fetched as concurrent
+	segments, everything else as a single stream. Progress is kept in
+	<destination>.part(.json) until the download completes, so rerunning
+	after an interruption only fetches what's missing.
+
+	mirrors are equivalent URLs to fail over to, in order, when a request
+	errors or no data arrives for stall_timeout seconds; failed(url, error)
+	hears about each one given up on. See _mirrors.py
+	"""
+	owns_pool = pool is None
+	if owns_pool: pool = ConnectionPool()
+
+	try:
+		sources = _Sources([url, *mirrors], failed)
+		resource = _probe_sources(sources, pool)
+		# NOTE: an empty file has no byte range to ask for.
+		ranged = resource.accepts_ranges and bool(resource.size)
+		if not ranged or resource.size < MINIMUM_SEGMENT_SIZE * 2:
+			segments = 1
+
+		# NOTE: without ranges we can't pick up where we left off.
+		partial = _PartialDownload(destination, resource, segments, resume=ranged)
+		resumed = sum(s[2] for s in partial.segments)
+
+		with span("download", "download", url=resource.url, segments=len(partial.segments)) as trace:
+			try:
+				pending = partial.pending()
+				if len(pending) == 1:
+					_fetch_segment(pool, partial, pending[0], ranged, sources, stall_timeout)
+				elif pending:
+					with ThreadPoolExecutor(max_workers=workers or len(pending)) as executor:
+						jobs = [executor.submit(_fetch_segment, pool, partial, segment, ranged,
+							sources, stall_timeout) for segment in pending]
+						for job in jobs: job.result()
+			finally:
+				if ranged: partial.save()
+				trace.set(bytes=sum(s[2] for s in partial.segments) - resumed, resumed=resumed,
+					failovers=len(sources.errors))
+
+		partial.finish(destination)
+		return resource
+	finally:
+		if owns_pool: pool.close()
+
+
+class _ConsumerError(Exception):
+	"""Carries an error raised by stream()'s write() past the failover."""
+
+	def __init__(self, error):
+		Exception.__init__(self, error)
+		self.error = error
+
+
+def _stream_from(pool, url, write, position, size, stall_timeout):
+	split = urlsplit(url)
+	headers = {"Range": f"bytes={position[0]}-"} if position[0] else {}
+	connection, response = pool.request("GET", url, headers)
+	try:
+		if response.status >= 400:
+			raise DownloadError(f"GET {url} failed with {response.status} {response.reason}.")
+
+		# NOTE: a mirror which ignores the range gets its first bytes skipped.
+		skip = position[0] if response.status != 206 else 0
+		if connection.sock is not None: connection.sock.settimeout(stall_timeout)
+
+		while True:
+			chunk = response.read(CHUNK_SIZE)
+			if not chunk: break
+			if skip:
+				chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+				if not chunk: continue
+
+			try:
+				write(chunk)
+			except BaseException as error:
+				raise _ConsumerError(error)
+
+			position[0] += len(chunk)
+
+		if size is not None and position[0] != size:
+			raise DownloadError(f"{url} sent {position[0]} of {size} bytes.")
+	except BaseException:
+		connection.close()
+		raise
+
+	pool.release(split.scheme, split.netloc, connection)
+
+
+def stream(url, write, pool=None, mirrors=(), failed=None, stall_timeout=STALL_TIMEOUT):
+	"""GETs url front to back, calling write(chunk) as bytes arrive, for
+	consumers which start work before the download ends. Returns its
+	RemoteResource.
+
+	Failing over to a mirror continues from the byte the last one stopped
+	at, so write() never sees anything twice. Errors raised by write()
+	are the caller's, and are passed straight through.
+	"""
+	owns_pool = pool is None
+	if owns_pool: pool = ConnectionPool()
+
+	try:
+		sources = _Sources([url, *mirrors], failed)
+		resource = _probe_sources(sources, pool)
+		position = [0]
+		with span("download", "download", url=resource.url, streamed=True) as trace:
+			try:
+				while True:
+					url = sources.current()
+					try:
+						_stream_from(pool, url, write, position, resource.size, stall_timeout)
+						break
+					except _ConsumerError as error:
+						raise error.error from None
+					except _mirror_errors as error:
+						sources.fail(url, error)
+			finally:
+				trace.set(bytes=position[0], failovers=len(sources.errors))
+
+		if resource.size is not None and position[0] != resource.size:
+			raise DownloadError(f"{resource.url} ended after {position[0]} of {resource.size} bytes.")
+
+		return resource
+	finally:
+		if owns_pool: pool.close()
@@ -0,0 +1,151 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._versions import compile_constraint
+
+# standard imports
+import os, re, mmap
+
+
+
+__all__ = [
+	"DpkgStatus",
+	"get_dpkg_status",
+	"plan_changes",
+]
+
+
+DEFAULT_STATUS_PATH = "/var/lib/dpkg/status"
+
+# dpkg status words (the last word of "Status:") for packages whose files are
+# on disk, and for packages with anything at all left behind.
+_PRESENT = frozenset(("installed", "half-configured", "unpacked", "triggers-awaited", "triggers-pending"))
+_LEFTOVER = _PRESENT | {"half-installed", "config-files"}
+
+_package_pattern = re.compile(rb"^Package: ([^\s]+)$", re.M)
+
+# path -> DpkgStatus, shared by every installer in the process.
+_indexes = {}
+
+
+def _field(view, name, start, end):
+	offset = view.find(name, start, end)
+	if offset < 0:
+		return None
+
+	offset += len(name)
+	stop = view.find(b"\n", offset, end)
+	return view[offset:stop if stop >= 0 else end].decode().strip()
+
+
+class DpkgStatus():
+	"""A name -> (version, status) table of the dpkg database, parsed through
+	mmap and only re-parsed when the status file's mtime or size changes."""
+
+	def __init__(self, path=DEFAULT_STATUS_PATH):
+		self.path = path
+		self._stamp = None
+		self._table = {}
+
+	@property
+	def table(self):
+		try:
+			stat = os.stat(self.path)
+			stamp = (stat.st_mtime_ns, stat.st_size)
+		except FileNotFoundError:
+			stamp = None
+
+		if stamp != self._stamp:
+			self._table = self._parse() if stamp is not None else {}
+			self._stamp = stamp
+
+		return self._table
+
+	def _parse(self):
+		table = {}
+		with open(self.path, "rb") as file:
+			if os.fstat(file.fileno()).st_size == 0:
+				return table
+
+			with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+				for match in _package_pattern.finditer(view):
+					start = match.start()
+					end = view.find(b"\n\n", start)
+					if end < 0: end = len(view)
+
+					status = _field(view, b"\nStatus: ", start, end)
+					entry = (
+						_field(view, b"\nVersion: ", start, end),
+						status.rsplit(" ", 1)[-1] if status else "not-installed",
+					)
+					name = match.group(1).decode()
+					architecture = _field(view, b"\nArchitecture: ", start, end)
+
+					# NOTE: multiarch packages are also reachable as name:arch.
+					if architecture is not None:
+						table[f"{name}:{architecture}"] = entry
+					if not name in table or entry[1] in _PRESENT:
+						table[name] = entry
+
+		return table
+
+	def get(self, name):
+		"""Returns (version, status word), or None for unknown packages."""
+		return self.table.get(name)
+
+	def is_installed(self, name):
+		entry = self.table.get(name)
+		return entry is not None and entry[1] == "installed"
+
+	def satisfying(self, constraint, packages):
+		"""Returns the packages installed at a version matching constraint."""
+		constraint = compile_constraint(constraint)
+		table = self.table
+		return [p for p in packages if p in table and table[p][1] == "installed"
+			and constraint.matches(table[p][0])]
+
+
+def get_dpkg_status(path=DEFAULT_STATUS_PATH):
+	index = _indexes.get(path)
+	if index is None:
+		index = _indexes[path] = DpkgStatus(path)
+
+	return index
+
+
+def plan_changes(status, action, packages):
+	"""Returns the subset of packages the action would actually change."""
+	table = status.table
+	def state(package): return table.get(package, (None, "not-installed"))[1]
+
+	if action == "install":
+		return [p for p in packages if state(p) != "installed"]
+	elif action == "remove":
+		return [p for p in packages if state(p) in _PRESENT]
+	elif action == "purge":
+		return [p for p in packages if state(p) in _LEFTOVER]
+
+	raise ValueError(f"Unknown action '{action}'.")
@@ -0,0 +1,629 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._trace import span
+
+# standard imports
+from threading import Thread, Condition
+from collections import deque
+import os, bz2, lzma, zlib, stat, shutil, struct, tarfile, subprocess
+
+
+
+__all__ = [
+	"ExtractError",
+	"parse_type",
+	"detect_compression",
+	"detect_container",
+	"extract",
+	"extract_file",
+	"extract_url",
+]
+
+
+CHUNK_SIZE = 1 << 16
+# Bytes allowed in flight between the download and the extraction, so a
+# slow disk pushes back on the network rather than filling memory.
+PIPE_CAPACITY = 16 << 20
+
+
+class ExtractError(Exception): pass
+
+
+# TYPES
+# NOTE: a type is (compression, container); None in either means detect it.
+
+_compressions = ("gz", "xz", "zst", "bz2")
+_containers = ("tar", "zip", "appimage", "file")
+_aliases = {
+	"tgz": ("gz", "tar"), "txz": ("xz", "tar"), "tzst": ("zst", "tar"),
+	"tbz": ("bz2", "tar"), "tbz2": ("bz2", "tar"), "zstd": ("zst", "file"),
+	"gzip": ("gz", "file"), "bzip2": ("bz2", "file"),
+}
+
+_compression_magic = (
+	(b"\xfd7zXZ\x00", "xz"),
+	(b"\x28\xb5\x2f\xfd", "zst"),
+	(b"\x1f\x8b", "gz"),
+	(b"BZh", "bz2"),
+)
+
+
+def parse_type(type):
+	"""(compression, container) for a WebInstaller type like "tar.xz",
+	"zip" or "AppImage". None leaves both to detection."""
+	if type is None:
+		return None, None
+
+	type = type.lower().lstrip(".")
+	if type in _aliases:
+		return _aliases[type]
+
+	parts = type.split(".")
+	compression = parts[-1] if parts[-1] in _compressions else None
+	container = parts[0] if parts[0] in _containers else None
+	if container is None and compression is None:
+		raise ExtractError(f"Unknown archive type '{type}'.")
+
+	return compression, container or ("file" if len(parts) == 1 else None)
+
+
+def detect_compression(head):
+	"""The compression the first bytes of a file are in, or None."""
+	for magic, compression in _compression_magic:
+		if head.startswith(magic):
+			return compression
+
+	return None
+
+
+def detect_container(head):
+	"""What the first 512 (uncompressed) bytes of a file hold."""
+	if head[257:262] == b"ustar":
+		return "tar"
+	elif head.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+		return "zip"
+	elif head.startswith(b"\x7fELF") and head[8:10] == b"AI":
+		return "appimage"
+
+	return "file"
+
+
+# STREAMS
+
+class _Pipe():
+	"""A bounded in-memory byte pipe between a producer thread and a reader."""
+
+	def __init__(self, capacity=PIPE_CAPACITY):
+		self.capacity = capacity
+		self._chunks = deque()
+		self._size = 0
+		self._closed = False
+		self._error = None
+		self._aborted = None
+		self._condition = Condition()
+
+	def write(self, chunk):
+		with self._condition:
+			while self._size >= self.capacity and self._aborted is None:
+				self._condition.wait()
+
+			if self._aborted is not None:
+				raise ExtractError(f"Extraction stopped: {self._aborted}")
+
+			self._chunks.append(chunk)
+			self._size += len(chunk)
+			self._condition.notify_all()
+
+	def close(self, error=None):
+		"""Ends the stream; readers see error (if any) once it's drained."""
+		with self._condition:
+			self._closed = True
+			self._error = error
+			self._condition.notify_all()
+
+	def abort(self, error):
+		"""The reader gave up, so the producer should too."""
+		with self._condition:
+			self._aborted = error
+			self._condition.notify_all()
+
+	def read(self, size=-1):
+		with self._condition:
+			while not self._chunks and not self._closed:
+				self._condition.wait()
+
+			if not self._chunks:
+				if self._error is not None: raise self._error
+				return b""
+
+			chunk = self._chunks.popleft()
+			if 0 <= size < len(chunk):
+				self._chunks.appendleft(chunk[size:])
+				chunk = chunk[:size]
+
+			self._size -= len(chunk)
+			self._condition.notify_all()
+			return chunk
+
+
+class _Reader():
+	"""read(n) that returns exactly n bytes unless the stream ends, plus
+	peek() and unread(), over anything with a read()."""
+
+	def __init__(self, raw):
+		self.raw = raw
+		self._buffer = bytearray()
+		self.position = 0
+
+	def _fill(self, size):
+		while len(self._buffer) < size:
+			chunk = self.raw.read(max(CHUNK_SIZE, size - len(self._buffer)))
+			if not chunk: break
+			self._buffer += chunk
+
+	def peek(self, size):
+		self._fill(size)
+		return bytes(self._buffer[:size])
+
+	def read(self, size=-1):
+		if size is None or size < 0:
+			while True:
+				chunk = self.raw.read(CHUNK_SIZE)
+				if not chunk: break
+				self._buffer += chunk
+			size = len(self._buffer)
+
+		self._fill(size)
+		data = bytes(self._buffer[:size])
+		del self._buffer[:size]
+		self.position += len(data)
+		return data
+
+	def unread(self, data):
+		self._buffer[:0] = data
+		self.position -= len(data)
+
+
+class _Decompressed():
+	"""Decompresses a reader in this process, across concatenated streams."""
+
+	_factories = {
+		"gz": lambda : zlib.decompressobj(zlib.MAX_WBITS | 16),
+		"xz": lzma.LZMADecompressor,
+		"bz2": bz2.BZ2Decompressor,
+	}
+
+	def __init__(self, reader, compression):
+		self.reader = reader
+		self.factory = self._factories[compression]
+		self.decompressor = self.factory()
+		self._input = b""
+
+	def read(self, size=CHUNK_SIZE):
+		if size is None or size < 0: size = CHUNK_SIZE
+		while True:
+			if self.decompressor.eof:
+				# NOTE: gzip and xz files may hold several streams back to back.
+				self._input = self.decompressor.unused_data + self._input
+				if not self._input: self._input = self.reader.read(CHUNK_SIZE)
+				if not self._input: return b""
+				self.decompressor = self.factory()
+
+			if not self._input and self._needs_input():
+				self._input = self.reader.read(CHUNK_SIZE)
+				if not self._input:
+					raise ExtractError("The archive ends in the middle of compressed data.")
+
+			data = self._decompress(size)
+			if data:
+				return data
+
+	def _needs_input(self):
+		# NOTE: zlib has no needs_input, it keeps what it didn't use itself.
+		if hasattr(self.decompressor, "needs_input"):
+			return self.decompressor.needs_input
+
+		return not self.decompressor.unconsumed_tail
+
+	def _decompress(self, size):
+		data, self._input = self._input, b""
+		if isinstance(self.decompressor, (lzma.LZMADecompressor, bz2.BZ2Decompressor)):
+			return self.decompressor.decompress(data, max_length=size)
+
+		data = self.decompressor.unconsumed_tail + data
+		return self.decompressor.decompress(data, size)
+
+
+# Decompressors that run alongside us, and in parallel over the blocks of
+# multi-block archives where the tool can (xz 5.4+ with -T0).
+_external = {
+	"xz": (("xz", "-dc", "-T0"),),
+	"zst": (("zstd", "-dcq"),),
+	"gz": (("pigz", "-dc"),),
+	"bz2": (("lbzip2", "-dc"), ("pbzip2", "-dc")),
+}
+
+
+def _external_command(compression):
+	for argv in _external.get(compression, ()):
+		if shutil.which(argv[0]) is not None:
+			return list(argv)
+
+	return None
+
+
+class _ExternalDecompressor():
+	"""Pipes a reader through a decompression command, reading its output."""
+
+	def __init__(self, reader, argv):
+		self.argv = argv
+		self.process = subprocess.Popen(argv, stdin=subprocess.PIPE,
+			stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		self._error = None
+		self._feeder = Thread(target=self._feed, args=(reader,), daemon=True)
+		self._feeder.start()
+
+	def _feed(self, reader):
+		try:
+			while True:
+				chunk = reader.read(CHUNK_SIZE)
+				if not chunk: break
+				self.process.stdin.write(chunk)
+		except BrokenPipeError:
+			pass
+		except BaseException as error:
+			self._error = error
+		finally:
+			try:
+				self.process.stdin.close()
+			except BrokenPipeError:
+				pass
+
+	def read(self, size=CHUNK_SIZE):
+		if size is None or size < 0: size = CHUNK_SIZE
+		return self.process.stdout.read1(size)
+
+	def close(self, check=True):
+		"""Waits for the command, raising whatever went wrong on the way
+		unless check is False."""
+		self.process.stdout.close()
+		self._feeder.join()
+		stderr = self.process.stderr.read().decode(errors="replace").strip()
+		self.process.wait()
+		if not check:
+			return
+		elif self._error is not None:
+			raise self._error
+		elif self.process.returncode != 0:
+			raise ExtractError(f"'{' '.join(self.argv)}' exited with {self.process.returncode}: {stderr}")
+
+
+# CONTAINERS
+
+def _safe_path(staging, name, base=None):
+	"""Where member name goes under staging, refusing anything outside it.
+	Relative names are relative to base, staging itself by default."""
+	path = os.path.normpath(os.path.join(base or staging, name.lstrip("/")))
+	if os.path.isabs(name) or not (path + os.sep).startswith(os.path.join(staging, "")):
+		raise ExtractError(f"Refusing to extract '{name}' outside of the destination.")
+
+	return path
+
+
+def _copy(reader, file, size=None):
+	"""Copies size bytes (or everything) from reader to file."""
+	remaining = size
+	while remaining is None or remaining > 0:
+		chunk = reader.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+		if not chunk:
+			if remaining: raise ExtractError("The archive ends in the middle of a file.")
+			break
+
+		file.write(chunk)
+		if remaining is not None: remaining -= len(chunk)
+
+
+def _extract_tar(reader, staging):
+	# NOTE: "r|" reads members in order without ever seeking back.
+	with tarfile.open(fileobj=reader, mode="r|") as archive:
+		count = 0
+		for member in archive:
+			try:
+				archive.extract(member, staging, filter="data")
+			except tarfile.FilterError as error:
+				raise ExtractError(f"Refusing to extract '{member.name}' outside of the destination "
+					f"({error}).") from error
+			count += 1
+
+	return count
+
+
+_zip_local = struct.Struct("<4sHHHHHIIIHH")
+_zip_central = struct.Struct("<4sHHHHHHIIIHHHHHII")
+
+
+def _zip64_sizes(extra, compressed, uncompressed):
+	position = 0
+	while position + 4 <= len(extra):
+		tag, length = struct.unpack_from("<HH", extra, position)
+		if tag == 0x0001:
+			values = list(struct.unpack_from(f"<{length // 8}Q", extra, position + 4))
+			if uncompressed == 0xFFFFFFFF and values: uncompressed = values.pop(0)
+			if compressed == 0xFFFFFFFF and values: compressed = values.pop(0)
+			return compressed, uncompressed, True
+
+		position += 4 + length
+
+	return compressed, uncompressed, False
+
+
+def _extract_zip(reader, staging):
+	"""Extracts a zip front to back from its local headers, without the
+	central directory at its end (which is only read for permissions)."""
+	modes, count = {}, 0
+	while True:
+		signature = reader.peek(4)
+		if signature == b"PK\x03\x04":
+			count += _extract_zip_member(reader, staging)
+		elif signature == b"PK\x01\x02":
+			fields = _zip_central.unpack(reader.read(_zip_central.size))
+			name_length, extra_length, comment_length, attributes = fields[10], fields[11], fields[12], fields[15]
+			name = reader.read(name_length).decode("utf-8" if fields[3] & 0x800 else "cp437")
+			reader.read(extra_length + comment_length)
+			# NOTE: only archives made on unix (the high byte of "version
+			#       made by") keep a mode here.
+			if fields[1] >> 8 == 3 and attributes >> 16:
+				modes[name] = attributes >> 16
+		else:
+			# The end of central directory records, or nothing at all.
+			reader.read()
+			break
+
+	for name, mode in modes.items():
+		path = _safe_path(staging, name)
+		if stat.S_ISLNK(mode) and os.path.isfile(path):
+			with open(path, "rt") as file:
+				target = file.read()
+			# NOTE: links resolve from their own directory, but may point
+			#       anywhere else inside the tree, eg. bin/node -> ../lib/node
+			_safe_path(staging, target, os.path.dirname(path))
+			os.remove(path)
+			os.symlink(target, path)
+		elif stat.S_ISREG(mode) and os.path.isfile(path):
+			# Like tarfile's data filter: no set-id bits or group/other writes.
+			os.chmod(path, (mode & 0o755) | 0o600)
+
+	return count
+
+
+def _extract_zip_member(reader, staging):
+	fields = _zip_local.unpack(reader.read(_zip_local.size))
+	flags, method, crc, compressed, uncompressed = fields[2], fields[3], fields[6], fields[7], fields[8]
+	name = reader.read(fields[9]).decode("utf-8" if flags & 0x800 else "cp437")
+	compressed, uncompressed, zip64 = _zip64_sizes(reader.read(fields[10]), compressed, uncompressed)
+	described = flags & 0x08
+
+	path = _safe_path(staging, name)
+	if name.endswith("/"):
+		os.makedirs(path, exist_ok=True)
+		return 0
+	elif flags & 0x01:
+		raise ExtractError(f"'{name}' is encrypted.")
+
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	checksum = 0
+	with open(path, "wb") as file:
+		if method == 0:
+			if described:
+				raise ExtractError(f"'{name}' is stored with its size after the data, which can't be streamed.")
+
+			remaining = compressed
+			while remaining:
+				chunk = reader.read(min(CHUNK_SIZE, remaining))
+				if not chunk: raise ExtractError("The archive ends in the middle of a file.")
+				checksum = zlib.crc32(chunk, checksum)
+				file.write(chunk)
+				remaining -= len(chunk)
+		elif method == 8:
+			# NOTE: deflate marks its own end, so a trailing data descriptor
+			#       (unknown sizes) is no obstacle.
+			decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+			remaining = None if described else compressed
+			while not decompressor.eof:
+				chunk = reader.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+				if not chunk: raise ExtractError("The archive ends in the middle of a file.")
+				if remaining is not None: remaining -= len(chunk)
+
+				data = decompressor.decompress(chunk)
+				checksum = zlib.crc32(data, checksum)
+				file.write(data)
+
+			if decompressor.unused_data: reader.unread(decompressor.unused_data)
+		else:
+			raise ExtractError(f"'{name}' uses unsupported zip compression method {method}.")
+
+	if described:
+		if reader.peek(4) == b"PK\x07\x08": reader.read(4)
+		crc = struct.unpack("<I", reader.read(4))[0]
+		reader.read(16 if zip64 else 8)
+
+	if checksum != crc:
+		raise ExtractError(f"'{name}' failed its CRC check.")
+
+	return 1
+
+
+def _extract_file(reader, staging, name, executable):
+	path = os.path.join(staging, name)
+	with open(path, "wb") as file:
+		_copy(reader, file)
+
+	os.chmod(path, 0o755 if executable else 0o644)
+	return 1
+
+
+# PIPELINE
+
+def _unpack(raw, staging, compression=None, container=None, name="file"):
+	"""Unpacks the stream raw into the directory staging, detecting what
+	it holds where compression or container are None. Returns
+	(compression, container, files)."""
+	reader = _Reader(raw)
+	detected = detect_compression(reader.peek(8))
+	if compression is None:
+		compression = detected
+	elif compression != detected:
+		raise ExtractError(f"Expected a {compression} archive, but the data doesn't start like one.")
+
+	external = None
+	if compression is not None:
+		argv = _external_command(compression)
+		if argv is not None:
+			external = _ExternalDecompressor(reader, argv)
+			reader = _Reader(external)
+		elif compression in _Decompressed._factories:
+			reader = _Reader(_Decompressed(reader, compression))
+		else:
+			# NOTE: the standard library has no zstd before 3.14.
+			raise ExtractError("zstd archives need the zstd command.")
+
+	try:
+		if container is None:
+			container = detect_container(reader.peek(512))
+
+		if container == "tar":
+			files = _extract_tar(reader, staging)
+		elif container == "zip":
+			files = _extract_zip(reader, staging)
+		else:
+			files = _extract_file(reader, staging, name, container == "appimage")
+
+		# NOTE: so a compressed stream's trailer (and checksum) is checked.
+		reader.read()
+	except BaseException:
+		# NOTE: stopping early kills the command with SIGPIPE, which mustn't
+		#       hide why we stopped.
+		if external is not None: external.close(check=False)
+		raise
+
+	if external is not None: external.close()
+
+	return compression, container, files
+
+
+def _file_name(url, compression):
+	name = os.path.basename(url.split("?", 1)[0]) or "file"
+	if compression is not None and name.endswith(f".{compression}"):
+		name = name[:-len(compression) - 1]
+
+	return name
+
+
+def _install(staging, destination, single):
+	"""Moves a finished staging directory (or its one file) into place."""
+	if single:
+		(name,) = os.listdir(staging)
+		os.replace(os.path.join(staging, name), destination)
+		os.rmdir(staging)
+		return
+
+	previous = None
+	if os.path.lexists(destination):
+		previous = f"{destination}.{os.getpid()}.old"
+		os.replace(destination, previous)
+
+	os.replace(staging, destination)
+	if previous is not None: shutil.rmtree(previous, ignore_errors=True)
+
+
+def extract(raw, destination, type=None, name="file"):
+	"""Unpacks the readable stream raw (anything with read()) at destination.
+
+	Archives (tar, zip, optionally gz/xz/zst/bz2 compressed) become the
+	directory destination, single files (AppImages, compressed files)
+	become the file destination. Either way everything is written once,
+	into a staging directory beside destination which then replaces it.
+	"""
+	compression, container = parse_type(type)
+	staging = f"{destination}.{os.getpid()}.staging"
+	os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+	shutil.rmtree(staging, ignore_errors=True)
+	os.makedirs(staging)
+
+	try:
+		with span("extract", "extract", destination=destination) as trace:
+			compression, container, files = _unpack(raw, staging, compression, container, name)
+			trace.set(compression=compression, container=container, files=files)
+
+		_install(staging, destination, container in ("file", "appimage"))
+	except BaseException:
+		shutil.rmtree(staging, ignore_errors=True)
+		raise
+
+	return container
+
+
+def extract_file(path, destination, type=None):
+	"""extract() for an archive already on disk, eg. in the artifact cache."""
+	with open(path, "rb") as file:
+		compression = parse_type(type)[0] or detect_compression(file.read(8))
+		file.seek(0)
+		return extract(file, destination, type, _file_name(path, compression))
+
+
+def extract_url(url, destination, type=None, **kwargs):
+	"""Downloads and extracts url at the same time; bytes are decompressed
+	and unpacked as they arrive instead of landing in a temporary archive.
+	Takes stream()'s options (mirrors, failed, ...), see _download.py"""
+	from ._download import stream
+
+	pipe = _Pipe()
+	result = {}
+	def unpack():
+		try:
+			result["container"] = extract(pipe, destination, type, _file_name(url, parse_type(type)[0]))
+		except BaseException as error:
+			result["error"] = error
+			pipe.abort(error)
+
+	worker = Thread(target=unpack, daemon=True)
+	worker.start()
+	try:
+		stream(url, pipe.write, **kwargs)
+		pipe.close()
+	except BaseException as error:
+		pipe.close(error)
+		worker.join()
+		# NOTE: when extraction failed first, that's the interesting error.
+		if "error" in result and isinstance(error, ExtractError): raise result["error"]
+		raise
+
+	worker.join()
+	if "error" in result:
+		raise result["error"]
+
+	return result["container"]
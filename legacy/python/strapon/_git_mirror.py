@@ -0,0 +1,126 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._runtime import Command
+from ._large_functions import get_cache_directory
+
+# standard imports
+from urllib.parse import urlsplit
+import os, fcntl, hashlib
+
+
+
+__all__ = [
+	"GitMirror",
+	"CHECKOUT_MODES",
+]
+
+
+# mirror:   shared clone of a local bare mirror, which is fetched incrementally.
+# shallow:  one-off `--depth` clone straight from upstream.
+# blobless: one-off `--filter=blob:none` clone straight from upstream.
+CHECKOUT_MODES = ("mirror", "shallow", "blobless")
+
+
+class GitMirror():
+	"""A bare mirror of a remote repository kept in the strapon cache, which
+	source builds clone from instead of the network."""
+
+	def __init__(self, url, root=None):
+		if root is None: root = get_cache_directory("git")
+
+		self.url = url
+		name = os.path.basename(urlsplit(url).path.rstrip("/")) or "repository"
+		if not name.endswith(".git"): name = f"{name}.git"
+		digest = hashlib.sha256(url.encode()).hexdigest()[:16]
+		self.path = os.path.join(root, f"{digest}-{name}")
+		self._git = Command("git")
+		self._updated = False
+
+	def update(self, force=False):
+		"""Creates the mirror, or fetches only what's new into it. Only the
+		first call in a process touches the network unless forced."""
+		if self._updated and not force:
+			return self.path
+
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		with open(f"{self.path}.lock", "a") as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+
+			if os.path.isdir(self.path):
+				self._git("-C", self.path, "fetch", "--prune", "--tags", "origin")
+			else:
+				self._git("clone", "--mirror", self.url, self.path)
+				# NOTE: shared clones borrow objects from the mirror, so it
+				#       must never drop unreachable ones out from under them.
+				self._git("-C", self.path, "config", "gc.pruneExpire", "never")
+				self._git("-C", self.path, "config", "gc.reflogExpireUnreachable", "never")
+
+		self._updated = True
+		return self.path
+
+	def checkout(self, destination, branch=None, mode="mirror", depth=1):
+		"""Produces a working tree of branch (or the default branch) at
+		destination, reusing an existing checkout there when possible."""
+		if not mode in CHECKOUT_MODES:
+			raise ValueError(f"Unknown checkout mode '{mode}', expected one of {CHECKOUT_MODES}.")
+
+		if mode == "mirror":
+			return self._checkout_mirror(destination, branch)
+
+		arguments = ["clone", "--single-branch"]
+		if branch is not None: arguments += ["--branch", branch]
+		if mode == "shallow":
+			arguments += ["--depth", str(depth)]
+		else:
+			arguments += ["--filter=blob:none"]
+
+		# NOTE: plain local paths ignore --depth and --filter, file:// doesn't.
+		url = self.url
+		if os.path.isdir(url): url = f"file://{os.path.abspath(url)}"
+
+		self._git(*arguments, url, destination)
+		return destination
+
+	def _checkout_mirror(self, destination, branch):
+		self.update()
+
+		if os.path.isdir(os.path.join(destination, ".git")):
+			self._git("-C", destination, "fetch", "--prune", "mirror")
+		else:
+			arguments = ["clone", "--shared", "--origin", "mirror"]
+			if branch is not None: arguments += ["--branch", branch]
+			self._git(*arguments, self.path, destination)
+			# Keep upstream reachable for anyone working in the tree later.
+			self._git("-C", destination, "remote", "add", "origin", self.url)
+
+		if branch is None:
+			ref = str(self._git("-C", self.path, "symbolic-ref", "--short", "HEAD")).strip()
+		else:
+			ref = branch
+
+		self._git("-C", destination, "checkout", "--force", "-B", ref, f"mirror/{ref}")
+		return destination
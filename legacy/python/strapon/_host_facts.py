@@ -0,0 +1,220 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._versions import compile_constraint
+
+# standard imports
+import os, shlex
+
+
+
+__all__ = [
+	"HostFacts",
+	"get_host_facts",
+	"set_host_facts",
+	"get_target_root",
+	"set_target_root",
+	"read_os_release",
+]
+
+
+# os-release keys, and the HostFacts slot each one is stored in.
+_os_release_keys = {
+	"NAME": "name",
+	"VERSION": "version",
+	"VERSION_ID": "version_id",
+	"VERSION_CODENAME": "version_codename",
+	"ID": "id",
+	"ID_LIKE": "id_like",
+	"UBUNTU_CODENAME": "ubuntu_codename",
+	# Not part of os-release, lets fixture files pin the architecture too.
+	"CPU": "cpu",
+}
+
+# Points at a fixture file to simulate another host, see HostFacts.load()
+FIXTURE_VARIABLE = "STRAPON_HOST_FACTS"
+# The root filesystem being provisioned (a chroot, container rootfs, ...).
+# NOTE: kept in the environment so worker processes inherit it.
+ROOT_VARIABLE = "STRAPON_ROOT"
+
+_host_facts = None
+
+
+def read_os_release(path="/etc/os-release"):
+	values = {}
+	with open(path, "rt") as file:
+		for line in file:
+			line = line.strip()
+			if not line or line.startswith("#") or not "=" in line:
+				continue
+
+			assignment_trigger = line.index("=", 1)
+			# use shlex to parse string since it implements basic posix shell
+			value = shlex.split(line[assignment_trigger+1:])
+			values[line[:assignment_trigger]] = value[0] if value else ""
+
+	return values
+
+
+class HostFacts():
+	"""An immutable snapshot of the host OS, with memoized matching helpers."""
+
+	__slots__ = (*_os_release_keys.values(), "os_ids", "precedence", "_memo")
+
+	def __init__(self, **facts):
+		setter = object.__setattr__
+		for slot in _os_release_keys.values():
+			setter(self, slot, facts.get(slot))
+
+		id_like = facts.get("id_like") or ()
+		if isinstance(id_like, str): id_like = id_like.split()
+		setter(self, "id_like", tuple(id_like))
+
+		if self.cpu is None:
+			# NOTE: platform.processor() shells out to `uname -p` on Linux,
+			#       os.uname() is the syscall platform.machine() wraps.
+			setter(self, "cpu", os.uname().machine)
+
+		os_ids = (self.id, *self.id_like) if self.id else self.id_like
+		setter(self, "os_ids", os_ids)
+		# The most specific distribution comes first, so has the lowest rank.
+		precedence = {}
+		for rank, id in enumerate(os_ids): precedence.setdefault(id, rank)
+		setter(self, "precedence", precedence)
+		setter(self, "_memo", {})
+
+	def __setattr__(self, name, value):
+		raise AttributeError(f"'{type(self).__name__}' is immutable.")
+
+	def __delattr__(self, name):
+		raise AttributeError(f"'{type(self).__name__}' is immutable.")
+
+	def __repr__(self):
+		return f"HostFacts(id={self.id!r}, version_id={self.version_id!r}, cpu={self.cpu!r})"
+
+	@classmethod
+	def from_os_release(cls, values, cpu=None):
+		facts = {slot: values[key] for key, slot in _os_release_keys.items() if key in values}
+		if cpu is not None: facts["cpu"] = cpu
+		return cls(**facts)
+
+	@classmethod
+	def load(cls, path):
+		"""Reads facts from an os-release formatted fixture file."""
+		return cls.from_os_release(read_os_release(path))
+
+	@classmethod
+	def detect(cls, root="/"):
+		# NOTE: prefer variables the shell exported from os-release, since
+		#       that's how we're normally run; but they describe the host.
+		if root == "/" and "ID" in os.environ and "NAME" in os.environ:
+			return cls.from_os_release(os.environ)
+
+		# os-release(5): /etc/os-release, falling back to /usr/lib/os-release
+		path = os.path.join(root, "etc/os-release")
+		if root != "/" and not os.path.exists(path):
+			path = os.path.join(root, "usr/lib/os-release")
+
+		return cls.load(path)
+
+	def key(self):
+		"""Everything matching can depend on, eg. for cache keys."""
+		return (self.id, list(self.id_like), self.version_id, self.version_codename,
+			self.ubuntu_codename, self.cpu)
+
+	def rank(self, os_id):
+		"""Precedence of an OS id; lower is more specific, unknowns come last."""
+		return self.precedence.get(os_id, len(self.os_ids))
+
+	def _memoize(self, key, compute):
+		try:
+			return self._memo[key]
+		except KeyError:
+			result = self._memo[key] = compute()
+			return result
+
+	def matching_OS(self, *targets):
+		return self._memoize(("os", targets),
+			lambda : any(id in self.precedence for id in targets))
+
+	def matching_CPU(self, *cpu_arch_list):
+		return self._memoize(("cpu", cpu_arch_list), lambda : self.cpu in cpu_arch_list)
+
+	def matching_VERSION(self, *version_list):
+		"""True when the host version satisfies any of the constraints, which
+		take the forms _versions.Constraint understands, eg. "<=2" or "focal"."""
+		def compute():
+			# NOTE: rolling releases (eg. Debian sid) only have a codename.
+			versions = [self.version_id] if self.version_id else \
+				[v for v in (self.version_codename, self.ubuntu_codename) if v]
+			return any(compile_constraint(c).matches(v) for c in version_list for v in versions)
+
+		return self._memoize(("version", version_list), compute)
+
+	def matching_ALL(self, os_name=None, os_version=None, cpu=None):
+		def compute():
+			if os_name is not None and not self.matching_OS(os_name): return False
+			if os_version is not None and not self.matching_VERSION(os_version): return False
+			if cpu is not None and not self.matching_CPU(cpu): return False
+			return True
+
+		return self._memoize(("all", os_name, os_version, cpu), compute)
+
+
+def get_host_facts():
+	"""The facts for this process' target root; built on first use and then
+	reused."""
+	global _host_facts
+	if _host_facts is None:
+		fixture = os.environ.get(FIXTURE_VARIABLE)
+		_host_facts = HostFacts.load(fixture) if fixture else HostFacts.detect(get_target_root())
+
+	return _host_facts
+
+
+def set_host_facts(facts):
+	"""Replaces the process host facts, for tests and benchmarks."""
+	global _host_facts
+	_host_facts = facts
+
+
+def get_target_root():
+	"""The root filesystem installers act on, "/" unless one was chosen."""
+	return os.path.abspath(os.environ.get(ROOT_VARIABLE) or "/")
+
+
+def set_target_root(root):
+	"""Points this process (and processes it starts) at another root
+	filesystem. Only affects installers and facts created afterwards."""
+	global _host_facts
+	root = os.path.abspath(root or "/")
+	if root == "/":
+		os.environ.pop(ROOT_VARIABLE, None)
+	else:
+		os.environ[ROOT_VARIABLE] = root
+
+	_host_facts = None
+	return root
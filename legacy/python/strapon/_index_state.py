@@ -0,0 +1,190 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._large_functions import get_installer_source_lists, get_cache_directory
+
+# standard imports
+import os, json, time, fcntl, tempfile
+
+
+
+__all__ = [
+	"IndexState",
+	"index_once",
+	"index_is_fresh",
+	"record_index",
+	"invalidate_index",
+]
+
+
+# Seconds a refreshed package index is trusted for, unless its sources change.
+DEFAULT_TTL = 3600
+
+# Installer names which have already refreshed during this process.
+_indexed = set()
+
+
+class IndexState():
+	"""Persistent record of when each installer's source lists were refreshed."""
+
+	def __init__(self, path=None, ttl=None):
+		if path is None:
+			path = os.path.join(get_cache_directory(), "index-state.json")
+		if ttl is None:
+			ttl = float(os.environ.get("STRAPON_INDEX_TTL", DEFAULT_TTL))
+
+		self.path = path
+		self.ttl = ttl
+		try:
+			with open(path, "rt") as file:
+				self.state = json.load(file)
+		except (OSError, ValueError):
+			self.state = {}
+
+	@staticmethod
+	def fingerprint(sources):
+		# NOTE: mtime and size are enough to notice add-apt-repository or a
+		#       hand edit, without reading every list on each run.
+		prints = {}
+		for source in sources:
+			try:
+				stat = os.stat(source)
+			except OSError:
+				continue
+
+			prints[source] = [stat.st_mtime_ns, stat.st_size]
+
+		return prints
+
+	def is_fresh(self, name, sources, now=None):
+		if now is None: now = time.time()
+
+		record = self.state.get(name)
+		if record is None or record.get("dirty", False):
+			return False
+		elif now - record["refreshed"] > self.ttl:
+			return False
+
+		return record["sources"] == self.fingerprint(sources)
+
+	def record(self, name, sources, now=None, only=None):
+		"""Records a refresh of sources. When only some of them were
+		refreshed (only), just their fingerprints change; the others, and
+		when the whole index was last refreshed, stay as they were."""
+		if now is None: now = time.time()
+
+		if only is None:
+			prints = self.fingerprint(sources)
+			def change(state): state[name] = {"refreshed": now, "sources": prints}
+		else:
+			prints = self.fingerprint(only)
+			def change(state):
+				if name in state: state[name]["sources"].update(prints)
+
+		self.update(change)
+
+	def invalidate(self, name):
+		def change(state):
+			if name in state: state[name]["dirty"] = True
+
+		if name in self.state: self.update(change)
+
+	def update(self, change):
+		"""Applies change(state) to the state file as it is now, so entries
+		other processes wrote since we read it aren't lost."""
+		with open(f"{self.path}.lock", "a") as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			try:
+				with open(self.path, "rt") as file:
+					state = json.load(file)
+			except (OSError, ValueError):
+				state = {}
+
+			change(state)
+			# Write beside the target and rename over it so readers never see
+			# a half written state file.
+			descriptor, temporary = tempfile.mkstemp(prefix=".index-state.", suffix=".tmp",
+				dir=os.path.dirname(os.path.abspath(self.path)))
+			try:
+				with os.fdopen(descriptor, "wt") as file:
+					json.dump(state, file)
+				os.replace(temporary, self.path)
+			except BaseException:
+				os.unlink(temporary)
+				raise
+
+		self.state = state
+
+
+def _state_key(installer):
+	# NOTE: every root has its own package index.
+	root = getattr(installer, "root", "/")
+	return installer.name if root == "/" else f"{installer.name}@{root}"
+
+
+def _sources(installer):
+	return get_installer_source_lists(installer.name, getattr(installer, "root", "/"))
+
+
+def index_once(installer, state=None, force=False):
+	"""Refreshes the installer's package index unless it's already fresh.
+
+	Returns True when the native index command was actually run.
+	"""
+	name = _state_key(installer)
+	if name in _indexed and not force:
+		return False
+
+	if state is None: state = IndexState()
+	sources = _sources(installer)
+
+	if force or not sources or not state.is_fresh(name, sources):
+		installer._index()
+		state.record(name, sources)
+		_indexed.add(name)
+		return True
+
+	_indexed.add(name)
+	return False
+
+
+def index_is_fresh(installer, state=None):
+	if state is None: state = IndexState()
+	return state.is_fresh(_state_key(installer), _sources(installer))
+
+
+def record_index(installer, state=None, only=None):
+	"""Marks the installer's index as refreshed against its current sources,
+	or with only, just those source lists, eg. after refreshing just the
+	sources that were added."""
+	if state is None: state = IndexState()
+	state.record(_state_key(installer), _sources(installer), only=only)
+
+
+def invalidate_index(installer, state=None):
+	_indexed.discard(_state_key(installer))
+	if state is None: state = IndexState()
+	state.invalidate(_state_key(installer))
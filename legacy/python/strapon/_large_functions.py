@@ -21,28 +21,36 @@
 
 
 # external imports
-from dpcontracts import require
+#...
 
 # internal imports
-from .__init__ import (matching_OS, matching_VERSION, matching_ALL)
+from ._runtime import Command
+from ._host_facts import get_host_facts
+from ._backend import NativeAction
 
 # standard imports
-import os, sys
+from glob import glob
+import os
 
 
 
 __all__ = [
-	"default_system_installer_name_from_id",
+	"get_default_system_installer",
 	"map_known_installer",
+	"get_installer_root_options",
 	"get_installer_repository_registrar",
+	"get_installer_prefetcher",
+	"get_installer_progress_options",
+	"get_installer_source_lists",
+	"get_installer_status",
+	"get_installer_package_cache",
+	"get_cache_directory",
 ]
 
 
 def get_default_system_installer():
-	if matching_OS("galliumos", "mint", "debian", "arch"):
+	if get_host_facts().matching_OS("ubuntu", "galliumos", "mint", "debian"):
 		return "apt";
-	elif id == "ubuntu":
-		pass
 	else:
 		# TODO: might want to throw an error
 		return None
@@ -50,20 +58,99 @@ def get_default_system_installer():
 
 # NOTE: No shenanigans, this is for system installers only!
 def map_known_installer(name, si):
-	if name == "apt" || name == "apt-get":
-		si._install = si._native.bake("install")
-		si._remove = si._native.bake("remove")
-		si._purge = si._native.bake("purge")
-		si._index = si._native.bake("update")
+	if name == "apt" or name == "apt-get":
+		# NOTE: stdin is /dev/null, so any "Do you want to continue?" would abort.
+		si._install = NativeAction(si, "install", si._native.bake("install", "-y"))
+		si._remove = NativeAction(si, "remove", si._native.bake("remove", "-y"))
+		si._purge = NativeAction(si, "purge", si._native.bake("purge", "-y"))
+		si._index = NativeAction(si, "index", si._native.bake("update"))
+		si._download = get_installer_prefetcher(si)
+
+
+# Arguments pointing a native installer at another root filesystem.
+def get_installer_root_options(name, root):
+	if root == "/":
+		return ()
+	elif name in ("apt", "apt-get"):
+		# NOTE: apt reads the root's own sources, keyrings and dpkg database,
+		#       then runs dpkg chrooted so maintainer scripts see the root.
+		return ("-o", f"RootDir={root}", "-o", f"DPkg::Chroot-Directory={root}")
+
+	raise RuntimeError(f"'{name}' doesn't know how to act on another root ({root}), "
+		"only apt and apt-get do.")
 
 
 def get_installer_repository_registrar(installer):
 	if installer.name in ("apt", "apt-get"):
-		if matching_OS("ubuntu", "galliumos", "mint"):
-			from sh import add_apt_repository
-			registrar = add_apt_repository.bake("-y", "-n", repo_name)
-			registrar.is_multiplexer = False
-			return registrar
+		if get_host_facts().matching_OS("ubuntu", "galliumos", "mint"):
+			# NOTE: writes the lists and keys itself, one add-apt-repository
+			#       process per repository was most of the cost of registering.
+			from ._repositories import AptRepositoryRegistrar
+			return AptRepositoryRegistrar(installer)
 
 	# TODO: Throw error / Warning to let user know we couldn't add the repo.
-	pass
+	return None
+
+
+# Fetches what an install will need before it runs, outside of the native
+# installer's lock. See _prefetch.py
+def get_installer_prefetcher(installer):
+	if installer.name in ("apt", "apt-get"):
+		from ._prefetch import ArchivePrefetcher
+
+		query = Command(installer.name).bake(*get_installer_root_options(installer.name, installer.root),
+			"install", "--print-uris", "-qq")
+		return ArchivePrefetcher(installer, query,
+			get_installer_package_cache(installer.name, installer.root))
+
+	return None
+
+
+# Machine readable progress, see _progress.py. Returns a function giving the
+# arguments to report it on a file descriptor, or None.
+def get_installer_progress_options(name):
+	if name in ("apt", "apt-get"):
+		return lambda fd : ("-o", f"APT::Status-Fd={fd}")
+
+	return None
+
+
+def get_installer_source_lists(name, root="/"):
+	if name in ("apt", "apt-get"):
+		etc = os.path.join(root, "etc/apt")
+		return [
+			os.path.join(etc, "sources.list"),
+			*sorted(glob(os.path.join(etc, "sources.list.d/*.list"))),
+			*sorted(glob(os.path.join(etc, "sources.list.d/*.sources"))),
+		]
+
+	return []
+
+
+def get_installer_status(name, root="/"):
+	"""The installed package database behind a native installer, or None."""
+	if name in ("apt", "apt-get"):
+		from ._dpkg_status import get_dpkg_status
+		return get_dpkg_status(os.path.join(root, "var/lib/dpkg/status"))
+
+	return None
+
+
+# Where the native installer keeps downloaded packages inside a root, so
+# they can be shared between roots. See _multiroot.py
+def get_installer_package_cache(name, root="/"):
+	if name in ("apt", "apt-get"):
+		return os.path.join(root, "var/cache/apt/archives")
+
+	return None
+
+
+def get_cache_directory(*parts):
+	root = os.environ.get("STRAPON_CACHE_DIR")
+	if root is None:
+		xdg = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+		root = os.path.join(xdg, "strapon")
+
+	path = os.path.join(root, *parts)
+	os.makedirs(path, exist_ok=True)
+	return path
@@ -0,0 +1,158 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._large_functions import get_cache_directory
+
+# standard imports
+import os, ast, json
+
+
+
+__all__ = [
+	"FORMATS",
+	"load_manifest",
+	"describe_module",
+]
+
+
+FORMATS = ("standalone", "system", "source")
+# Bump when the shape of a manifest entry changes.
+MANIFEST_VERSION = 1
+
+_package_directory = os.path.dirname(os.path.abspath(__file__))
+
+
+def _decorator_call(node):
+	"""Returns (name, first string argument, keywords) for decorators shaped
+	like `@Something.name("value", key="value")`, otherwise None."""
+	if not isinstance(node, ast.Call):
+		return None
+
+	function = node.func
+	name = function.attr if isinstance(function, ast.Attribute) else getattr(function, "id", None)
+	value = None
+	if node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str):
+		value = node.args[0].value
+
+	keywords = {k.arg: k.value.value for k in node.keywords
+		if k.arg is not None and isinstance(k.value, ast.Constant)}
+	return name, value, keywords
+
+
+def _is_stub(function):
+	"""True for format functions that are empty or only raise NotImplementedError."""
+	body = [n for n in function.body if not isinstance(n, ast.Pass)
+		and not (isinstance(n, ast.Expr) and isinstance(n.value, ast.Constant))]
+	if not body:
+		return True
+	elif len(body) != 1 or not isinstance(body[0], ast.Raise):
+		return False
+
+	raised = body[0].exc
+	if isinstance(raised, ast.Call): raised = raised.func
+	return isinstance(raised, ast.Name) and raised.id == "NotImplementedError"
+
+
+def describe_module(path):
+	"""Reads what a strapon module offers from its source, without importing it."""
+	with open(path, "rb") as file:
+		tree = ast.parse(file.read(), path)
+
+	formats, packages, repositories = [], [], []
+	for node in tree.body:
+		if not isinstance(node, ast.FunctionDef) or not node.name in FORMATS:
+			continue
+		elif _is_stub(node):
+			continue
+
+		formats.append(node.name)
+		for decorator in node.decorator_list:
+			call = _decorator_call(decorator)
+			if call is None or call[1] is None:
+				continue
+
+			name, value, keywords = call
+			entry = {"name": value, "format": node.name, **keywords}
+			if name in ("stage_package", "fallback_package"):
+				packages.append(entry)
+			elif name == "register_repository":
+				repositories.append(entry)
+
+	return {
+		"formats": [f for f in FORMATS if f in formats],
+		"packages": packages,
+		"repositories": repositories,
+	}
+
+
+def _module_files(directory):
+	for entry in os.scandir(directory):
+		# NOTE: underscored modules are strapon's own plumbing.
+		if entry.name.endswith(".py") and not entry.name.startswith("_") and entry.is_file():
+			yield entry.name[:-3], entry
+
+
+def load_manifest(directory=None, path=None):
+	"""Returns {module name: description} for every strapon module, only
+	re-reading modules whose mtime or size changed since the cached manifest."""
+	if directory is None: directory = _package_directory
+	if path is None: path = os.path.join(get_cache_directory(), "manifest.json")
+
+	try:
+		with open(path, "rt") as file:
+			cached = json.load(file)
+		if not isinstance(cached, dict) or cached.get("version") != MANIFEST_VERSION \
+				or cached.get("directory") != directory:
+			cached = {}
+	except (OSError, ValueError):
+		cached = {}
+
+	# NOTE: anything in a damaged manifest that isn't an entry is re-read.
+	previous = cached.get("modules")
+	if not isinstance(previous, dict): previous = {}
+	modules, changed = {}, False
+	for name, entry in _module_files(directory):
+		stat = entry.stat()
+		key = [stat.st_mtime_ns, stat.st_size]
+		if isinstance(previous.get(name), dict) and previous[name].get("stat") == key:
+			modules[name] = previous[name]
+			continue
+
+		try:
+			description = describe_module(entry.path)
+		except SyntaxError as error:
+			description = {"formats": [], "packages": [], "repositories": [], "error": str(error)}
+
+		modules[name] = {"stat": key, **description}
+		changed = True
+
+	if changed or modules.keys() != previous.keys():
+		temporary = f"{path}.{os.getpid()}.tmp"
+		with open(temporary, "wt") as file:
+			json.dump({"version": MANIFEST_VERSION, "directory": directory, "modules": modules}, file)
+		os.replace(temporary, path)
+
+	return dict(sorted(modules.items()))
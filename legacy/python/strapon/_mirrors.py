@@ -0,0 +1,278 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from ._large_functions import get_cache_directory
+from ._trace import span
+
+# standard imports
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import os, json, time
+
+
+
+__all__ = [
+	"MirrorProbe",
+	"MirrorSelector",
+	"load_mirror_groups",
+	"probe_mirror",
+	"get_mirror_selector",
+]
+
+
+DEFAULT_TTL = 6 * 3600
+PROBE_TIMEOUT = 3
+# A probe reads at most this much to estimate throughput, and mirrors are
+# ranked by how long they'd take to serve REFERENCE_SIZE bytes.
+PROBE_BYTES = 256 << 10
+REFERENCE_SIZE = 8 << 20
+# Probes smaller than this say nothing useful about throughput.
+_MINIMUM_SAMPLE = 16 << 10
+
+
+def _base(url):
+	return url if url.endswith("/") else url + "/"
+
+
+def load_mirror_groups(path=None):
+	"""{base: {"mirrors": [base, ...], "probe": path}} from the JSON file in
+	$STRAPON_MIRRORS (or ~/.config/strapon/mirrors.json), eg.
+
+	    {"https://nodejs.org/dist/": {
+	        "mirrors": ["https://mirrors.example.org/nodejs/"],
+	        "probe": "index.json"},
+	     "http://archive.ubuntu.com/ubuntu/": [
+	        "http://de.archive.ubuntu.com/ubuntu/"]}
+
+	A plain list is just the mirrors. The base itself is always a candidate.
+	"""
+	if path is None:
+		path = os.environ.get("STRAPON_MIRRORS")
+	if path is None:
+		config = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+		path = os.path.join(config, "strapon", "mirrors.json")
+
+	try:
+		with open(path, "rt") as file:
+			config = json.load(file)
+	except FileNotFoundError:
+		return {}
+
+	groups = {}
+	for base, group in config.items():
+		if isinstance(group, list): group = {"mirrors": group}
+		mirrors = [_base(m) for m in group.get("mirrors", ())]
+		groups[_base(base)] = {
+			"mirrors": list(dict.fromkeys([_base(base), *mirrors])),
+			"probe": group.get("probe", ""),
+		}
+
+	return groups
+
+
+class MirrorProbe():
+	"""How one mirror answered a probe; score is the estimated seconds to
+	serve REFERENCE_SIZE bytes, or None when it didn't answer properly."""
+
+	def __init__(self, url, latency=None, throughput=None, error=None):
+		self.url = url
+		self.latency = latency
+		self.throughput = throughput
+		self.error = error
+
+	@property
+	def healthy(self):
+		return self.error is None
+
+	@property
+	def score(self):
+		if not self.healthy:
+			return None
+		elif not self.throughput:
+			return self.latency
+
+		return self.latency + REFERENCE_SIZE / self.throughput
+
+	def to_dict(self):
+		return {"url": self.url, "latency": self.latency,
+			"throughput": self.throughput, "error": self.error}
+
+
+def probe_mirror(url, timeout=PROBE_TIMEOUT):
+	"""Times the first byte of url over a fresh connection, then reads up to
+	PROBE_BYTES of it to estimate throughput."""
+	from ._download import ConnectionPool
+
+	pool = ConnectionPool(timeout=timeout)
+	start = time.perf_counter()
+	try:
+		connection, response = pool.request("GET", url, {"Range": f"bytes=0-{PROBE_BYTES - 1}"})
+		latency = time.perf_counter() - start
+		if response.status >= 400:
+			return MirrorProbe(url, latency, error=f"{response.status} {response.reason}")
+
+		received, started = 0, time.perf_counter()
+		deadline = start + timeout
+		while received < PROBE_BYTES and time.perf_counter() < deadline:
+			chunk = response.read1(min(1 << 16, PROBE_BYTES - received))
+			if not chunk: break
+			received += len(chunk)
+
+		elapsed = time.perf_counter() - started
+		throughput = received / elapsed if received >= _MINIMUM_SAMPLE and elapsed > 0 else None
+		# NOTE: unread bytes would be left on the connection, never reuse it.
+		connection.close()
+		return MirrorProbe(url, latency, throughput)
+	except Exception as error:
+		return MirrorProbe(url, error=str(error) or type(error).__name__)
+	finally:
+		pool.close()
+
+
+class MirrorSelector():
+	"""Ranks the mirrors of each configured group, fastest healthy first, and
+	rewrites URLs onto them.
+
+	Rankings are probed concurrently on first use and kept in
+	<cache>/mirrors.json for a TTL ($STRAPON_MIRROR_TTL seconds), so one
+	run's probes serve the following ones. URLs outside every group are
+	left alone without probing anything.
+	"""
+
+	def __init__(self, groups=None, path=None, ttl=None, timeout=PROBE_TIMEOUT):
+		if groups is None: groups = load_mirror_groups()
+		if path is None: path = os.path.join(get_cache_directory(), "mirrors.json")
+		if ttl is None: ttl = float(os.environ.get("STRAPON_MIRROR_TTL", DEFAULT_TTL))
+
+		self.groups = groups
+		self.path = path
+		self.ttl = ttl
+		self.timeout = timeout
+		self._lock = Lock()
+		try:
+			with open(path, "rt") as file:
+				self.state = json.load(file)
+		except (OSError, ValueError):
+			self.state = {}
+
+	def group(self, url):
+		"""(base, mirror) for the group url falls under, or (None, None)."""
+		for base, group in self.groups.items():
+			for mirror in group["mirrors"]:
+				if url.startswith(mirror) or _base(url) == mirror:
+					return base, mirror
+
+		return None, None
+
+	def ranking(self, base, now=None):
+		"""The mirrors of base, fastest healthy first, then unhealthy ones."""
+		if now is None: now = time.time()
+		group = self.groups[base]
+
+		with self._lock:
+			record = self.state.get(base)
+			if record is None or record["mirrors"] != group["mirrors"] or now - record["probed"] > self.ttl:
+				record = self.state[base] = self._probe(base, group, now)
+				self.save()
+
+			return list(record["ranking"])
+
+	def _probe(self, base, group, now):
+		with span("probe mirrors", "download", group=base, mirrors=len(group["mirrors"])), \
+				ThreadPoolExecutor(max_workers=len(group["mirrors"])) as executor:
+			probes = list(executor.map(lambda m : probe_mirror(m + group["probe"], self.timeout),
+				group["mirrors"]))
+
+		for mirror, probe in zip(group["mirrors"], probes):
+			probe.url = mirror
+
+		# NOTE: sorted() is stable, so ties keep the configured order.
+		probes.sort(key=lambda p : (not p.healthy, p.score or 0))
+		return {
+			"probed": now,
+			"mirrors": group["mirrors"],
+			"ranking": [p.url for p in probes],
+			"probes": [p.to_dict() for p in probes],
+		}
+
+	def candidates(self, url):
+		"""url on every mirror of its group in ranked order, or just [url]."""
+		base, mirror = self.group(url)
+		if base is None:
+			return [url]
+
+		path = url[len(mirror):] if url.startswith(mirror) else ""
+		return [m + path for m in self.ranking(base)]
+
+	def rewrite(self, url):
+		"""url on the fastest healthy mirror."""
+		return self.candidates(url)[0]
+
+	def canonical(self, url):
+		"""url on its group's base, so every mirror's copy has the same name."""
+		base, mirror = self.group(url)
+		if base is None:
+			return url
+
+		return base + url[len(mirror):] if url.startswith(mirror) else base
+
+	def demote(self, url, error=None):
+		"""Moves a failed or stalled mirror to the back of its ranking until
+		the next probe."""
+		base, mirror = self.group(url)
+		if base is None:
+			return
+
+		with self._lock:
+			record = self.state.get(base)
+			if record is None or not mirror in record["ranking"]:
+				return
+
+			record["ranking"].remove(mirror)
+			record["ranking"].append(mirror)
+			self.save()
+
+	def save(self):
+		temporary = f"{self.path}.{os.getpid()}.tmp"
+		with open(temporary, "wt") as file:
+			json.dump(self.state, file)
+
+		os.replace(temporary, self.path)
+
+
+_selector = None
+_selector_lock = Lock()
+
+
+def get_mirror_selector():
+	"""This process' MirrorSelector, configured from the environment."""
+	global _selector
+	with _selector_lock:
+		if _selector is None:
+			_selector = MirrorSelector()
+
+		return _selector
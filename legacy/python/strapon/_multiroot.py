@@ -0,0 +1,156 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from ._host_facts import set_target_root
+from ._backend import perform
+from ._large_functions import get_cache_directory, get_installer_package_cache
+
+# standard imports
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os, multiprocessing
+
+
+
+__all__ = [
+	"RootResult",
+	"share_packages",
+	"provision_root",
+	"provision_roots",
+]
+
+
+class RootResult():
+	"""What happened to one root; plain data so it can leave a worker."""
+	__slots__ = ("root", "report", "error", "linked")
+
+	def __init__(self, root, report="", error=None, linked=0):
+		self.root = root
+		self.report = report
+		self.error = error
+		self.linked = linked
+
+	def __repr__(self):
+		return f"RootResult({self.root!r}, error={self.error!r})"
+
+
+def share_packages(source, destination, privileged=False):
+	"""Links every package file in source that's missing from destination.
+	Returns how many were linked.
+
+	privileged destinations, like a root's own package cache, are only
+	written to by the backend worker, which copies and checks each file.
+	"""
+	from ._artifact_cache import link_file
+
+	try:
+		entries = list(os.scandir(source))
+	except FileNotFoundError:
+		return 0
+
+	missing = []
+	for entry in entries:
+		# NOTE: partial downloads and apt's lock file stay where they are.
+		if not entry.name.endswith((".deb", ".rpm", ".pkg.tar.zst")) or not entry.is_file():
+			continue
+
+		target = os.path.join(destination, entry.name)
+		if not os.path.exists(target):
+			missing.append((entry, target))
+
+	if privileged and missing:
+		perform("place_files", files=[{"source": entry.path, "path": target,
+			"size": entry.stat().st_size} for entry, target in missing])
+	else:
+		for entry, target in missing:
+			link_file(entry.path, target)
+
+	return len(missing)
+
+
+def provision_root(root, action, modules, jobs=None, plan_only=False):
+	"""Plans and runs modules against one root, in the calling process.
+
+	Packages the root's native installer already downloaded are shared with
+	every other root through the package cache, before and after the run.
+	"""
+	root = set_target_root(root)
+	# NOTE: imported after the root is set, since installers and decorators
+	#       read the target root's facts as the modules are imported.
+	from ._batch import plan_modules
+
+	result = RootResult(root)
+	plan = plan_modules(modules)
+	result.report = plan.report(action)
+	if plan_only:
+		return result
+
+	archives = {}
+	for name in plan.backends:
+		directory = get_installer_package_cache(name, root)
+		if directory is not None and os.path.isdir(directory):
+			archives[name] = (directory, get_cache_directory("packages", name))
+			result.linked += share_packages(archives[name][1], directory, privileged=True)
+
+	try:
+		plan.exec(action, workers=jobs)
+	finally:
+		for directory, shared in archives.values():
+			share_packages(directory, shared)
+
+	return result
+
+
+def _provision_worker(root, action, modules, jobs, plan_only, progress):
+	if progress:
+		from ._progress import subscribe, ProgressPrinter
+		subscribe(ProgressPrinter(label=root))
+
+	try:
+		return provision_root(root, action, modules, jobs=jobs, plan_only=plan_only)
+	except Exception as error:
+		return RootResult(root, error=f"{type(error).__name__}: {error}")
+
+
+def provision_roots(roots, action, modules, processes=None, jobs=None, plan_only=False,
+		progress=False):
+	"""Provisions many roots at once, one process per root at a time.
+
+	Yields a RootResult as each root finishes. Every root gets a fresh
+	interpreter, since host facts and staged packages are per process.
+	With progress, each one prints its progress to stderr as it goes.
+	"""
+	roots = list(dict.fromkeys(os.path.abspath(r) for r in roots))
+	if processes is None: processes = min(len(roots), os.cpu_count() or 1)
+
+	# NOTE: spawn, not fork, so no worker starts with modules the parent (or
+	#       a previous root) already imported.
+	with ProcessPoolExecutor(max_workers=max(1, processes), max_tasks_per_child=1,
+			mp_context=multiprocessing.get_context("spawn")) as executor:
+		futures = [executor.submit(_provision_worker, root, action, modules, jobs, plan_only,
+			progress) for root in roots]
+		for future in as_completed(futures):
+			yield future.result()
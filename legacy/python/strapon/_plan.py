@@ -0,0 +1,184 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from ._host_facts import get_host_facts, get_target_root
+from ._large_functions import get_cache_directory
+
+# standard imports
+from importlib import import_module
+import os, json, hashlib
+
+
+
+__all__ = [
+	"InstallPlan",
+	"compile_plan",
+	"load_plan",
+]
+
+
+_package_directory = os.path.dirname(os.path.abspath(__file__))
+# Digest of strapon's own sources, see _framework_digest()
+_framework = None
+
+_fields = ("module", "format", "installer", "root", "packages", "repositories", "index_before_action")
+
+
+class InstallPlan():
+	"""What a strapped format function resolved to on this host: which
+	native installer, and the packages and repositories it stages."""
+
+	__slots__ = _fields
+
+	def __init__(self, module, format, installer, root, packages=(), repositories=(),
+			index_before_action=True):
+		setter = object.__setattr__
+		setter(self, "module", module)
+		setter(self, "format", format)
+		setter(self, "installer", installer)
+		setter(self, "root", root)
+		setter(self, "packages", tuple(packages))
+		setter(self, "repositories", tuple(repositories))
+		setter(self, "index_before_action", bool(index_before_action))
+
+	def __setattr__(self, name, value):
+		raise AttributeError(f"'{type(self).__name__}' is immutable.")
+
+	def __delattr__(self, name):
+		raise AttributeError(f"'{type(self).__name__}' is immutable.")
+
+	def __eq__(self, other):
+		return isinstance(other, InstallPlan) and self.to_dict() == other.to_dict()
+
+	def __hash__(self):
+		return hash(tuple(getattr(self, f) for f in _fields))
+
+	def __repr__(self):
+		return f"InstallPlan({self.module!r}, {self.format!r}, {self.installer!r}, packages={self.packages!r})"
+
+	def to_dict(self):
+		return {f: list(v) if isinstance(v, tuple) else v for f in _fields for v in (getattr(self, f),)}
+
+	@classmethod
+	def from_dict(cls, values):
+		return cls(**{f: values[f] for f in _fields})
+
+	def system_installer(self):
+		"""A fresh SystemInstaller carrying this plan."""
+		from . import SystemInstaller
+
+		installer = SystemInstaller(self.installer, self.root)
+		installer.metadata["packages"] = list(self.packages)
+		installer.metadata["repositories"] = list(self.repositories)
+		installer.metadata["index_before_action"] = self.index_before_action
+		return installer
+
+
+def compile_plan(function, module, format="system"):
+	"""Freezes what a strapped system format staged, or None when function
+	isn't strapped onto a SystemInstaller."""
+	from . import SystemInstaller
+
+	installer = getattr(function, "installer", None)
+	if not isinstance(installer, SystemInstaller):
+		return None
+
+	meta = function.meta
+	return InstallPlan(module, format, installer.name, installer.root,
+		packages=dict.fromkeys(meta.get("packages", [])),
+		repositories=dict.fromkeys(meta.get("repositories", [])),
+		index_before_action=installer.metadata.get("index_before_action", False))
+
+
+def _facts_key(root):
+	# NOTE: plans only depend on what decorators can ask about the host.
+	return hashlib.sha256(json.dumps([root, *get_host_facts().key()]).encode()).hexdigest()[:32]
+
+
+def _framework_digest():
+	"""A digest of strapon itself (__init__.py and the _*.py modules), whose
+	decorators and resolution logic every plan went through."""
+	global _framework
+	if _framework is None:
+		digest = hashlib.sha256()
+		for name in sorted(os.listdir(_package_directory)):
+			if name.startswith("_") and name.endswith(".py"):
+				with open(os.path.join(_package_directory, name), "rb") as file:
+					digest.update(name.encode() + b"\0" + file.read())
+		_framework = digest.hexdigest()
+
+	return _framework
+
+
+def load_plan(module, format="system", directory=None, cache=None):
+	"""The InstallPlan for a module's format, or None if it has none.
+
+	Resolved plans are cached per module, keyed on the module's source hash,
+	strapon's own sources and the host facts, so later runs don't import the module (or run any of
+	its decorators) at all.
+	"""
+	if directory is None: directory = _package_directory
+	if cache is None: cache = get_cache_directory("plans")
+	else: os.makedirs(cache, exist_ok=True)
+
+	with open(os.path.join(directory, f"{module}.py"), "rb") as file:
+		source = hashlib.sha256(file.read()).hexdigest()
+
+	path = os.path.join(cache, f"{module}.json")
+	key = _facts_key(get_target_root())
+	try:
+		with open(path, "rt") as file:
+			cached = json.load(file)
+		if cached.get("framework") != _framework_digest() or cached.get("source") != source:
+			cached = None
+	except (OSError, ValueError):
+		cached = None
+
+	if cached is None:
+		cached = {"framework": _framework_digest(), "source": source, "plans": {}}
+
+	entry = cached["plans"].get(key, {})
+	if format in entry:
+		return InstallPlan.from_dict(entry[format]) if entry[format] is not None else None
+
+	if directory == _package_directory:
+		imported = import_module(f".{module}", package=__package__)
+	else:
+		from importlib.util import spec_from_file_location, module_from_spec
+		spec = spec_from_file_location(module, os.path.join(directory, f"{module}.py"))
+		imported = module_from_spec(spec)
+		spec.loader.exec_module(imported)
+
+	plan = getattr(getattr(imported, format, None), "plan", None)
+	cached["plans"].setdefault(key, {})[format] = plan.to_dict() if plan is not None else None
+
+	temporary = f"{path}.{os.getpid()}.tmp"
+	with open(temporary, "wt") as file:
+		json.dump(cached, file)
+	os.replace(temporary, path)
+
+	return plan
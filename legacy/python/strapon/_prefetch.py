@@ -0,0 +1,190 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from ._backend import BackendError, perform
+from ._progress import run_streaming
+from ._trace import span
+
+# standard imports
+from concurrent.futures import ThreadPoolExecutor
+import os, re, sys, hashlib
+
+
+
+__all__ = [
+	"Archive",
+	"parse_print_uris",
+	"ArchivePrefetcher",
+]
+
+
+DEFAULT_WORKERS = 8
+
+_uri_pattern = re.compile(r"^'([^']+)'\s+(\S+)\s+(\d+)\s*(?:(\w+):(\w+))?")
+
+
+class Archive():
+	"""One package archive the native installer would download."""
+	__slots__ = ("url", "filename", "size", "algorithm", "digest")
+
+	def __init__(self, url, filename, size, algorithm=None, digest=None):
+		self.url = url
+		self.filename = filename
+		self.size = size
+		self.algorithm = algorithm
+		self.digest = digest
+
+	def __repr__(self):
+		return f"Archive({self.filename!r})"
+
+	def verify(self, path):
+		"""Whether the file at path is this archive, by its published hash."""
+		if self.algorithm is None:
+			return os.path.getsize(path) == self.size
+		elif self.algorithm.upper() == "SHA256" and os.path.basename(path) == self.digest:
+			# NOTE: artifact cache objects are already named by their sha256.
+			return True
+
+		digest = hashlib.new(self.algorithm.lower().replace("sum", ""))
+		with open(path, "rb") as file:
+			for chunk in iter(lambda : file.read(1 << 16), b""):
+				digest.update(chunk)
+
+		return digest.hexdigest() == self.digest
+
+
+def parse_print_uris(output):
+	"""Archives from `apt-get install --print-uris` output, which lines
+	look like: 'URL' filename size SHA256:digest"""
+	archives = []
+	for line in output.splitlines():
+		match = _uri_pattern.match(line.strip())
+		# NOTE: .deb only, the same output also lists changelogs and such.
+		if match is None or not match.group(2).endswith(".deb"):
+			continue
+
+		url, filename, size, algorithm, digest = match.groups()
+		archives.append(Archive(url, filename, int(size), algorithm, digest))
+
+	return archives
+
+
+class ArchivePrefetcher():
+	"""Downloads the archives an install will need ahead of the install,
+	so the native installer only holds its lock to unpack and configure.
+
+	apt-get's own --download-only opens the package cache for installing,
+	which takes the dpkg lock for the whole download. Instead --print-uris
+	(which takes no lock) says what's missing, the archives are fetched
+	concurrently through the artifact cache and configured mirrors, checked
+	against their published hashes, then placed into the root's archive
+	directory by the backend.
+	"""
+
+	def __init__(self, installer, query, archives):
+		self.installer = installer
+		# Unprivileged and lock free, see get_installer_prefetcher()
+		self.query = query
+		self.archives = archives
+
+	def missing(self, *packages):
+		"""The archives installing packages would still have to download."""
+		# NOTE: spawned directly, sh costs more than the query itself. Every
+		#       line is kept, it's all parsed.
+		argv = self.query.argv(*packages)
+		result = run_streaming(argv, retain=None)
+		if result["exit_code"] != 0:
+			raise BackendError(f"'{' '.join(argv)}' exited with {result['exit_code']}:\n"
+				+ result["stderr"].strip(), result["exit_code"], result["stdout"], result["stderr"])
+
+		archives = parse_print_uris(result["stdout"])
+		# NOTE: file:, copy: and cdrom: sources aren't downloads, apt reads
+		#       those in place.
+		return [a for a in archives if a.url.startswith(("http://", "https://"))
+			and not self._present(a)]
+
+	def _present(self, archive):
+		try:
+			return os.path.getsize(os.path.join(self.archives, archive.filename)) == archive.size
+		except OSError:
+			return False
+
+	def __call__(self, *packages, cache=None, workers=DEFAULT_WORKERS):
+		"""Returns the filenames of the archives it placed."""
+		from ._artifact_cache import ArtifactCache
+		from ._mirrors import get_mirror_selector
+
+		if not packages:
+			return []
+
+		with span("plan downloads", "phase", packages=len(packages)) as trace:
+			try:
+				missing = self.missing(*packages)
+			except BackendError as error:
+				# NOTE: eg. an unknown package, which the native installer
+				#       reports better itself when it runs.
+				print(f"strapon: couldn't plan downloads ({error.stderr.strip() or error}), "
+					"leaving them to the package manager", file=sys.stderr)
+				return []
+			trace.set(archives=len(missing), bytes=sum(a.size for a in missing))
+
+		if not missing:
+			return []
+
+		if cache is None: cache = ArtifactCache()
+		selector = get_mirror_selector()
+		def fetch(archive):
+			url = selector.canonical(archive.url)
+			mirrors = selector.candidates(url)
+			try:
+				path = cache.fetch(url, mirrors=mirrors if mirrors != [url] else None,
+					failed=selector.demote, sha256=archive.digest
+					if (archive.algorithm or "").upper() == "SHA256" else None)
+				if not archive.verify(path):
+					raise ValueError(f"it doesn't match its published {archive.algorithm}")
+			except Exception as error:
+				# NOTE: only an optimization, the native installer downloads
+				#       whatever isn't there itself.
+				print(f"strapon: couldn't prefetch {archive.filename} ({error}), "
+					"leaving it to the package manager", file=sys.stderr)
+				return None
+
+			return path
+
+		with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+			fetched = [(a, path) for a, path in zip(missing, executor.map(fetch, missing))
+				if path is not None]
+
+		if not fetched:
+			return []
+
+		with span("place archives", "phase", archives=len(fetched), failed=len(missing) - len(fetched)):
+			perform("place_files", files=[{"source": path, "path": os.path.join(self.archives, a.filename),
+				"size": a.size, "algorithm": a.algorithm, "digest": a.digest}
+				for a, path in fetched])
+
+		return [a.filename for a, _ in fetched]
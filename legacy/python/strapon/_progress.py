@@ -0,0 +1,309 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+#...
+
+# standard imports
+from contextlib import contextmanager
+from collections import deque
+import os, re, sys, threading, selectors, subprocess
+
+
+
+__all__ = [
+	"ProgressEvent",
+	"RingBuffer",
+	"parse_apt_status",
+	"run_streaming",
+	"subscribe",
+	"unsubscribe",
+	"subscribed",
+	"publish",
+	"progress_context",
+	"ProgressPrinter",
+]
+
+
+# Lines of stdout/stderr kept per command, the rest only stream past.
+RETAINED_LINES = 200
+# Longer lines are cut, so one runaway line can't grow without bound.
+MAXIMUM_LINE = 4096
+
+_line_break = re.compile(rb"\r\n|\r|\n")
+
+
+class ProgressEvent():
+	"""Something a running command reported.
+
+	kind is "progress" (phase, package and overall percent), "error" or
+	"line" (one line of output on stream). task is the scheduler task it
+	happened in, when there is one.
+	"""
+	__slots__ = ("kind", "phase", "package", "percent", "message", "stream", "task")
+
+	def __init__(self, kind, phase=None, package=None, percent=None, message="",
+			stream=None, task=None):
+		self.kind = kind
+		self.phase = phase
+		self.package = package
+		self.percent = percent
+		self.message = message
+		self.stream = stream
+		self.task = task
+
+	def __repr__(self):
+		return f"ProgressEvent({self.kind!r}, {self.phase!r}, {self.package!r}, {self.percent!r})"
+
+	def to_dict(self):
+		return {s: getattr(self, s) for s in self.__slots__ if getattr(self, s) is not None}
+
+	@classmethod
+	def from_dict(cls, values):
+		return cls(**values)
+
+
+class RingBuffer():
+	"""The last `lines` lines appended, and how many were dropped before them."""
+
+	def __init__(self, lines=RETAINED_LINES):
+		self._lines = deque(maxlen=lines)
+		self.dropped = 0
+
+	def append(self, line):
+		if len(self._lines) == self._lines.maxlen:
+			self.dropped += 1
+		self._lines.append(line)
+
+	def __len__(self):
+		return len(self._lines)
+
+	def __iter__(self):
+		return iter(self._lines)
+
+	def text(self):
+		text = "".join(line + "\n" for line in self._lines)
+		return f"[{self.dropped} earlier lines dropped]\n{text}" if self.dropped else text
+
+
+# dpkg's messages, by leading word, and the phase each one means.
+_dpkg_phases = {
+	"Preparing": "unpack", "Unpacking": "unpack", "Installing": "unpack",
+	"Installed": "unpack", "Configuring": "configure", "Setting": "configure",
+	"Running": "trigger", "Removing": "remove", "Removed": "remove",
+	"Purging": "purge", "Completely": "purge",
+}
+
+
+def parse_apt_status(line):
+	"""A ProgressEvent for one line of apt's APT::Status-Fd output, eg.
+
+	    dlstatus:3:42.5:Retrieving file 3 of 8
+	    pmstatus:krita:60:Unpacking krita (amd64)
+	    pmerror:krita:60:trying to overwrite '/usr/bin/krita'
+
+	or None for anything it doesn't describe."""
+	fields = line.split(":", 3)
+	if len(fields) != 4:
+		return None
+
+	kind, package, percent, message = fields
+	try:
+		percent = float(percent)
+	except ValueError:
+		return None
+
+	if kind == "dlstatus":
+		return ProgressEvent("progress", "download", None, percent, message)
+	elif kind == "pmstatus":
+		phase = _dpkg_phases.get(message.split(" ", 1)[0], "dpkg")
+		return ProgressEvent("progress", phase, package, percent, message)
+	elif kind in ("pmerror", "dlerror"):
+		return ProgressEvent("error", "download" if kind == "dlerror" else "dpkg",
+			package or None, percent, message)
+
+	return None
+
+
+def _decode(line):
+	return line[:MAXIMUM_LINE].decode(errors="replace")
+
+
+def run_streaming(argv, status=None, emit=None, retain=RETAINED_LINES):
+	"""Runs argv, handing each line of output (and, with status, each of
+	the native tool's own progress reports) to emit as a ProgressEvent
+	while it runs.
+
+	status(fd) returns the arguments telling the command to write
+	machine readable progress to fd, they're added after argv[0]. Only the
+	last `retain` lines of stdout and stderr are kept (None keeps them
+	all), so memory stays flat however much a command prints.
+	"""
+	read, write = os.pipe() if status is not None else (None, None)
+	if status is not None:
+		argv = [argv[0], *status(write), *argv[1:]]
+
+	try:
+		process = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+			stderr=subprocess.PIPE, pass_fds=(write,) if write is not None else ())
+	finally:
+		if write is not None: os.close(write)
+
+	buffers = {"stdout": RingBuffer(retain), "stderr": RingBuffer(retain)}
+	selector = selectors.DefaultSelector()
+	selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+	selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+	if read is not None: selector.register(read, selectors.EVENT_READ, "status")
+
+	def handle(stream, line):
+		if stream == "status":
+			event = parse_apt_status(_decode(line))
+			if event is not None and emit is not None: emit(event)
+		elif line:
+			text = _decode(line)
+			buffers[stream].append(text)
+			if emit is not None: emit(ProgressEvent("line", message=text, stream=stream))
+
+	pending = {"stdout": b"", "stderr": b"", "status": b""}
+	try:
+		while selector.get_map():
+			for key, _ in selector.select():
+				stream = key.data
+				chunk = os.read(key.fd, 1 << 16)
+				if not chunk:
+					selector.unregister(key.fileobj)
+					if pending[stream]: handle(stream, pending[stream])
+					continue
+
+				lines = _line_break.split(pending[stream] + chunk)
+				pending[stream] = lines.pop()
+				# NOTE: a line with no end in sight is cut rather than kept whole.
+				if len(pending[stream]) > MAXIMUM_LINE:
+					lines.append(pending[stream])
+					pending[stream] = b""
+
+				for line in lines:
+					handle(stream, line)
+	finally:
+		selector.close()
+		process.stdout.close()
+		process.stderr.close()
+		if read is not None: os.close(read)
+		process.wait()
+
+	return {
+		"exit_code": process.returncode,
+		"stdout": buffers["stdout"].text(),
+		"stderr": buffers["stderr"].text(),
+	}
+
+
+# SUBSCRIBERS
+# NOTE: the list is replaced rather than changed, so publish() can read it
+#       without a lock.
+_subscribers = ()
+_subscribers_lock = threading.Lock()
+_local = threading.local()
+
+
+def subscribe(callback, lines=False):
+	"""Calls callback(event) for every ProgressEvent from now on, from
+	whichever thread the command ran in. Output "line" events only go to
+	callbacks asking for lines, since they're most of the traffic.
+	Returns callback."""
+	global _subscribers
+	with _subscribers_lock:
+		_subscribers = (*_subscribers, (callback, lines))
+
+	return callback
+
+
+def unsubscribe(callback):
+	global _subscribers
+	with _subscribers_lock:
+		_subscribers = tuple(s for s in _subscribers if s[0] is not callback)
+
+
+def subscribed():
+	"""None when nobody is listening (so nothing needs streaming back),
+	otherwise "lines" or "progress" for what they're listening to."""
+	if not _subscribers:
+		return None
+
+	return "lines" if any(lines for _, lines in _subscribers) else "progress"
+
+
+def publish(event):
+	if event.task is None: event.task = getattr(_local, "task", None)
+	for callback, lines in _subscribers:
+		if lines or event.kind != "line": callback(event)
+
+
+@contextmanager
+def progress_context(task):
+	"""Tags events published by this thread with task."""
+	previous = getattr(_local, "task", None)
+	_local.task = task
+	try:
+		yield
+	finally:
+		_local.task = previous
+
+
+class ProgressPrinter():
+	"""Renders progress events on a terminal as one updating status line,
+	or elsewhere as a line each time the phase or package changes. label
+	tells apart several processes sharing one output."""
+
+	def __init__(self, file=None, label=None):
+		self.file = file if file is not None else sys.stderr
+		# NOTE: processes sharing a terminal would overwrite each other's line.
+		self.interactive = self.file.isatty() and label is None
+		self.label = label
+		self._last = None
+		self._lock = threading.Lock()
+
+	def __call__(self, event):
+		prefix = "".join(f"[{part}] " for part in (self.label, event.task) if part)
+		percent = f" {event.percent:5.1f}%" if event.percent is not None else ""
+		text = f"{prefix}{event.phase or ''}{percent} {event.package or event.message}"
+		with self._lock:
+			if event.kind == "error":
+				self._write(f"{prefix}error: {event.package or ''} {event.message}".rstrip(), True)
+			elif self.interactive:
+				self._write(text, False)
+			elif self._last != (event.task, event.phase, event.package):
+				self._last = (event.task, event.phase, event.package)
+				self._write(text, True)
+
+	def _write(self, text, keep):
+		if self.interactive:
+			# NOTE: overwrite the status line, keeping it if asked.
+			self.file.write(f"\r\033[K{text}" + ("\n" if keep else ""))
+		else:
+			self.file.write(text + "\n")
+
+		self.file.flush()
@@ -0,0 +1,302 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._large_functions import get_cache_directory
+from ._versions import version_key, compile_constraint
+from ._trace import span
+
+# standard imports
+from urllib.parse import urlsplit, urljoin
+from fnmatch import fnmatchcase
+import os, re, json, time, hashlib
+
+
+
+__all__ = [
+	"ReleaseError",
+	"Release",
+	"ReleaseIndex",
+	"parse_releases",
+	"fetch_release_index",
+]
+
+
+DEFAULT_TTL = 3600
+NODEJS_INDEX = "https://nodejs.org/dist/index.json"
+
+
+class ReleaseError(Exception): pass
+
+
+class Release():
+	"""One version of a project and the URLs of its files by name."""
+	__slots__ = ("version", "date", "lts", "prerelease", "assets")
+
+	def __init__(self, version, date=None, lts=None, prerelease=False, assets=None):
+		self.version = version
+		self.date = date
+		# The LTS line's name (eg. "Hydrogen"), or None outside of one.
+		self.lts = lts
+		self.prerelease = prerelease
+		self.assets = assets or {}
+
+	def __repr__(self):
+		return f"Release({self.version!r})"
+
+	@property
+	def key(self):
+		# NOTE: tags are usually "v1.2.3" or "name-1.2.3", order on the number.
+		return version_key(re.sub(r"^\D+", "", self.version) or self.version)
+
+	def asset(self, pattern):
+		"""The URL of the first file whose name matches the glob pattern."""
+		for name, url in self.assets.items():
+			if fnmatchcase(name, pattern):
+				return url
+
+		raise ReleaseError(f"{self.version} has no file matching '{pattern}', only: "
+			+ ", ".join(self.assets))
+
+	def to_dict(self):
+		return {slot: getattr(self, slot) for slot in self.__slots__}
+
+	@classmethod
+	def from_dict(cls, data):
+		return cls(**data)
+
+
+class ReleaseIndex():
+	"""Releases in ascending version order, with their version_key()s kept
+	alongside so a query is a bisect (see Constraint.highest_sorted())
+	instead of a scan.
+
+	Queries are "latest", "lts", "lts/<name>", a version series ("18",
+	"18.2"), any version constraint ("^18", ">=20 <22", ...) or any of
+	those after "lts ".
+	"""
+
+	def __init__(self, releases, prereleases=False, presorted=False):
+		if not prereleases:
+			releases = [r for r in releases if not r.prerelease]
+		if not presorted:
+			releases = sorted(releases, key=lambda r : r.key)
+
+		self.releases = releases
+		self.keys = [r.key for r in releases]
+		self.lts = [r for r in releases if r.lts]
+		self.lts_keys = [r.key for r in self.lts]
+
+	def __len__(self):
+		return len(self.releases)
+
+	def _query(self, query):
+		"""(releases, keys, constraint or None) a query searches."""
+		query = query.strip()
+		if query.lower().startswith("lts"):
+			query = query[3:]
+			if query.startswith("/"):
+				name = query[1:].strip().lower()
+				releases = [r for r in self.lts if r.lts.lower() == name]
+				return releases, [r.key for r in releases], None
+
+			releases, keys = self.lts, self.lts_keys
+		else:
+			releases, keys = self.releases, self.keys
+
+		query = query.strip()
+		if query in ("", "*", "latest"):
+			return releases, keys, None
+		elif re.fullmatch(r"v?\d+(\.\d+)?", query):
+			# NOTE: a partial version means its whole series here, "18" is
+			#       "~18" (any 18.x.y) rather than exactly "18".
+			query = "~" + query.lstrip("v")
+
+		return releases, keys, compile_constraint(query)
+
+	def resolve(self, query="latest"):
+		"""The highest release matching query."""
+		releases, keys, constraint = self._query(query)
+		index = len(keys) - 1 if constraint is None else constraint.highest_sorted(keys)
+		if index is None or index < 0:
+			raise ReleaseError(f"No release matches '{query}'.")
+
+		return releases[index]
+
+	def select(self, query="latest"):
+		"""Every release matching query, lowest first."""
+		releases, keys, constraint = self._query(query)
+		if constraint is None:
+			return list(releases)
+
+		return [releases[i] for i in constraint.select_sorted(keys)]
+
+
+# PARSERS
+# NOTE: each takes the decoded JSON and the URL it came from, returning
+#       Releases in any order.
+
+def _parse_nodejs(data, url):
+	# dist/index.json: [{"version": "v20.1.0", "date": ..., "lts": false or
+	# "Hydrogen", "files": ["linux-x64", "src", ...]}, ...]. Only the tarballs
+	# with predictable names are listed.
+	base = url.rsplit("/", 1)[0] + "/"
+	releases = []
+	for entry in data:
+		version = entry["version"]
+		assets = {}
+		for file in entry.get("files", ()):
+			if file.startswith("linux-"):
+				name = f"node-{version}-{file}.tar.xz"
+			elif file == "src":
+				name = f"node-{version}.tar.xz"
+			else:
+				continue
+
+			assets[name] = f"{base}{version}/{name}"
+
+		releases.append(Release(version, entry.get("date"), entry.get("lts") or None,
+			assets=assets))
+
+	return releases
+
+
+def _parse_github(data, url):
+	# api.github.com/repos/<owner>/<repo>/releases: [{"tag_name": ...,
+	# "draft": bool, "prerelease": bool, "assets": [{"name": ...,
+	# "browser_download_url": ...}]}, ...]
+	return [Release(entry["tag_name"], entry.get("published_at"), None,
+		entry.get("prerelease", False),
+		{asset["name"]: asset["browser_download_url"] for asset in entry.get("assets", ())})
+		for entry in data if not entry.get("draft", False)]
+
+
+_parsers = {
+	"nodejs": _parse_nodejs,
+	"github": _parse_github,
+}
+
+
+def parse_releases(data, url, format=None):
+	"""Releases from a decoded index, its format guessed when None."""
+	if format is None:
+		first = data[0] if isinstance(data, list) and data else {}
+		if "tag_name" in first:
+			format = "github"
+		elif "version" in first and "files" in first:
+			format = "nodejs"
+		else:
+			raise ReleaseError(f"Can't tell what kind of release index {url} is.")
+
+	return _parsers[format](data, url)
+
+
+# FETCHING
+
+def _conditional_get(pool, url, record):
+	"""(status, body, response) for a GET of url, revalidating record."""
+	from ._download import DownloadError, MAXIMUM_REDIRECTS
+
+	headers = {"User-Agent": "strapon", "Accept": "application/json"}
+	if record is not None and record.get("url") == url:
+		if record.get("etag"): headers["If-None-Match"] = record["etag"]
+		if record.get("last_modified"): headers["If-Modified-Since"] = record["last_modified"]
+
+	for _ in range(MAXIMUM_REDIRECTS):
+		connection, response = pool.request("GET", url, headers)
+		body = response.read()
+		split = urlsplit(url)
+		pool.release(split.scheme, split.netloc, connection)
+
+		if response.status in (301, 302, 303, 307, 308):
+			url = urljoin(url, response.getheader("Location"))
+			continue
+		elif response.status >= 400:
+			raise DownloadError(f"GET {url} failed with {response.status} {response.reason}.")
+
+		return response.status, body, response
+
+	raise DownloadError(f"Too many redirects fetching {url}.")
+
+
+def _save(path, record):
+	temporary = f"{path}.{os.getpid()}.tmp"
+	with open(temporary, "wt") as file:
+		json.dump(record, file)
+
+	os.replace(temporary, path)
+
+
+def fetch_release_index(url, format=None, ttl=None, prereleases=False, pool=None, now=None):
+	"""The ReleaseIndex at url, through a cache in <cache>/releases.
+
+	Within the TTL ($STRAPON_RELEASE_TTL seconds) a cached index costs no
+	requests at all; past it, one conditional GET which is usually a 304.
+	The cache holds the releases already sorted, so loading it sorts
+	nothing. When the server can't be reached a stale index is used.
+	"""
+	from ._download import ConnectionPool, DownloadError
+
+	if ttl is None: ttl = float(os.environ.get("STRAPON_RELEASE_TTL", DEFAULT_TTL))
+	if now is None: now = time.time()
+
+	path = os.path.join(get_cache_directory("releases"), hashlib.sha256(url.encode()).hexdigest() + ".json")
+	try:
+		with open(path, "rt") as file:
+			record = json.load(file)
+	except (OSError, ValueError):
+		record = None
+
+	with span("release index", "download", url=url) as trace:
+		if record is not None and now - record["checked"] <= ttl:
+			trace.set(cached=True)
+		else:
+			owns_pool = pool is None
+			if owns_pool: pool = ConnectionPool()
+			try:
+				status, body, response = _conditional_get(pool, url, record)
+			except (OSError, DownloadError) as error:
+				# NOTE: an index that's a bit old beats not installing anything.
+				if record is None: raise
+				trace.set(stale=str(error))
+			else:
+				trace.set(status=status)
+				if status != 304 or record is None:
+					releases = parse_releases(json.loads(body), url, format)
+					releases.sort(key=lambda r : r.key)
+					record = {
+						"url": url,
+						"etag": response.getheader("ETag"),
+						"last_modified": response.getheader("Last-Modified"),
+						"releases": [r.to_dict() for r in releases],
+					}
+
+				record["checked"] = now
+				_save(path, record)
+			finally:
+				if owns_pool: pool.close()
+
+	return ReleaseIndex([Release.from_dict(r) for r in record["releases"]],
+		prereleases=prereleases, presorted=True)
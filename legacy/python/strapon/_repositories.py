@@ -0,0 +1,265 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from ._host_facts import get_host_facts
+from ._backend import perform
+from ._mirrors import get_mirror_selector
+from ._trace import span
+
+# standard imports
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from glob import glob
+import os, re, json
+
+
+
+__all__ = [
+	"Repository",
+	"parse_repository",
+	"existing_sources",
+	"AptRepositoryRegistrar",
+]
+
+
+# Where PPA metadata and signing keys come from; overridable for testing.
+LAUNCHPAD_API = "https://api.launchpad.net/devel"
+PPA_ARCHIVE = "https://ppa.launchpadcontent.net"
+KEYSERVER = "https://keyserver.ubuntu.com"
+
+_ppa_pattern = re.compile(r"^ppa:([\w.+-]+)/([\w.+-]+)$")
+_deb_pattern = re.compile(r"^deb\s+(?:\[([^\]]*)\]\s+)?(\S+)\s+(\S+)(?:\s+(.*))?$")
+
+
+class Repository():
+	"""One apt source: where it is, and where its list and key belong."""
+
+	def __init__(self, spec, uri, suite, components=("main",), options=None,
+			name=None, ppa=None):
+		self.spec = spec
+		self.uri = uri.rstrip("/")
+		self.suite = suite
+		self.components = tuple(components)
+		self.options = dict(options or {})
+		# File name stem under sources.list.d (and keyrings, for PPAs).
+		self.name = name or re.sub(r"[^\w.-]+", "_",
+			"_".join((self.uri.split("://")[-1], suite, *self.components)))
+		# (owner, archive) for PPAs, whose signing key we can look up.
+		self.ppa = ppa
+
+	def __repr__(self):
+		return f"Repository({self.spec!r})"
+
+	@property
+	def key(self):
+		return (_normalize_uri(self.uri), self.suite)
+
+	def line(self):
+		options = " ".join(f"{k}={v}" for k, v in self.options.items())
+		return " ".join(("deb", *([f"[{options}]"] if options else []),
+			self.uri, self.suite, *self.components))
+
+
+def _normalize_uri(uri):
+	# NOTE: a source on any mirror of a group is the same source.
+	uri = get_mirror_selector().canonical(uri.rstrip("/")).rstrip("/")
+	uri = uri.replace("://ppa.launchpad.net/", "://ppa.launchpadcontent.net/")
+	return uri.replace("http://", "https://", 1) if "launchpadcontent" in uri else uri
+
+
+def parse_repository(spec, codename=None):
+	"""Accepts "ppa:owner/archive" or a one line "deb ..." source."""
+	if codename is None:
+		facts = get_host_facts()
+		codename = facts.ubuntu_codename or facts.version_codename
+
+	match = _ppa_pattern.match(spec.strip())
+	if match is not None:
+		owner, archive = match.groups()
+		return Repository(spec, f"{PPA_ARCHIVE}/{owner}/{archive}/ubuntu", codename,
+			name=f"{owner}-ubuntu-{archive}-{codename}", ppa=(owner, archive))
+
+	match = _deb_pattern.match(spec.strip())
+	if match is not None:
+		options, uri, suite, components = match.groups()
+		options = dict(o.split("=", 1) for o in (options or "").split() if "=" in o)
+		return Repository(spec, uri, suite, (components or "").split(), options)
+
+	raise ValueError(f"Unsupported repository '{spec}'.")
+
+
+def existing_sources(root="/"):
+	"""{(uri, suite): {component, ...}} of every source already configured
+	under root."""
+	etc = os.path.join(root, "etc/apt")
+	found = {}
+	for path in [os.path.join(etc, "sources.list"), *glob(os.path.join(etc, "sources.list.d/*.list"))]:
+		try:
+			with open(path, "rt") as file:
+				for line in file:
+					match = _deb_pattern.match(line.strip())
+					if match is not None:
+						found.setdefault((_normalize_uri(match.group(2)), match.group(3)), set()) \
+							.update((match.group(4) or "").split())
+		except OSError:
+			continue
+
+	# deb822 style sources, one paragraph per entry.
+	for path in glob(os.path.join(etc, "sources.list.d/*.sources")):
+		try:
+			with open(path, "rt") as file:
+				paragraphs = file.read().split("\n\n")
+		except OSError:
+			continue
+
+		for paragraph in paragraphs:
+			fields = dict(l.split(":", 1) for l in paragraph.splitlines() if ":" in l and not l.startswith((" ", "#")))
+			if fields.get("Enabled", "yes").strip() == "no":
+				continue
+
+			for uri in fields.get("URIs", "").split():
+				for suite in fields.get("Suites", "").split():
+					found.setdefault((_normalize_uri(uri), suite), set()) \
+						.update(fields.get("Components", "").split())
+
+	return found
+
+
+def _get(pool, url):
+	from ._download import DownloadError
+
+	connection, response = pool.request("GET", url)
+	body = response.read()
+	if response.status >= 400:
+		connection.close()
+		raise DownloadError(f"GET {url} failed with {response.status} {response.reason}.")
+
+	split = urlsplit(url)
+	pool.release(split.scheme, split.netloc, connection)
+	return body
+
+
+def _ppa_key(pool, owner, archive):
+	"""The armored signing key of a PPA, through Launchpad and the keyserver."""
+	metadata = json.loads(_get(pool, f"{LAUNCHPAD_API}/~{owner}/+archive/ubuntu/{archive}"))
+	fingerprint = metadata["signing_key_fingerprint"]
+	return _get(pool, f"{KEYSERVER}/pks/lookup?op=get&options=mr&exact=on&search=0x{fingerprint}").decode()
+
+
+class AptRepositoryRegistrar():
+	"""Registers many repositories at once, replacing one add-apt-repository
+	process (and key fetch) per repository.
+
+	Repositories already configured are skipped, keys for the rest are
+	fetched concurrently, and every list and keyring is written in a single
+	backend operation. When the package index was fresh, only the new
+	sources are refreshed, otherwise the next index refreshes everything.
+	"""
+	is_multiplexer = True
+
+	def __init__(self, installer):
+		self.installer = installer
+
+	def __call__(self, *specs):
+		"""Returns the Repositories that were actually added."""
+		from ._index_state import index_is_fresh, record_index
+
+		root = self.installer.root
+		present = existing_sources(root)
+		added = {}
+		for spec in specs:
+			repository = parse_repository(spec)
+			components = present.setdefault(repository.key, set())
+			# NOTE: only what adds a component is new, which also drops
+			#       repeats within the batch.
+			if not set(repository.components) <= components:
+				components.update(repository.components)
+				added[repository.spec] = repository
+
+		added = list(added.values())
+		if not added:
+			return added
+
+		# NOTE: checked before writing, since new lists change the fingerprint.
+		fresh = index_is_fresh(self.installer)
+		keys = self.fetch_keys(added)
+
+		selector = get_mirror_selector()
+		for repository in added:
+			repository.uri = selector.rewrite(repository.uri).rstrip("/")
+
+		files, lists = [], []
+		for repository in added:
+			if repository.ppa is not None:
+				keyring = f"/etc/apt/keyrings/{repository.name}.asc"
+				repository.options.setdefault("signed-by", keyring)
+				files.append({"path": os.path.join(root, keyring.lstrip("/")),
+					"content": keys[repository.ppa], "mode": 0o644})
+
+			lists.append(os.path.join(root, f"etc/apt/sources.list.d/{repository.name}.list"))
+			files.append({"path": lists[-1], "content": repository.line() + "\n", "mode": 0o644})
+
+		with span("register repositories", "phase", added=len(added)):
+			perform("write_files", files=files)
+
+		if fresh:
+			self.refresh(added)
+			# NOTE: the rest of the index is no fresher than it was.
+			record_index(self.installer, only=lists)
+
+		return added
+
+	@staticmethod
+	def fetch_keys(repositories):
+		"""{(owner, archive): armored key} for every PPA among repositories."""
+		from ._download import ConnectionPool
+
+		ppas = list(dict.fromkeys(r.ppa for r in repositories if r.ppa is not None))
+		if not ppas:
+			return {}
+
+		pool = ConnectionPool()
+		try:
+			with span("fetch signing keys", "download", keys=len(ppas)), \
+					ThreadPoolExecutor(max_workers=min(8, len(ppas))) as executor:
+				return dict(zip(ppas, executor.map(lambda ppa : _ppa_key(pool, *ppa), ppas)))
+		finally:
+			pool.close()
+
+	def refresh(self, repositories):
+		"""Refreshes the package index of just these repositories."""
+		from ._backend import BackendError
+
+		argv = self.installer._native.bake("update").argv()
+		content = "".join(r.line() + "\n" for r in repositories)
+		with span("refresh added sources", "phase", sources=len(repositories)) as trace:
+			result = perform("refresh_sources", argv=argv, root=self.installer.root, content=content)
+			trace.set(exit_code=result["exit_code"])
+
+		if result["exit_code"] != 0:
+			raise BackendError(f"Refreshing the added sources failed:\n{result['stderr'].strip()}",
+				result["exit_code"], result["stdout"], result["stderr"])
@@ -0,0 +1,122 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+# NOTE: dpcontracts and sh are imported below, only when they're needed.
+
+# internal imports
+from . import _trace
+
+# standard imports
+import os
+
+
+
+__all__ = [
+	"OPTIMIZED",
+	"require",
+	"types",
+	"Command",
+]
+
+
+# Production mode: selected by running python with -O, or by setting
+# STRAPON_OPTIMIZE to anything other than "" or "0". Contract checks become
+# plain pass-throughs; development keeps the full dpcontracts checks.
+OPTIMIZED = not __debug__ or os.environ.get("STRAPON_OPTIMIZE", "") not in ("", "0")
+
+
+if OPTIMIZED:
+	def _passthrough(f): return f
+
+	def require(description, predicate): return _passthrough
+	def types(**requirements): return _passthrough
+else:
+	from dpcontracts import require, types
+
+
+class Command():
+	"""Stands in for sh.Command until it's first run, so importing sh and
+	resolving the program on PATH only happen once a backend is used.
+
+	Privileged commands run in the backend worker (see _backend.py) rather
+	than a fresh subprocess, unless STRAPON_BACKEND=direct.
+	"""
+
+	def __init__(self, path, *args, privileged=False, **kwargs):
+		self._path = path
+		self._args = args
+		self._kwargs = kwargs
+		self._command = None
+		self.privileged = privileged
+
+	def bake(self, *args, **kwargs):
+		return Command(self._path, *self._args, *args,
+			privileged=self.privileged, **{**self._kwargs, **kwargs})
+
+	def argv(self, *args):
+		return [self._path, *map(str, self._args), *map(str, args)]
+
+	def resolve(self):
+		if self._command is None:
+			from sh import Command as ShCommand
+
+			command = ShCommand(self._path)
+			if self._args or self._kwargs:
+				command = command.bake(*self._args, **self._kwargs)
+			self._command = command
+
+		return self._command
+
+	def __call__(self, *args, **kwargs):
+		# NOTE: sh's special keyword arguments only mean something to sh.
+		if self.privileged and not kwargs and not self._kwargs:
+			from ._backend import backend_enabled, get_backend
+			if backend_enabled():
+				return get_backend().run(self.argv(*args))
+
+		if _trace._tracer is None:
+			return self.resolve()(*args, **kwargs)
+
+		argv = " ".join((str(self), *map(str, args)))
+		with _trace.span(argv, "command") as span:
+			# NOTE: sh only hands back the process (rather than its output)
+			#       when asked, and background commands haven't exited yet.
+			if kwargs.get("_bg", False) or kwargs.get("_fg", False) or "_return_cmd" in kwargs:
+				return self.resolve()(*args, **kwargs)
+
+			result = self.resolve()(*args, _return_cmd=True, **kwargs)
+			span.set(exit_code=result.exit_code, pid=result.pid)
+			return str(result)
+
+	def __eq__(self, other):
+		return isinstance(other, Command) and \
+			(self._path, self._args, self._kwargs) == (other._path, other._args, other._kwargs)
+
+	def __hash__(self):
+		return hash((self._path, self._args))
+
+	def __str__(self):
+		return " ".join((self._path, *map(str, self._args)))
+
+	def __repr__(self):
+		return f"Command({str(self)!r})"
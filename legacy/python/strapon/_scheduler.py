@@ -0,0 +1,150 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from ._trace import span
+from ._progress import progress_context
+
+# standard imports
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import os
+
+
+
+__all__ = [
+	"SchedulerError",
+	"Task",
+	"Scheduler",
+]
+
+
+class SchedulerError(Exception): pass
+
+
+class Task():
+	def __init__(self, name, action, requires=(), exclusive=None):
+		self.name = name
+		self.action = action
+		self.requires = tuple(requires)
+		# Name of a resource only one task may hold at a time, eg. "native:apt"
+		# for anything that takes the dpkg lock.
+		self.exclusive = exclusive
+
+	def __repr__(self):
+		return f"Task({self.name!r})"
+
+
+class Scheduler():
+	"""Runs a DAG of tasks on a thread pool, starting each one as soon as its
+	requirements finish and its exclusive resource (if any) is free."""
+
+	def __init__(self, workers=None):
+		self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+		self.tasks = {}
+
+	def add(self, name, action, requires=(), exclusive=None):
+		if name in self.tasks:
+			raise SchedulerError(f"Task '{name}' was already added.")
+
+		task = self.tasks[name] = Task(name, action, requires, exclusive)
+		return task
+
+	def order(self):
+		"""Returns the task names in a valid serial order, checking the graph."""
+		state, order = {}, []
+
+		def visit(name, path):
+			if state.get(name) == "done": return
+			elif state.get(name) == "visiting":
+				raise SchedulerError(f"Dependency cycle: {' -> '.join(path + [name])}")
+			elif not name in self.tasks:
+				raise SchedulerError(f"'{path[-1]}' requires unknown task '{name}'.")
+
+			state[name] = "visiting"
+			for requirement in self.tasks[name].requires:
+				visit(requirement, path + [name])
+
+			state[name] = "done"
+			order.append(name)
+
+		for name in self.tasks: visit(name, [])
+		return order
+
+	@staticmethod
+	def _traced(task):
+		with span(task.name, "task", exclusive=task.exclusive), progress_context(task.name):
+			return task.action()
+
+	def run(self):
+		"""Runs every task, returning {name: result}. The first failure stops
+		anything new from starting and is re-raised once running tasks end."""
+		order = self.order()
+		waiting = {name: set(self.tasks[name].requires) for name in order}
+		dependents = {name: [] for name in order}
+		for name in order:
+			for requirement in self.tasks[name].requires:
+				dependents[requirement].append(name)
+
+		results, held, running = {}, set(), {}
+		failure = None
+
+		with ThreadPoolExecutor(max_workers=self.workers) as executor:
+			while waiting or running:
+				if failure is None:
+					# Dispatch in serial order so ties resolve predictably.
+					for name in [n for n in order if n in waiting and not waiting[n]]:
+						task = self.tasks[name]
+						if task.exclusive is not None:
+							if task.exclusive in held: continue
+							held.add(task.exclusive)
+
+						del waiting[name]
+						running[executor.submit(self._traced, task)] = task
+
+				if not running:
+					break
+
+				done, _ = wait(running, return_when=FIRST_COMPLETED)
+				for future in done:
+					task = running.pop(future)
+					held.discard(task.exclusive)
+
+					try:
+						results[task.name] = future.result()
+					except BaseException as error:
+						if failure is None:
+							failure = SchedulerError(f"Task '{task.name}' failed: {error}")
+							failure.__cause__ = error
+						continue
+
+					for dependent in dependents[task.name]:
+						waiting[dependent].discard(task.name)
+
+		if failure is not None:
+			raise failure
+		elif waiting:
+			raise SchedulerError(f"Tasks never became ready: {', '.join(waiting)}")
+
+		return results
@@ -0,0 +1,189 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+#...
+
+# standard imports
+from time import perf_counter_ns
+import os, sys, json, atexit, threading
+
+
+
+__all__ = [
+	"Tracer",
+	"span",
+	"enable",
+	"disable",
+	"get_tracer",
+	"trace_to",
+	"trace_from_environment",
+]
+
+
+# Files a trace is written to on exit.
+_outputs = set()
+
+# None while tracing is off, which is the common case; every span() call
+# checks this first and hands back the shared no-op span.
+_tracer = None
+
+
+class _NullSpan():
+	__slots__ = ()
+	def __enter__(self): return self
+	def __exit__(self, *error): return False
+	def set(self, **args): pass
+
+_null_span = _NullSpan()
+
+
+class _Span():
+	__slots__ = ("tracer", "name", "category", "args", "start")
+
+	def __init__(self, tracer, name, category, args):
+		self.tracer = tracer
+		self.name = name
+		self.category = category
+		self.args = args
+
+	def __enter__(self):
+		self.start = perf_counter_ns()
+		return self
+
+	def __exit__(self, kind, error, traceback):
+		end = perf_counter_ns()
+		if kind is not None:
+			message = str(error).strip().split("\n", 1)[0]
+			self.args.setdefault("error", f"{kind.__name__}: {message}")
+			exit_code = getattr(error, "exit_code", None)
+			if exit_code is not None: self.args.setdefault("exit_code", exit_code)
+
+		self.tracer.record(self.name, self.category, self.start, end, self.args)
+		return False
+
+	def set(self, **args):
+		"""Attaches results (exit code, bytes, ...) before the span ends."""
+		self.args.update(args)
+
+
+class Tracer():
+	"""Collects finished spans as Chrome trace "complete" events."""
+
+	def __init__(self):
+		self.origin = perf_counter_ns()
+		self.pid = os.getpid()
+		self.events = []
+
+	def record(self, name, category, start, end, args):
+		# NOTE: list.append is atomic, so worker threads need no lock here.
+		self.events.append({
+			"name": name,
+			"cat": category,
+			"ph": "X",
+			"ts": (start - self.origin) / 1000,
+			"dur": (end - start) / 1000,
+			"pid": self.pid,
+			"tid": threading.get_ident(),
+			"args": args,
+		})
+
+	def chrome_trace(self):
+		"""The trace in Chrome's trace-event format, for chrome://tracing
+		or https://ui.perfetto.dev"""
+		return {"traceEvents": self.events, "displayTimeUnit": "ms"}
+
+	def write(self, path):
+		with open(path, "wt") as file:
+			json.dump(self.chrome_trace(), file)
+
+	def summary(self):
+		"""A table of time spent per category and span name."""
+		totals = {}
+		for event in self.events:
+			key = (event["cat"], event["name"].split(" ", 1)[0])
+			count, total, longest = totals.get(key, (0, 0.0, 0.0))
+			totals[key] = (count + 1, total + event["dur"], max(longest, event["dur"]))
+
+		lines = [f"{'category':<12} {'span':<32} {'count':>6} {'total ms':>10} {'max ms':>10}"]
+		for (category, name), (count, total, longest) in \
+				sorted(totals.items(), key=lambda item: -item[1][1]):
+			lines.append(f"{category:<12} {name[:32]:<32} {count:>6} {total / 1000:>10.2f} {longest / 1000:>10.2f}")
+
+		return "\n".join(lines)
+
+
+def span(name, category="strapon", **args):
+	"""Context manager timing a phase, eg. `with span("index", "apt"):`"""
+	if _tracer is None:
+		return _null_span
+
+	return _Span(_tracer, name, category, args)
+
+
+def enable():
+	global _tracer
+	if _tracer is None: _tracer = Tracer()
+	return _tracer
+
+
+def disable():
+	"""Stops tracing, returning the tracer with what it collected."""
+	global _tracer
+	tracer, _tracer = _tracer, None
+	return tracer
+
+
+def get_tracer():
+	return _tracer
+
+
+def _write_trace(tracer, path):
+	tracer.write(path)
+	print(tracer.summary(), file=sys.stderr)
+	print(f"trace written to {path}", file=sys.stderr)
+
+
+def trace_to(path):
+	"""Enables tracing, writing the Chrome trace to path and a summary table
+	to stderr when the process exits."""
+	tracer = enable()
+	path = os.path.abspath(path)
+	if not path in _outputs:
+		_outputs.add(path)
+		atexit.register(_write_trace, tracer, path)
+
+	return tracer
+
+
+def trace_from_environment():
+	"""Honours $STRAPON_TRACE=FILE, which (unlike --trace) is seen before
+	any module is imported, so spans from decorators aren't missed."""
+	path = os.environ.get("STRAPON_TRACE")
+	if not path:
+		return None
+
+	return trace_to(path)
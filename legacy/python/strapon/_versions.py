@@ -0,0 +1,240 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+#...
+
+# standard imports
+from functools import lru_cache
+from bisect import bisect_left, bisect_right
+import re
+
+
+
+__all__ = [
+	"CODENAMES",
+	"version_key",
+	"Constraint",
+	"compile_constraint",
+]
+
+
+# Release codenames, so constraints like "<=focal" or "bookworm" work.
+CODENAMES = {
+	# Ubuntu
+	"trusty": "14.04", "xenial": "16.04", "bionic": "18.04", "focal": "20.04",
+	"groovy": "20.10", "hirsute": "21.04", "impish": "21.10", "jammy": "22.04",
+	"kinetic": "22.10", "lunar": "23.04", "mantic": "23.10", "noble": "24.04",
+	"oracular": "24.10", "plucky": "25.04",
+	# Debian
+	"jessie": "8", "stretch": "9", "buster": "10", "bullseye": "11",
+	"bookworm": "12", "trixie": "13", "forky": "14",
+}
+
+
+def _segment_key(text):
+	"""dpkg's verrevcmp() as a sortable tuple: alternating non-digit runs
+	(each char weighted so '~' < end < letters < everything else) and ints."""
+	key = []
+	for letters, digits in re.findall(r"(\D*)(\d*)", text):
+		if not letters and not digits:
+			continue
+
+		weights = tuple(-1 if c == "~" else ord(c) if c.isalpha() else ord(c) + 256 for c in letters)
+		key.append((weights + (0,), int(digits) if digits else 0))
+
+	# NOTE: the terminator lets a shorter version compare correctly against
+	#       a longer one which continues with '~'; trailing copies of it
+	#       (eg. the revision "0") compare equal to nothing at all.
+	while key and key[-1] == ((0,), 0): key.pop()
+	key.append(((0,), 0))
+	return tuple(key)
+
+
+@lru_cache(maxsize=None)
+def version_key(version):
+	"""A tuple ordering like dpkg --compare-versions, epochs and tildes
+	included. Interned, so repeated versions cost one dict lookup."""
+	version = CODENAMES.get(version, version)
+	# NOTE: dpkg splits the epoch off at the first colon, the upstream
+	#       version and revision at the last hyphen.
+	epoch, _, rest = version.partition(":") if ":" in version else ("0", "", version)
+	upstream, _, revision = rest.rpartition("-") if "-" in rest else (rest, "", "")
+	return (int(epoch or 0), _segment_key(upstream), _segment_key(revision))
+
+
+_term_pattern = re.compile(r"^(<=|>=|==|!=|<|>|=|\^|~(?=\d))?\s*(\S+)$")
+
+
+def _bump(version, index):
+	"""The smallest version above every version sharing its first index+1
+	numeric components, eg. _bump("1.2.3", 0) == "2"."""
+	parts = re.findall(r"\d+", version) or ["0"]
+	parts = parts[:index + 1]
+	while len(parts) <= index: parts.append("0")
+	parts[index] = str(int(parts[index]) + 1)
+	return ".".join(parts)
+
+
+class _Interval():
+	"""One "||" alternative: low/high bounds on version keys plus exclusions."""
+	__slots__ = ("low", "low_inclusive", "high", "high_inclusive", "excluded")
+
+	def __init__(self):
+		self.low = None
+		self.low_inclusive = True
+		self.high = None
+		self.high_inclusive = True
+		self.excluded = set()
+
+	def add(self, op, version):
+		key = version_key(version)
+
+		if op in ("", "=", "=="):
+			self.lower(key, True)
+			self.upper(key, True)
+		elif op == "!=":
+			self.excluded.add(key)
+		elif op in (">", ">="):
+			self.lower(key, op == ">=")
+		elif op in ("<", "<="):
+			self.upper(key, op == "<=")
+		elif op == "^":
+			# Compatible with: same first non-zero component.
+			parts = re.findall(r"\d+", version) or ["0"]
+			index = next((i for i, p in enumerate(parts) if int(p) != 0), len(parts) - 1)
+			self.lower(key, True)
+			self.upper(version_key(_bump(version, index) + "~"), False)
+		elif op == "~":
+			# Approximately: same major.minor, or major if that's all there is.
+			parts = re.findall(r"\d+", version)
+			self.lower(key, True)
+			self.upper(version_key(_bump(version, 1 if len(parts) > 1 else 0) + "~"), False)
+
+	def lower(self, key, inclusive):
+		if self.low is None or key > self.low or (key == self.low and not inclusive):
+			self.low, self.low_inclusive = key, inclusive
+
+	def upper(self, key, inclusive):
+		if self.high is None or key < self.high or (key == self.high and not inclusive):
+			self.high, self.high_inclusive = key, inclusive
+
+	def contains(self, key):
+		if self.low is not None and (key < self.low or (key == self.low and not self.low_inclusive)):
+			return False
+		if self.high is not None and (key > self.high or (key == self.high and not self.high_inclusive)):
+			return False
+
+		return not key in self.excluded
+
+	def slice(self, keys):
+		"""Index range of a sorted key list inside the bounds."""
+		start, stop = 0, len(keys)
+		if self.low is not None:
+			start = (bisect_left if self.low_inclusive else bisect_right)(keys, self.low)
+		if self.high is not None:
+			stop = (bisect_right if self.high_inclusive else bisect_left)(keys, self.high)
+
+		return start, max(start, stop)
+
+
+class Constraint():
+	"""A compiled version expression, eg. ">=18.04 <22 || focal" or "^18".
+
+	Terms separated by whitespace or commas must all hold, "||" separates
+	alternatives, and "a - b" is an inclusive range. Versions are ordered
+	the way dpkg orders them, and known codenames stand in for versions.
+	"""
+	__slots__ = ("text", "alternatives")
+
+	def __init__(self, text):
+		self.text = text
+		self.alternatives = tuple(self._parse(a) for a in text.split("||"))
+
+	@staticmethod
+	def _parse(text):
+		interval = _Interval()
+		text = re.sub(r"(\S+)\s+-\s+(\S+)", r">=\1 <=\2", text.strip())
+		# Allow "<= 2" as well as "<=2".
+		text = re.sub(r"(<=|>=|==|!=|<|>|=|\^)\s+", r"\1", text)
+
+		for term in re.split(r"[\s,]+", text):
+			if not term or term in ("*", "x"):
+				continue
+
+			match = _term_pattern.match(term)
+			if match is None:
+				raise ValueError(f"Invalid version constraint term '{term}'.")
+
+			op, version = match.group(1) or "", match.group(2)
+			if version.endswith((".x", ".*")):
+				op, version = "~" if version.count(".") > 1 else "^", version[:-2]
+
+			interval.add(op, version)
+
+		return interval
+
+	def __repr__(self):
+		return f"Constraint({self.text!r})"
+
+	def matches(self, version):
+		key = version_key(version)
+		for interval in self.alternatives:
+			if interval.contains(key): return True
+
+		return False
+
+	def filter(self, versions):
+		"""Bulk form of matches(), keeping the order of versions."""
+		return [v for v in versions if self.matches(v)]
+
+	def select_sorted(self, keys):
+		"""For a list of version_key()s already in ascending order, returns the
+		indexes that match; each alternative costs two bisects."""
+		selected = set()
+		for interval in self.alternatives:
+			start, stop = interval.slice(keys)
+			selected.update(i for i in range(start, stop) if not keys[i] in interval.excluded)
+
+		return sorted(selected)
+
+	def highest_sorted(self, keys):
+		"""The index of the highest matching key in an ascending list of
+		version_key()s, or None; a couple of bisects rather than a scan."""
+		best = None
+		for interval in self.alternatives:
+			start, stop = interval.slice(keys)
+			for i in range(stop - 1, start - 1, -1):
+				if not keys[i] in interval.excluded:
+					if best is None or i > best: best = i
+					break
+
+		return best
+
+
+@lru_cache(maxsize=None)
+def compile_constraint(text):
+	"""Interned Constraint for text, so each expression is parsed only once."""
+	return Constraint(text)
@@ -40,9 +40,10 @@ def standalone(*args):
 
 # Call to install/reinstall/uninstall the application via a system native package manager.
 @strapon(SystemInstaller.default())
-@SystemInstaller.register_repository("ppa:kritalime/ppa", "ubuntu")
-def system(installer, *args):
-	pass
+@SystemInstaller.register_repository("ppa:kritalime/ppa", os_name="ubuntu")
+@SystemInstaller.stage_package("krita")
+def system(installer, namespace):
+	installer.exec(namespace)
 
 # Call to build and install the package from source if you're a crazy person.
 def source(*args):
@@ -34,11 +34,11 @@ from . import *
 
 # Call to install/reinstall/uninstall the application via a system native package manager.
 @strapon(SystemInstaller.default())
-@package("profanity")
+@SystemInstaller.stage_package("profanity")
 # What's really cool about profanity is it's supported on just about
 # every mainstream Linux Distro via their *main* package repositories.
-class system():
-	pass
+def system(installer, namespace):
+	installer.exec(namespace)
 
 # Call to build and install the package from source if you're a crazy person.
 def source():
@@ -0,0 +1,59 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Shared setup for the tests: strapon and the benchmark harness (stub apt,
+throwaway target root, local artifact server) on sys.path.
+
+Run from legacy/python: `python -m pytest tests` or
+`python -m unittest discover tests`
+"""
+
+# external imports
+#...
+
+# internal imports
+#...
+
+# standard imports
+import os, sys, subprocess
+
+PYTHON = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PYTHON, "benchmarks"))
+sys.path.insert(0, PYTHON)
+
+from _harness import BenchEnvironment
+
+
+
+__all__ = [
+	"PYTHON",
+	"BenchEnvironment",
+	"run_python",
+]
+
+
+def run_python(code, env=None, **kwargs):
+	"""Runs code in a fresh interpreter with strapon importable."""
+	environment = dict(os.environ if env is None else env)
+	environment["PYTHONPATH"] = PYTHON
+	return subprocess.run([sys.executable, "-c", code], env=environment, cwd=PYTHON,
+		capture_output=True, text=True, **kwargs)
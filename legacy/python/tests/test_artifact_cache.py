@@ -0,0 +1,118 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, stat, time, hashlib, unittest
+
+
+
+class ArtifactCacheTest(unittest.TestCase):
+	def setUp(self):
+		from strapon._artifact_cache import ArtifactCache
+
+		self.env = BenchEnvironment().__enter__()
+		os.makedirs(self.env.path("www"), exist_ok=True)
+		self.data = os.urandom(100000)
+		with open(self.env.path("www", "file"), "wb") as file:
+			file.write(self.data)
+		self.url = f"{self.env.serve()}/file"
+		self.cache = ArtifactCache(self.env.path("artifacts"))
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def test_short_downloads_are_not_cached(self):
+		from strapon._download import DownloadError
+
+		with self.assertRaises(DownloadError):
+			self.cache.fetch(f"{self.env.serve(ranges=False, cut_after=1000)}/file")
+		self.assertEqual(self.cache.stats()["objects"], 0)
+
+	def test_mismatched_downloads_are_not_cached(self):
+		from strapon._download import DownloadError
+
+		with self.assertRaises(DownloadError):
+			self.cache.fetch(self.url, sha256="0" * 64)
+		self.assertEqual(self.cache.stats()["objects"], 0)
+
+		path = self.cache.fetch(self.url, sha256=hashlib.sha256(self.data).hexdigest())
+		self.assertEqual(os.path.basename(path), hashlib.sha256(self.data).hexdigest())
+
+	def test_hits_must_match_their_sha256(self):
+		from strapon._download import DownloadError
+
+		self.cache.fetch(self.url)
+		requests = self.env.requests()
+		with self.assertRaises(DownloadError):
+			self.cache.fetch(self.url, sha256="0" * 64)
+		# The cached object was passed over for a fresh download.
+		self.assertGreater(self.env.requests(), requests + 1)
+
+	def test_oversized_objects_outlive_their_store(self):
+		from strapon._artifact_cache import ArtifactCache
+
+		cache = ArtifactCache(self.env.path("small"), max_size=1000)
+		self.assertTrue(os.path.exists(cache.fetch(self.url)))
+
+	def test_prune_spares_objects_in_use(self):
+		from strapon._artifact_cache import IN_USE_WINDOW
+
+		path = self.cache.fetch(self.url)
+		self.assertEqual(self.cache.prune(max_size=0), [])
+		self.assertTrue(os.path.exists(path))
+		self.assertEqual(self.cache.prune(max_size=0, now=time.time() + IN_USE_WINDOW + 1),
+			[os.path.basename(path)])
+
+	def test_placed_modes(self):
+		path = self.cache.fetch(self.url)
+		executable = self.env.path("executable")
+		self.assertIn(self.cache.install(self.url, executable, mode=0o755), ("reflink", "copy"))
+		self.assertEqual(stat.S_IMODE(os.stat(executable).st_mode), 0o755)
+		self.assertNotEqual(os.stat(executable).st_ino, os.stat(path).st_ino)
+		self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o444)
+
+		shared = self.env.path("shared")
+		if self.cache.install(self.url, shared) == "hardlink":
+			self.assertEqual(os.stat(shared).st_ino, os.stat(path).st_ino)
+		self.assertEqual(stat.S_IMODE(os.stat(shared).st_mode), 0o444)
+
+	def test_appimages_are_executable(self):
+		from strapon import WebInstaller
+
+		os.link(self.env.path("www", "file"), self.env.path("www", "app.AppImage"))
+		WebInstaller(f"{self.env.serve()}/app.AppImage", root=self.env.root).fetch("/app", cache=self.cache)
+		self.assertTrue(os.access(os.path.join(self.env.root, "app"), os.X_OK))
+
+	def test_lock_files_are_removed(self):
+		self.cache.fetch(self.url)
+		self.assertEqual([n for n in os.listdir(self.cache.temporary) if n.endswith(".lock")], [])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,137 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import io, os, json, signal, unittest
+
+
+
+class NativeActionTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		self.env.stub(log=True, prompt=True)
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def calls(self):
+		with open(self.env.path("apt.log"), "rt") as file:
+			return [line.split() for line in file]
+
+	def test_changes_dont_wait_for_confirmation(self):
+		from strapon import SystemInstaller
+
+		for mode in ("direct", "worker"):
+			with self.subTest(mode=mode):
+				os.environ["STRAPON_BACKEND"] = mode
+				installer = SystemInstaller("apt", self.env.root)
+				self.assertEqual(installer._install("new"), ["new"])
+				self.assertEqual(installer._remove("installed1"), ["installed1"])
+				self.assertEqual(installer._purge("installed2"), ["installed2"])
+
+		for argv in self.calls():
+			self.assertIn("-y", argv)
+
+class WorkerProtocolTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		os.environ["STRAPON_SUDO"] = ""
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def serve(self, *requests):
+		from strapon._backend import serve
+
+		responses = io.BytesIO()
+		serve(io.BytesIO(b"".join(json.dumps(r).encode() + b"\n" for r in requests)), responses)
+		return [json.loads(line) for line in responses.getvalue().splitlines()]
+
+	def test_requests_and_responses(self):
+		ping, missing, run, shutdown = self.serve(
+			{"id": 0, "op": "ping"},
+			{"id": 1, "op": "no-such-op"},
+			{"id": 2, "op": "run", "args": {"argv": ["echo", "hello"]}},
+			{"id": 3, "op": "shutdown"},
+			{"id": 4, "op": "ping"})
+		self.assertEqual((ping["id"], ping["ok"], ping["pid"]), (0, True, os.getpid()))
+		self.assertEqual((missing["id"], missing["ok"]), (1, False))
+		self.assertIn("no-such-op", missing["error"])
+		self.assertEqual((run["exit_code"], run["stdout"]), (0, "hello\n"))
+		self.assertEqual((shutdown["id"], shutdown["ok"]), (3, True))
+
+	def test_streamed_events_come_first(self):
+		*events, response = self.serve({"id": 7, "op": "run", "stream": "lines",
+			"args": {"argv": ["printf", "one\\ntwo\\n"]}})
+		self.assertEqual([e["event"]["message"] for e in events], ["one", "two"])
+		self.assertEqual({e["id"] for e in events}, {7})
+		self.assertTrue(response["ok"])
+
+		# Progress subscribers don't get output lines.
+		responses = self.serve({"id": 8, "op": "run", "stream": "progress",
+			"args": {"argv": ["printf", "one\\n"]}})
+		self.assertEqual(len(responses), 1)
+
+	def test_worker(self):
+		from strapon._backend import Backend, BackendError
+
+		backend = Backend().start()
+		try:
+			self.assertNotEqual(backend.pid, os.getpid())
+			self.assertEqual(backend.run(["echo", "hello"]), "hello\n")
+			with self.assertRaises(BackendError) as raised:
+				backend.run(["sh", "-c", "echo oops >&2; exit 3"])
+			self.assertEqual((raised.exception.exit_code, raised.exception.stderr), (3, "oops\n"))
+
+			path = self.env.path("written")
+			files = [{"path": path, "content": "content\n", "mode": 0o600}]
+			self.assertEqual(backend.call("write_files", files=files)["written"], [path])
+			self.assertEqual(backend.call("write_files", files=files)["written"], [])
+
+			# A worker that died is replaced on the next call.
+			pid = backend.pid
+			os.kill(pid, signal.SIGKILL)
+			with self.assertRaises(BackendError):
+				backend.call("ping")
+			self.assertNotEqual(backend.call("ping")["pid"], pid)
+		finally:
+			backend.close()
+
+	def test_satisfied_packages_are_skipped(self):
+		from strapon import SystemInstaller
+
+		self.env.stub(log=True)
+		installer = SystemInstaller("apt", self.env.root)
+		self.assertEqual(installer._install("installed1", "installed2"), [])
+		self.assertEqual(installer._remove("missing"), [])
+		self.assertFalse(os.path.exists(self.env.path("apt.log")))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,120 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, types, unittest
+
+
+
+class BatchTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		self.env.stub(log=True)
+		os.environ["STRAPON_SUDO"] = ""
+
+	def tearDown(self):
+		from strapon import _mirrors
+
+		_mirrors._selector = None
+		self.env.__exit__(None, None, None)
+
+	def calls(self):
+		try:
+			with open(self.env.path("apt.log"), "rt") as file:
+				return [line.split() for line in file]
+		except FileNotFoundError:
+			return []
+
+	def plan(self, module, *packages):
+		from strapon._plan import InstallPlan
+		return InstallPlan(module, "system", "apt", self.env.root, packages=packages,
+			index_before_action=False)
+
+	def test_unusable_modules_are_skipped(self):
+		from strapon._batch import plan_modules
+
+		plan = plan_modules(["nonexistent", "nonexistent:standalone", "steam"])
+		self.assertEqual(list(plan.skipped), ["nonexistent", "steam"])
+		self.assertEqual(plan.skipped["nonexistent"], "no such module")
+		self.assertEqual(plan.backends, {})
+		self.assertIn("skipped nonexistent: no such module", plan.report("install"))
+
+	def test_one_transaction_per_installer(self):
+		from strapon._batch import BatchPlan
+
+		plan = BatchPlan()
+		plan.add_plan(self.plan("a", "new1", "shared"))
+		plan.add_plan(self.plan("b", "shared", "installed1"))
+		self.assertEqual(list(plan.origins()), [("apt", "new1", ["a"]),
+			("apt", "shared", ["a", "b"]), ("apt", "installed1", ["b"])])
+		self.assertIn("apt: installed1 <- b (already satisfied)", plan.report("install"))
+
+		results = plan.exec("install")
+		self.assertEqual(sorted(results), ["download:apt", "install:apt"])
+		installs = [argv for argv in self.calls() if "install" in argv and not "--print-uris" in argv]
+		self.assertEqual(len(installs), 1)
+		self.assertEqual(installs[0][-2:], ["new1", "shared"])
+
+	def test_nothing_to_change(self):
+		from strapon._batch import BatchPlan
+
+		plan = BatchPlan()
+		plan.add_plan(self.plan("a", "installed1", "installed2"))
+		self.assertEqual(plan.exec("install"), {})
+		self.assertEqual(sorted(plan.exec("remove")), ["remove:apt"])
+		self.assertEqual(self.calls()[-1][-2:], ["installed1", "installed2"])
+
+	def test_standalone_downloads_go_through_the_installer(self):
+		from strapon import WebInstaller, _mirrors
+		from strapon._batch import BatchPlan
+		from strapon._artifact_cache import ArtifactCache
+
+		base, mirror = self.env.serve(), self.env.serve(delay=0.001)
+		with open(self.env.path("www", "app.bin"), "wb") as file:
+			file.write(os.urandom(1 << 16))
+		_mirrors._selector = _mirrors.MirrorSelector({f"{base}/": {"mirrors": [f"{base}/", f"{mirror}/"],
+			"probe": "app.bin"}},
+			self.env.path("mirrors.json"))
+
+		# Named by a mirror's URL, cached under the group's.
+		installer = WebInstaller(f"{mirror}/app.bin", root=self.env.root)
+		os.makedirs(os.path.join(self.env.root, "opt"))
+		def standalone(namespace):
+			return installer.fetch("/opt/app.bin")
+		standalone.installer = installer
+
+		plan = BatchPlan()
+		plan.add_module("app", types.SimpleNamespace(standalone=standalone), "standalone")
+		self.assertEqual(sorted(plan.exec("install")), ["download:app", "install:app"])
+		self.assertTrue(os.path.isfile(os.path.join(self.env.root, "opt/app.bin")))
+		self.assertEqual(ArtifactCache().stats()["urls"], 1)
+
+
+if __name__ == "__main__":
+	unittest.main()
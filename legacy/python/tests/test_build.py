@@ -0,0 +1,120 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, unittest
+
+
+
+# Logs its argv; "meson setup" and ./configure leave what they'd configure.
+STUB = """#!/bin/sh
+echo "$(basename "$0") $*" >> "$STUB_BUILD_LOG"
+case "$(basename "$0") $1" in
+"meson setup") mkdir -p "$2" && touch "$2/build.ninja";;
+"configure "*) touch Makefile;;
+esac
+"""
+
+
+class BuildStampTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		stubs = self.env.path("build-bin")
+		os.makedirs(stubs)
+		for name in ("meson", "make"):
+			with open(os.path.join(stubs, name), "wt") as file:
+				file.write(STUB)
+			os.chmod(os.path.join(stubs, name), 0o755)
+
+		os.environ["PATH"] = f"{stubs}{os.pathsep}{os.environ['PATH']}"
+		os.environ["STUB_BUILD_LOG"] = self.env.path("build.log")
+		self.tree = self.env.path("tree")
+		os.makedirs(self.tree)
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def write(self, name, content, mode=0o644):
+		with open(os.path.join(self.tree, name), "wt") as file:
+			file.write(content)
+		os.chmod(os.path.join(self.tree, name), mode)
+
+	def configures(self):
+		with open(self.env.path("build.log"), "rt") as file:
+			return [line for line in file if line.startswith(("meson setup", "configure"))]
+
+	def run_pipeline(self):
+		from strapon._build import BuildPipeline
+		return BuildPipeline(self.tree, prefix="/opt/tree").run()
+
+	def test_meson_configures_once(self):
+		self.write("meson.build", "project('tree', 'c')\n")
+		self.assertEqual(self.run_pipeline(), ["configure", "build", "install"])
+		self.assertEqual(self.run_pipeline(), ["build", "install"])
+		self.assertEqual(len(self.configures()), 1)
+
+		# A changed meson.build configures again, in place.
+		self.write("meson.build", "project('tree', 'c', version: '2')\n")
+		self.assertEqual(self.run_pipeline(), ["configure", "build", "install"])
+		self.assertIn("--reconfigure", self.configures()[-1].split())
+
+	def test_autotools_configures_once(self):
+		self.write("configure", STUB, 0o755)
+		self.assertEqual(self.run_pipeline(), ["configure", "build", "install"])
+		self.assertEqual(self.run_pipeline(), ["build", "install"])
+		self.assertEqual(len(self.configures()), 1)
+
+	def test_environment_configures_again(self):
+		from strapon import _build
+
+		database = self.env.path("status")
+		with open(database, "wt") as file: file.write("Package: a\n")
+		_build.PACKAGE_DATABASE, previous = database, _build.PACKAGE_DATABASE
+		self.addCleanup(setattr, _build, "PACKAGE_DATABASE", previous)
+
+		self.write("configure", STUB, 0o755)
+		self.write("configure.ac", "AC_INIT([tree], [1])\n")
+		self.run_pipeline()
+		os.environ["CFLAGS"] = "-O3"
+		self.assertEqual(self.run_pipeline(), ["configure", "build", "install"])
+		with open(database, "at") as file: file.write("\nPackage: libfoo-dev\n")
+		self.assertEqual(self.run_pipeline(), ["configure", "build", "install"])
+		self.write("configure.ac", "AC_INIT([tree], [2])\n")
+		self.assertEqual(self.run_pipeline(), ["configure", "build", "install"])
+		self.assertEqual(self.run_pipeline(), ["build", "install"])
+
+		# Each environment got its own cache, kept in the tree.
+		caches = [argument.split("=", 1)[1] for line in self.configures()
+			for argument in line.split() if argument.startswith("--cache-file=")]
+		self.assertEqual(len(set(caches)), 3)
+		self.assertTrue(all(cache.startswith(self.tree + os.sep) for cache in caches))
+
+
+if __name__ == "__main__":
+	unittest.main()
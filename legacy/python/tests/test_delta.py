@@ -0,0 +1,157 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, unittest
+
+
+
+class DeltaTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		os.makedirs(self.env.path("www"))
+		self.installed = self.env.path("installed")
+		self.old = bytearray(os.urandom(64 << 10))
+		with open(self.installed, "wb") as file:
+			file.write(self.old)
+
+		self.new = bytearray(self.old)
+		self.new[20000:22000] = os.urandom(2000)
+		self.url = f"{self.env.serve()}/app"
+		with open(self.env.path("www", "app"), "wb") as file:
+			file.write(self.new)
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def publish_control(self, edit=None):
+		from strapon._delta import make_control
+
+		control = make_control(self.env.path("www", "app"), "app")
+		if edit is not None: control = edit(control)
+		with open(self.env.path("www", "app.zsync"), "wb") as file:
+			file.write(control)
+
+	def update(self, **kwargs):
+		from strapon._delta import delta_update
+
+		report = delta_update(self.url, self.installed, **kwargs)
+		with open(self.installed, "rb") as file:
+			self.assertEqual(file.read(), self.new)
+		return report
+
+	def test_unchanged_blocks_are_reused(self):
+		self.publish_control()
+		report = self.update(minimum_rate=0)
+		self.assertIsNone(report.fallback)
+		self.assertLess(report.fetched, 8 << 10)
+
+	def test_blocks_need_their_strong_checksum(self):
+		from strapon import _delta
+
+		# Every strong checksum wrong, the weak ones all still match.
+		def corrupt(control):
+			headers, _, sums = control.partition(b"\n\n")
+			lengths = dict(l.split(b": ") for l in headers.split(b"\n"))[b"Hash-Lengths"]
+			_, weak, strong = map(int, lengths.split(b","))
+			sums = bytearray(sums)
+			for offset in range(weak, len(sums), weak + strong):
+				sums[offset] ^= 0xff
+			return headers + b"\n\n" + bytes(sums)
+
+		self.publish_control(corrupt)
+		for md4 in (_delta._md4_openssl, _delta._md4_python):
+			with self.subTest(md4=md4.__name__):
+				try:
+					md4(b"")
+				except ValueError:
+					continue
+
+				original, _delta._md4 = _delta._md4, md4
+				try:
+					report = self.update(minimum_rate=0)
+				finally:
+					_delta._md4 = original
+				self.assertEqual(report.reused, 0)
+				self.assertIsNotNone(report.fallback)
+
+	def test_unverifiable_controls_download_in_full(self):
+		self.publish_control(lambda control : b"\n".join(line for line in control.split(b"\n")
+			if not line.startswith(b"SHA-1: ")))
+		report = self.update(minimum_rate=0)
+		self.assertIn("SHA-1", report.fallback)
+		self.assertEqual(report.reused, 0)
+
+	def test_slow_matching_downloads_in_full(self):
+		self.publish_control()
+		report = self.update(minimum_rate=1 << 40)
+		self.assertIn("slower", report.fallback)
+
+	def test_mostly_changed_files_download_in_full(self):
+		self.publish_control()
+		with open(self.installed, "wb") as file:
+			file.write(os.urandom(len(self.old)))
+		report = self.update(minimum_rate=0)
+		self.assertIn("unchanged", report.fallback)
+
+	def test_full_downloads_are_checked(self):
+		from strapon._delta import DeltaError, delta_update
+
+		self.publish_control(lambda control : b"\n".join(b"SHA-1: " + b"0" * 40
+			if line.startswith(b"SHA-1: ") else line for line in control.split(b"\n")))
+		with self.assertRaises(DeltaError):
+			delta_update(self.url, self.installed, minimum_rate=0)
+		with open(self.installed, "rb") as file:
+			self.assertEqual(file.read(), self.old)
+		self.assertFalse(os.path.exists(f"{self.installed}.new"))
+
+	def test_control_files(self):
+		from strapon._delta import ControlFile, DeltaError, make_control
+
+		data = make_control(self.env.path("www", "app"), "app", blocksize=4096)
+		control = ControlFile.parse(data, f"{self.url}.zsync")
+		self.assertEqual((control.length, control.blocksize, control.count), (len(self.new), 4096, 16))
+		self.assertEqual(control.url, self.url)
+		with self.assertRaises(DeltaError):
+			ControlFile.parse(data[:len(data) // 2])
+
+	def test_controls_for_other_versions_are_ignored(self):
+		from strapon._delta import make_control
+
+		with open(self.env.path("www", "app.zsync"), "wb") as file:
+			file.write(make_control(self.env.path("www", "app"), "app-3"))
+		self.assertEqual(self.update().fallback, "no control file")
+
+	def test_nothing_to_update(self):
+		os.remove(self.installed)
+		self.assertEqual(self.update().fallback, "nothing to update")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,91 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, unittest
+
+
+
+class DownloadTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		os.makedirs(self.env.path("www"), exist_ok=True)
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def publish(self, name, data):
+		with open(self.env.path("www", name), "wb") as file:
+			file.write(data)
+		return data
+
+	def download(self, url, **kwargs):
+		from strapon._download import download
+
+		destination = self.env.path("downloaded")
+		download(url, destination, **kwargs)
+		with open(destination, "rb") as file:
+			return file.read()
+
+	def test_empty_files(self):
+		self.publish("empty", b"")
+		for ranges in (True, False):
+			with self.subTest(ranges=ranges):
+				self.assertEqual(self.download(f"{self.env.serve(ranges=ranges)}/empty"), b"")
+
+	def test_short_body_fails_over(self):
+		data = self.publish("file", os.urandom(100000))
+		cut = self.env.serve(ranges=False, cut_after=1000)
+		good = self.env.serve(ranges=False)
+		failed = []
+		self.assertEqual(self.download(f"{cut}/file", mirrors=[f"{good}/file"],
+			failed=lambda url, error: failed.append(url)), data)
+		self.assertEqual(failed, [f"{cut}/file"])
+
+	def test_short_body_is_an_error(self):
+		from strapon._download import DownloadError
+
+		self.publish("file", os.urandom(100000))
+		for ranges in (True, False):
+			with self.subTest(ranges=ranges), self.assertRaises(DownloadError):
+				self.download(f"{self.env.serve(ranges=ranges, cut_after=1000)}/file")
+			self.assertFalse(os.path.exists(self.env.path("downloaded")))
+
+	def test_short_stream_fails_over(self):
+		from strapon._download import stream
+
+		data = self.publish("file", os.urandom(100000))
+		received = bytearray()
+		stream(f"{self.env.serve(ranges=False, cut_after=1000)}/file", received.extend,
+			mirrors=[f"{self.env.serve()}/file"])
+		self.assertEqual(bytes(received), data)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,164 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, argparse, unittest
+
+
+
+STATUS = """Package: vim
+Status: install ok installed
+Priority: optional
+Version: 2:8.1.2269-1ubuntu5
+Description: Vi IMproved - enhanced vi editor
+ Package: not-a-package
+ Status: install ok not-installed
+ .
+ Version: 0
+
+Package: libc6
+Status: install ok installed
+Architecture: amd64
+Multi-Arch: same
+Version: 2.31-0ubuntu9
+Conffiles:
+ /etc/ld.so.conf.d/x86_64-linux-gnu.conf 593ad12389ab2b6f952e7ede67b8fbbf
+
+Package: libc6
+Status: deinstall ok config-files
+Architecture: i386
+Version: 2.31-0ubuntu8
+
+Package: broken
+Status: install reinstreq half-installed
+Version: 1.0
+
+Package: removed
+Status: deinstall ok config-files
+Version: 3.0
+
+Package: unpacked
+Status: install ok unpacked
+Version: 4.0
+"""
+
+
+class DpkgStatusTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		self.path = self.env.path("status")
+		self.write(STATUS)
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def write(self, content):
+		with open(self.path, "wt") as file:
+			file.write(content)
+
+	def test_parse(self):
+		from strapon._dpkg_status import DpkgStatus
+
+		status = DpkgStatus(self.path)
+		self.assertEqual(status.get("vim"), ("2:8.1.2269-1ubuntu5", "installed"))
+		# Continuation lines are part of the field they continue.
+		self.assertIsNone(status.get("not-a-package"))
+		self.assertEqual(status.get("broken"), ("1.0", "half-installed"))
+		self.assertEqual(status.get("removed"), ("3.0", "config-files"))
+		self.assertTrue(status.is_installed("vim"))
+		self.assertFalse(status.is_installed("unpacked"))
+		self.assertIsNone(status.get("missing"))
+
+	def test_multiarch(self):
+		from strapon._dpkg_status import DpkgStatus
+
+		status = DpkgStatus(self.path)
+		self.assertEqual(status.get("libc6:amd64"), ("2.31-0ubuntu9", "installed"))
+		self.assertEqual(status.get("libc6:i386"), ("2.31-0ubuntu8", "config-files"))
+		# The bare name is whichever architecture is actually there.
+		self.assertEqual(status.get("libc6"), ("2.31-0ubuntu9", "installed"))
+
+	def test_changes_are_reread(self):
+		from strapon._dpkg_status import DpkgStatus
+
+		status = DpkgStatus(self.path)
+		self.assertTrue(status.is_installed("vim"))
+		self.write(STATUS.replace("Status: install ok installed\nPriority",
+			"Status: deinstall ok config-files\nPriority"))
+		self.assertFalse(status.is_installed("vim"))
+
+		os.remove(self.path)
+		self.assertIsNone(status.get("vim"))
+		self.write("")
+		self.assertIsNone(status.get("vim"))
+
+	def test_satisfying(self):
+		from strapon._dpkg_status import DpkgStatus
+
+		status = DpkgStatus(self.path)
+		self.assertEqual(status.satisfying(">=2:8", ["vim", "libc6", "removed", "missing"]), ["vim"])
+
+	def test_plan_changes(self):
+		from strapon._dpkg_status import DpkgStatus, plan_changes
+
+		status = DpkgStatus(self.path)
+		packages = ["vim", "broken", "removed", "unpacked", "missing"]
+		self.assertEqual(plan_changes(status, "install", packages), ["broken", "removed", "unpacked", "missing"])
+		self.assertEqual(plan_changes(status, "remove", packages), ["vim", "unpacked"])
+		self.assertEqual(plan_changes(status, "purge", packages), ["vim", "broken", "removed", "unpacked"])
+		with self.assertRaises(ValueError):
+			plan_changes(status, "upgrade", packages)
+
+
+class EmptyPlanTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		self.env.stub(log=True)
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def test_nothing_to_change_skips_the_native_tool(self):
+		from strapon import SystemInstaller
+
+		installer = SystemInstaller("apt", self.env.root)
+		installer.metadata["packages"] = ["installed1", "installed2"]
+		installer.metadata["repositories"] = ["ppa:example/ppa"]
+		for action, expected in (("install", []), ("remove", ["installed1", "installed2"])):
+			with self.subTest(action=action):
+				self.assertEqual(installer.plan(action), expected)
+
+		self.assertEqual(installer.exec(argparse.Namespace(action="install")), [])
+		self.assertEqual(installer.exec(argparse.Namespace(action="purge", plan=True)),
+			["installed1", "installed2"])
+		self.assertFalse(os.path.exists(self.env.path("apt.log")))
+
+
+if __name__ == "__main__":
+	unittest.main()
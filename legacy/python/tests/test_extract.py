@@ -0,0 +1,119 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import io, os, stat, tarfile, zipfile, subprocess, unittest
+
+
+
+def _zip(members):
+	"""A zip of (name, data) files and (name, None, target) symlinks."""
+	buffer = io.BytesIO()
+	with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+		for name, data, *target in members:
+			info = zipfile.ZipInfo(name)
+			info.create_system = 3
+			if target:
+				info.external_attr = (stat.S_IFLNK | 0o777) << 16
+				data = target[0]
+			else:
+				info.external_attr = (stat.S_IFREG | 0o755) << 16
+			archive.writestr(info, data)
+
+	buffer.seek(0)
+	return buffer
+
+
+class ExtractTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		self.destination = self.env.path("out")
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def test_zip_links_inside_the_tree(self):
+		from strapon._extract import extract
+
+		extract(_zip([("lib/node", b"binary"), ("bin/node", None, "../lib/node")]), self.destination, "zip")
+		link = os.path.join(self.destination, "bin/node")
+		self.assertEqual(os.readlink(link), "../lib/node")
+		with open(link, "rb") as file:
+			self.assertEqual(file.read(), b"binary")
+		self.assertTrue(os.access(link, os.X_OK))
+
+	def test_zip_links_outside_the_tree(self):
+		from strapon._extract import ExtractError, extract
+
+		for target in ("../../etc/passwd", "/etc/passwd"):
+			with self.subTest(target=target), self.assertRaises(ExtractError):
+				extract(_zip([("bin/node", None, target)]), self.destination, "zip")
+		self.assertFalse(os.path.exists(self.destination))
+
+	def test_streamed_tar(self):
+		from strapon._extract import extract_url
+
+		os.makedirs(self.env.path("www"))
+		with tarfile.open(self.env.path("www", "tree.tar.gz"), "w:gz") as archive:
+			data = os.urandom(1 << 16)
+			info = tarfile.TarInfo("tree/data")
+			info.size = len(data)
+			archive.addfile(info, io.BytesIO(data))
+
+		self.assertEqual(extract_url(f"{self.env.serve()}/tree.tar.gz", self.destination), "tar")
+		with open(os.path.join(self.destination, "tree/data"), "rb") as file:
+			self.assertEqual(file.read(), data)
+
+	def test_unsafe_members_through_external_commands(self):
+		from strapon._extract import ExtractError, extract, _external_command
+
+		# Enough data behind the bad member that the command is still
+		# writing when extraction stops.
+		buffer = io.BytesIO()
+		with tarfile.open(fileobj=buffer, mode="w") as archive:
+			for i, name in enumerate(["../evil", *(f"tree/file{i}" for i in range(250))]):
+				data = os.urandom(1 << 14)
+				info = tarfile.TarInfo(name)
+				info.size = len(data)
+				archive.addfile(info, io.BytesIO(data))
+
+		for compression, argv in (("xz", ["xz", "-zc", "-0"]), ("zst", ["zstd", "-qc"])):
+			with self.subTest(compression=compression):
+				if _external_command(compression) is None:
+					self.skipTest(f"no external {compression} command")
+
+				data = subprocess.run(argv, input=buffer.getvalue(), capture_output=True, check=True).stdout
+				with self.assertRaises(ExtractError) as raised:
+					extract(io.BytesIO(data), self.destination, "tar")
+				self.assertIn("outside of the destination", str(raised.exception))
+				self.assertFalse(os.path.exists(self.destination))
+
+
+if __name__ == "__main__":
+	unittest.main()
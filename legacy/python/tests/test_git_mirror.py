@@ -0,0 +1,104 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, shutil, subprocess, unittest
+
+
+
+@unittest.skipIf(shutil.which("git") is None, "needs git")
+class GitMirrorTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		for variable in ("AUTHOR", "COMMITTER"):
+			os.environ[f"GIT_{variable}_NAME"] = "strapon"
+			os.environ[f"GIT_{variable}_EMAIL"] = "strapon@localhost"
+
+		self.upstream = self.env.path("upstream")
+		self.git("init", "-q", "-b", "main", self.upstream)
+		# NOTE: file:// only serves partial clones when allowed to.
+		self.git("-C", self.upstream, "config", "uploadpack.allowFilter", "true")
+		for version in range(3):
+			self.commit(f"{version}\n")
+		self.git("-C", self.upstream, "branch", "stable", "HEAD~1")
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def git(self, *argv):
+		return subprocess.run(["git", *argv], check=True, capture_output=True, text=True).stdout.strip()
+
+	def commit(self, version):
+		with open(os.path.join(self.upstream, "VERSION"), "wt") as file:
+			file.write(version)
+		self.git("-C", self.upstream, "add", "VERSION")
+		self.git("-C", self.upstream, "commit", "-q", "-m", version)
+
+	def mirror(self):
+		from strapon._git_mirror import GitMirror
+		return GitMirror(self.upstream, root=self.env.path("mirrors"))
+
+	def version(self, tree):
+		with open(os.path.join(tree, "VERSION"), "rt") as file:
+			return file.read()
+
+	def test_mirror_checkouts_share_objects(self):
+		tree = self.mirror().checkout(self.env.path("tree"))
+		self.assertEqual(self.version(tree), "2\n")
+		self.assertTrue(os.path.exists(os.path.join(tree, ".git/objects/info/alternates")))
+		self.assertEqual(self.git("-C", tree, "remote", "get-url", "origin"), self.upstream)
+
+		# A later run fetches the new commit into the mirror, then the tree.
+		self.commit("3\n")
+		self.assertEqual(self.version(self.mirror().checkout(tree)), "3\n")
+
+	def test_mirror_branches(self):
+		tree = self.mirror().checkout(self.env.path("tree"), "stable")
+		self.assertEqual(self.version(tree), "1\n")
+		self.assertEqual(self.git("-C", tree, "rev-parse", "--abbrev-ref", "HEAD"), "stable")
+
+	def test_shallow_checkouts(self):
+		tree = self.mirror().checkout(self.env.path("tree"), mode="shallow")
+		self.assertEqual(self.version(tree), "2\n")
+		self.assertEqual(self.git("-C", tree, "rev-list", "--count", "HEAD"), "1")
+		self.assertFalse(os.path.exists(self.mirror().path))
+
+	def test_blobless_checkouts(self):
+		tree = self.mirror().checkout(self.env.path("tree"), "stable", mode="blobless")
+		self.assertEqual(self.version(tree), "1\n")
+		self.assertEqual(self.git("-C", tree, "rev-list", "--count", "HEAD"), "2")
+		self.assertEqual(self.git("-C", tree, "config", "remote.origin.partialclonefilter"), "blob:none")
+
+	def test_unknown_modes(self):
+		with self.assertRaises(ValueError):
+			self.mirror().checkout(self.env.path("tree"), mode="sparse")
+
+
+if __name__ == "__main__":
+	unittest.main()
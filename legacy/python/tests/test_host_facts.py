@@ -0,0 +1,125 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment, run_python
+
+# standard imports
+import os, json, unittest
+
+
+
+FIXTURES = {
+	"ubuntu": 'NAME="Ubuntu"\nID=ubuntu\nID_LIKE=debian\nVERSION_ID="20.04"\n'
+		'VERSION_CODENAME=focal\nUBUNTU_CODENAME=focal\nCPU=aarch64\n',
+	"mint": 'NAME="Linux Mint"\nID=linuxmint\nID_LIKE="ubuntu debian"\nVERSION_ID="20.3"\n'
+		'VERSION_CODENAME=una\nUBUNTU_CODENAME=focal\n',
+	"debian": '# a comment\nNAME="Debian GNU/Linux"\nID=debian\nVERSION_ID="11"\n'
+		'VERSION_CODENAME=bullseye\n',
+}
+
+# A module choosing packages by distribution, most specific first.
+MODULE = """import json
+from strapon import *
+
+@strapon(SystemInstaller.default())
+@SystemInstaller.register_repository("ppa:example/ppa", os_name="ubuntu")
+@SystemInstaller.stage_package("vim-ubuntu", group="vim", os_name="ubuntu")
+@SystemInstaller.stage_package("vim-debian", group="vim", os_name="debian")
+@SystemInstaller.stage_package("bullseye-only", os_version="bullseye")
+def system(installer, namespace):
+	installer.exec(namespace)
+
+print(json.dumps([OS_ID, OS_IDLIKE, system.meta.get("packages"), system.meta.get("repositories")]))
+"""
+
+
+class HostFactsTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		for name, content in FIXTURES.items():
+			with open(self.env.path(f"{name}.os-release"), "wt") as file:
+				file.write(content)
+
+	def tearDown(self):
+		from strapon._host_facts import set_host_facts
+
+		set_host_facts(None)
+		self.env.__exit__(None, None, None)
+
+	def facts(self, name):
+		from strapon._host_facts import get_host_facts, set_host_facts, FIXTURE_VARIABLE
+
+		os.environ[FIXTURE_VARIABLE] = self.env.path(f"{name}.os-release")
+		set_host_facts(None)
+		return get_host_facts()
+
+	def test_fixture_files(self):
+		facts = self.facts("ubuntu")
+		self.assertEqual((facts.id, facts.id_like, facts.version_id, facts.cpu),
+			("ubuntu", ("debian",), "20.04", "aarch64"))
+		self.assertTrue(facts.matching_OS("debian"))
+		self.assertFalse(facts.matching_OS("fedora"))
+		self.assertTrue(facts.matching_VERSION(">=focal"))
+		self.assertTrue(facts.matching_CPU("aarch64"))
+		self.assertTrue(facts.matching_ALL(os_name="debian", os_version="<22", cpu="aarch64"))
+
+		# Without a CPU line, the real machine's.
+		self.assertEqual(self.facts("debian").cpu, os.uname().machine)
+
+	def test_precedence(self):
+		facts = self.facts("mint")
+		self.assertEqual([facts.rank(id) for id in ("linuxmint", "ubuntu", "debian", "fedora")],
+			[0, 1, 2, 3])
+		facts = self.facts("debian")
+		self.assertLess(facts.rank("debian"), facts.rank("ubuntu"))
+		self.assertFalse(facts.matching_OS("ubuntu"))
+
+	def test_default_installer(self):
+		from strapon._large_functions import get_default_system_installer
+
+		for name in FIXTURES:
+			with self.subTest(fixture=name):
+				self.facts(name)
+				self.assertEqual(get_default_system_installer(), "apt")
+
+	def test_module_resolution(self):
+		expected = {
+			"ubuntu": ["ubuntu", ["debian"], ["vim-ubuntu"], ["ppa:example/ppa"]],
+			"mint": ["linuxmint", ["ubuntu", "debian"], ["vim-ubuntu"], ["ppa:example/ppa"]],
+			"debian": ["debian", [], ["vim-debian", "bullseye-only"], None],
+		}
+		for name, result in expected.items():
+			with self.subTest(fixture=name):
+				environment = {k: v for k, v in os.environ.items() if not k in ("ID", "NAME")}
+				environment["STRAPON_HOST_FACTS"] = self.env.path(f"{name}.os-release")
+				process = run_python(MODULE, env=environment)
+				self.assertEqual(process.returncode, 0, process.stderr)
+				self.assertEqual(json.loads(process.stdout.splitlines()[-1]), result)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,122 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, threading, unittest
+
+
+
+class _Installer():
+	"""Just what _index_state.py asks of a SystemInstaller."""
+
+	def __init__(self, root):
+		self.name = "apt"
+		self.root = root
+		self.indexed = 0
+
+	def _index(self):
+		self.indexed += 1
+
+
+class IndexStateTest(unittest.TestCase):
+	def setUp(self):
+		from strapon import _index_state
+
+		self.env = BenchEnvironment().__enter__()
+		_index_state._indexed.clear()
+		self.path = self.env.path("index-state.json")
+		self.sources = os.path.join(self.env.root, "etc/apt/sources.list")
+		os.makedirs(os.path.dirname(self.sources), exist_ok=True)
+		with open(self.sources, "wt") as file:
+			file.write("deb http://archive.ubuntu.com/ubuntu focal main\n")
+
+	def tearDown(self):
+		from strapon import _index_state
+
+		_index_state._indexed.clear()
+		self.env.__exit__(None, None, None)
+
+	def state(self, ttl=100):
+		from strapon._index_state import IndexState
+		return IndexState(self.path, ttl=ttl)
+
+	def test_ttl(self):
+		self.state().record("apt", [self.sources], now=1000)
+		state = self.state()
+		self.assertTrue(state.is_fresh("apt", [self.sources], now=1099))
+		self.assertFalse(state.is_fresh("apt", [self.sources], now=1101))
+		self.assertFalse(state.is_fresh("other", [self.sources], now=1000))
+
+	def test_source_changes(self):
+		self.state().record("apt", [self.sources], now=1000)
+		with open(self.sources, "at") as file:
+			file.write("deb http://ppa.launchpad.net/example/ppa/ubuntu focal main\n")
+		self.assertFalse(self.state().is_fresh("apt", [self.sources], now=1000))
+
+	def test_invalidate(self):
+		state = self.state()
+		state.record("apt", [self.sources], now=1000)
+		state.invalidate("apt")
+		self.assertFalse(self.state().is_fresh("apt", [self.sources], now=1000))
+		state.record("apt", [self.sources], now=1000)
+		self.assertTrue(self.state().is_fresh("apt", [self.sources], now=1000))
+
+	def test_concurrent_writers_keep_each_others_entries(self):
+		# Each loaded the file before any of the others wrote to it.
+		states = [self.state() for _ in range(8)]
+		threads = [threading.Thread(target=state.record, args=(f"apt@/root{i}", [self.sources]))
+			for i, state in enumerate(states)]
+		for thread in threads: thread.start()
+		for thread in threads: thread.join()
+
+		self.assertEqual(sorted(self.state().state), sorted(f"apt@/root{i}" for i in range(8)))
+		self.assertEqual([name for name in os.listdir(self.env.path()) if name.endswith(".tmp")], [])
+
+	def test_index_once_per_process(self):
+		from strapon._index_state import index_once, invalidate_index
+
+		installer = _Installer(self.env.root)
+		self.assertTrue(index_once(installer, self.state()))
+		self.assertFalse(index_once(installer, self.state()))
+		self.assertEqual(installer.indexed, 1)
+
+		# Another process finds the index fresh and leaves it be.
+		from strapon import _index_state
+		_index_state._indexed.clear()
+		self.assertFalse(index_once(installer, self.state()))
+
+		# Until something marks it stale.
+		invalidate_index(installer, self.state())
+		self.assertTrue(index_once(installer, self.state()))
+		self.assertTrue(index_once(installer, self.state(), force=True))
+		self.assertEqual(installer.indexed, 3)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,132 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, json, unittest
+
+
+
+MODULE = """from strapon import *
+
+def standalone(*args):
+	raise NotImplementedError()
+
+@strapon(SystemInstaller.default())
+@SystemInstaller.register_repository("ppa:example/ppa", os_name="ubuntu")
+@SystemInstaller.stage_package({package!r}, os_version=">=20.04")
+@SystemInstaller.fallback_package("example-debian", os_name="debian")
+def system(installer, namespace):
+	installer.exec(namespace)
+
+def source(*args):
+	"Not yet."
+"""
+
+
+class ManifestTest(unittest.TestCase):
+	def setUp(self):
+		from strapon import _manifest
+
+		self.env = BenchEnvironment().__enter__()
+		self.modules = self.env.path("modules")
+		os.makedirs(self.modules)
+		self.path = self.env.path("manifest.json")
+		self.write("example", MODULE.format(package="example"))
+		self.write("_plumbing", "raise RuntimeError()\n")
+
+		# Counts modules actually read.
+		self.described = []
+		original = _manifest.describe_module
+		def describe(path):
+			self.described.append(os.path.basename(path))
+			return original(path)
+		_manifest.describe_module = describe
+		self.addCleanup(setattr, _manifest, "describe_module", original)
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def write(self, name, content):
+		with open(os.path.join(self.modules, f"{name}.py"), "wt") as file:
+			file.write(content)
+
+	def load(self):
+		from strapon._manifest import load_manifest
+		return load_manifest(self.modules, self.path)
+
+	def test_describe(self):
+		example = self.load()["example"]
+		self.assertEqual(example["formats"], ["system"])
+		self.assertEqual(example["packages"], [
+			{"name": "example", "format": "system", "os_version": ">=20.04"},
+			{"name": "example-debian", "format": "system", "os_name": "debian"}])
+		self.assertEqual(example["repositories"],
+			[{"name": "ppa:example/ppa", "format": "system", "os_name": "ubuntu"}])
+
+	def test_round_trip(self):
+		first = self.load()
+		self.assertEqual(list(first), ["example"])
+		self.assertEqual(self.load(), first)
+		self.assertEqual(self.described, ["example.py"])
+
+		with open(self.path, "rt") as file:
+			self.assertEqual(json.load(file)["modules"], first)
+
+	def test_stale_entries(self):
+		self.load()
+		self.write("example", MODULE.format(package="renamed-example"))
+		self.write("added", MODULE.format(package="added"))
+		manifest = self.load()
+		self.assertEqual(manifest["example"]["packages"][0]["name"], "renamed-example")
+		self.assertEqual(sorted(self.described), ["added.py", "example.py", "example.py"])
+
+		os.remove(os.path.join(self.modules, "added.py"))
+		self.assertEqual(list(self.load()), ["example"])
+
+	def test_damaged_manifests_are_rebuilt(self):
+		self.load()
+		for content in ("{not json", "[]", json.dumps({"version": 1, "directory": self.modules,
+				"modules": []}), json.dumps({"version": 1, "directory": self.modules,
+				"modules": {"example": {"formats": ["system"]}}})):
+			with self.subTest(content=content):
+				with open(self.path, "wt") as file:
+					file.write(content)
+				self.assertEqual(self.load()["example"]["formats"], ["system"])
+				with open(self.path, "rt") as file:
+					self.assertIn("stat", json.load(file)["modules"]["example"])
+
+	def test_broken_modules(self):
+		self.write("broken", "def system(:\n")
+		broken = self.load()["broken"]
+		self.assertEqual(broken["formats"], [])
+		self.assertIn("error", broken)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,110 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, json, socket, unittest
+
+
+
+class MirrorTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		os.makedirs(self.env.path("www"))
+		self.data = os.urandom(1 << 20)
+		with open(self.env.path("www", "file"), "wb") as file:
+			file.write(self.data)
+
+		self.fast = self.env.serve() + "/"
+		self.slow = self.env.serve(delay=0.2) + "/"
+		# Nothing listens on a port we just let go of.
+		with socket.socket() as probe:
+			probe.bind(("127.0.0.1", 0))
+			self.dead = f"http://127.0.0.1:{probe.getsockname()[1]}/"
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def selector(self, mirrors, base=None):
+		from strapon._mirrors import MirrorSelector
+
+		base = base or mirrors[0]
+		config = self.env.path("mirrors.json")
+		with open(config, "wt") as file:
+			json.dump({base: {"mirrors": mirrors, "probe": "file"}}, file)
+		os.environ["STRAPON_MIRRORS"] = config
+		return MirrorSelector(timeout=1)
+
+	def test_groups(self):
+		from strapon._mirrors import load_mirror_groups
+
+		path = self.env.path("groups.json")
+		with open(path, "wt") as file:
+			json.dump({"https://a.example/dist": ["https://b.example/dist"],
+				"https://c.example/": {"mirrors": ["https://d.example/"], "probe": "index.json"}}, file)
+		self.assertEqual(load_mirror_groups(path), {
+			"https://a.example/dist/": {"mirrors": ["https://a.example/dist/", "https://b.example/dist/"], "probe": ""},
+			"https://c.example/": {"mirrors": ["https://c.example/", "https://d.example/"], "probe": "index.json"},
+		})
+		self.assertEqual(load_mirror_groups(self.env.path("missing.json")), {})
+
+	def test_fastest_healthy_mirror_first(self):
+		selector = self.selector([self.dead, self.slow, self.fast], base=self.slow)
+		self.assertEqual(selector.ranking(self.slow), [self.fast, self.slow, self.dead])
+		self.assertEqual(selector.rewrite(f"{self.slow}file"), f"{self.fast}file")
+		self.assertEqual(selector.canonical(f"{self.fast}file"), f"{self.slow}file")
+		self.assertEqual(selector.candidates("https://elsewhere.example/file"), ["https://elsewhere.example/file"])
+
+	def test_rankings_are_cached(self):
+		from strapon._mirrors import MirrorSelector
+
+		self.selector([self.slow, self.fast]).ranking(self.slow)
+		probes = self.env.requests(), self.env.requests(delay=0.2)
+		self.assertEqual(MirrorSelector().ranking(self.slow), [self.fast, self.slow])
+		self.assertEqual((self.env.requests(), self.env.requests(delay=0.2)), probes)
+
+	def test_demoted_mirrors_go_last(self):
+		selector = self.selector([self.slow, self.fast])
+		self.assertEqual(selector.ranking(self.slow), [self.fast, self.slow])
+		selector.demote(f"{self.fast}file", "stalled")
+		self.assertEqual(selector.candidates(f"{self.slow}file"), [f"{self.slow}file", f"{self.fast}file"])
+
+	def test_stalled_downloads_fail_over(self):
+		from strapon._download import download
+
+		stalled = self.env.serve(stall_after=64 << 10) + "/"
+		failed = []
+		download(f"{stalled}file", self.env.path("downloaded"), mirrors=[f"{self.fast}file"],
+			failed=lambda url, error : failed.append(url), stall_timeout=0.5)
+		with open(self.env.path("downloaded"), "rb") as file:
+			self.assertEqual(file.read(), self.data)
+		self.assertEqual(failed, [f"{stalled}file"])
+
+
+if __name__ == "__main__":
+	unittest.main()
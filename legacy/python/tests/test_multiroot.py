@@ -0,0 +1,105 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, shutil, unittest
+
+
+
+class MultirootTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		self.env.stub(log=True)
+		self.roots = []
+		for name in ("first", "second"):
+			root = self.env.path(name)
+			shutil.copytree(self.env.root, root)
+			os.makedirs(os.path.join(root, "var/cache/apt/archives"))
+			self.roots.append(root)
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def provision(self, modules, **kwargs):
+		from strapon._multiroot import provision_roots
+
+		results = {r.root: r for r in provision_roots(self.roots, "install", modules, **kwargs)}
+		self.assertEqual(sorted(results), self.roots)
+		return [results[root] for root in self.roots]
+
+	def calls(self):
+		with open(self.env.path("apt.log"), "rt") as file:
+			return [line.split() for line in file]
+
+	def test_plans_every_root(self):
+		for result in self.provision(["profanity-im"], plan_only=True):
+			self.assertIsNone(result.error)
+			self.assertIn("profanity", result.report)
+		self.assertFalse(os.path.exists(self.env.path("apt.log")))
+
+	def test_installs_into_each_root(self):
+		for result in self.provision(["profanity-im"]):
+			self.assertIsNone(result.error)
+
+		installs = [argv for argv in self.calls() if "install" in argv]
+		self.assertEqual(len(installs), 2)
+		for root in self.roots:
+			self.assertEqual(sum(f"RootDir={root}" in argv for argv in installs), 1)
+
+	def test_roots_share_downloaded_packages(self):
+		with open(os.path.join(self.roots[0], "var/cache/apt/archives/profanity_1_amd64.deb"), "wb") as file:
+			file.write(b"package")
+
+		# NOTE: one process, so the roots run in order.
+		first, second = self.provision(["profanity-im"], processes=1)
+		self.assertEqual((first.linked, second.linked), (0, 1))
+		with open(os.path.join(self.roots[1], "var/cache/apt/archives/profanity_1_amd64.deb"), "rb") as file:
+			self.assertEqual(file.read(), b"package")
+
+	def test_other_installers_refuse_other_roots(self):
+		from strapon._large_functions import get_installer_root_options
+
+		self.assertEqual(get_installer_root_options("dnf", "/"), ())
+		with self.assertRaisesRegex(RuntimeError, "another root"):
+			get_installer_root_options("dnf", self.roots[0])
+
+	def test_failures_stay_with_their_root(self):
+		os.environ["STUB_APT_FAIL"] = f"RootDir={self.roots[1]}"
+		first, second = self.provision(["profanity-im"])
+		self.assertIsNone(first.error)
+		self.assertIsNotNone(second.error)
+
+	def test_unknown_modules_are_skipped(self):
+		for result in self.provision(["no-such-module"], plan_only=True):
+			self.assertIsNone(result.error)
+			self.assertIn("skipped no-such-module", result.report)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,126 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, unittest
+
+
+
+MODULE = """import os
+from strapon import *
+
+with open(os.environ["PLAN_IMPORTS"], "at") as file:
+	file.write("imported\\n")
+
+@strapon(SystemInstaller.default())
+@SystemInstaller.register_repository("ppa:example/ppa", os_name="ubuntu")
+@SystemInstaller.stage_package({package!r})
+def system(installer, namespace):
+	installer.exec(namespace)
+"""
+
+
+class PlanCacheTest(unittest.TestCase):
+	def setUp(self):
+		from strapon._host_facts import HostFacts, set_host_facts
+
+		self.env = BenchEnvironment().__enter__()
+		self.modules = self.env.path("modules")
+		os.makedirs(self.modules)
+		os.environ["PLAN_IMPORTS"] = self.env.path("imports")
+		self.write("example")
+		set_host_facts(HostFacts(id="ubuntu", id_like="debian", version_id="20.04"))
+
+	def tearDown(self):
+		from strapon._host_facts import set_host_facts
+
+		set_host_facts(None)
+		self.env.__exit__(None, None, None)
+
+	def write(self, package):
+		with open(os.path.join(self.modules, "example.py"), "wt") as file:
+			file.write(MODULE.format(package=package))
+
+	def imports(self):
+		try:
+			with open(self.env.path("imports"), "rt") as file:
+				return len(file.readlines())
+		except FileNotFoundError:
+			return 0
+
+	def load(self):
+		from strapon._plan import load_plan
+		return load_plan("example", directory=self.modules, cache=self.env.path("plans"))
+
+	def test_cache_hit(self):
+		plan = self.load()
+		self.assertEqual((plan.installer, plan.packages, plan.repositories),
+			("apt", ("example",), ("ppa:example/ppa",)))
+		self.assertEqual(self.load(), plan)
+		self.assertEqual(self.imports(), 1)
+
+	def test_source_edits_invalidate(self):
+		self.load()
+		self.write("changed")
+		self.assertEqual(self.load().packages, ("changed",))
+		self.assertEqual(self.imports(), 2)
+
+	def test_facts_changes_invalidate(self):
+		from strapon._host_facts import HostFacts, set_host_facts
+
+		self.load()
+		set_host_facts(HostFacts(id="debian", version_id="11"))
+		self.assertEqual(self.load().repositories, ())
+		self.assertEqual(self.imports(), 2)
+
+		# Both hosts' plans are kept.
+		set_host_facts(HostFacts(id="ubuntu", id_like="debian", version_id="20.04"))
+		self.assertEqual(self.load().repositories, ("ppa:example/ppa",))
+		self.assertEqual(self.imports(), 2)
+
+	def test_strapon_changes_invalidate(self):
+		from strapon import _plan
+
+		self.load()
+		_plan._framework, previous = "0" * 64, _plan._framework_digest()
+		try:
+			self.load()
+		finally:
+			_plan._framework = previous
+		self.assertEqual(self.imports(), 2)
+
+	def test_modules_without_plans(self):
+		with open(os.path.join(self.modules, "example.py"), "wt") as file:
+			file.write("def system(*args):\n\traise NotImplementedError()\n")
+		self.assertIsNone(self.load())
+		self.assertIsNone(self.load())
+
+
+if __name__ == "__main__":
+	unittest.main()
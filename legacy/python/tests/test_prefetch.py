@@ -0,0 +1,112 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, hashlib, unittest
+
+
+
+class PrefetchTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		self.server = self.env.serve()
+		self.pool = self.env.path("www", "pool")
+		os.makedirs(self.pool)
+		self.placed = os.path.join(self.env.root, "var/cache/apt/archives")
+		os.makedirs(self.placed)
+
+	def tearDown(self):
+		os.environ.pop("STUB_APT_URIS", None)
+		self.env.__exit__(None, None, None)
+
+	def publish(self, count, size=256, digest=None):
+		"""Serves count archives and lists them for the stub apt's --print-uris."""
+		with open(self.env.path("uris"), "wt") as listing:
+			for i in range(count):
+				data = os.urandom(size)
+				with open(os.path.join(self.pool, f"p{i}_1.0_amd64.deb"), "wb") as file:
+					file.write(data)
+				listing.write(f"'{self.server}/pool/p{i}_1.0_amd64.deb' p{i}_1.0_amd64.deb {size} "
+					f"SHA256:{digest or hashlib.sha256(data).hexdigest()}\n")
+
+		os.environ["STUB_APT_URIS"] = self.env.path("uris")
+		return [f"p{i}" for i in range(count)]
+
+	def prefetch(self, packages):
+		from strapon import SystemInstaller
+		from strapon._artifact_cache import ArtifactCache
+
+		self.cache = ArtifactCache(self.env.path("artifacts"))
+		return SystemInstaller("apt", self.env.root)._download(*packages, cache=self.cache)
+
+	def test_placed_archives_are_copies(self):
+		packages = self.publish(3)
+		self.assertEqual(len(self.prefetch(packages)), 3)
+
+		objects = {os.stat(os.path.join(self.cache.objects, name)).st_ino
+			for name in os.listdir(self.cache.objects)}
+		for name in os.listdir(self.placed):
+			placed = os.stat(os.path.join(self.placed, name))
+			self.assertNotIn(placed.st_ino, objects)
+			self.assertEqual(placed.st_nlink, 1)
+
+	def test_placing_checks_the_hash(self):
+		from strapon._backend import _place_files
+
+		source = self.env.path("source.deb")
+		with open(source, "wb") as file:
+			file.write(b"rewritten after the download was verified")
+		with self.assertRaises(ValueError):
+			_place_files([{"source": source, "path": os.path.join(self.placed, "p_1.0_amd64.deb"),
+				"size": 41, "algorithm": "SHA256", "digest": "0" * 64}])
+		self.assertEqual(os.listdir(self.placed), [])
+
+	def test_every_listed_archive_is_prefetched(self):
+		# More lines than run_streaming() keeps by default.
+		packages = self.publish(500, size=16)
+		self.assertEqual(len(self.prefetch(packages)), 500)
+		self.assertEqual(len(os.listdir(self.placed)), 500)
+
+	def test_failed_downloads_are_left_to_apt(self):
+		packages = self.publish(3)
+		os.remove(os.path.join(self.pool, "p1_1.0_amd64.deb"))
+		with open(self.env.path("uris"), "at") as listing:
+			listing.write(f"'{self.server}/pool/p0_1.0_amd64.deb' p3_1.0_amd64.deb 256 SHA256:{'0' * 64}\n")
+
+		self.assertEqual(sorted(self.prefetch(packages + ["p3"])), ["p0_1.0_amd64.deb", "p2_1.0_amd64.deb"])
+		self.assertEqual(sorted(os.listdir(self.placed)), ["p0_1.0_amd64.deb", "p2_1.0_amd64.deb"])
+
+	def test_failed_queries_are_left_to_apt(self):
+		packages = self.publish(1)
+		os.environ["STUB_APT_FAIL"] = "--print-uris"
+		self.assertEqual(self.prefetch(packages), [])
+		self.assertEqual(os.listdir(self.placed), [])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,169 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, sys, unittest
+
+
+
+# Stands in for apt: reports each package it's asked to install on the Status-Fd it's
+# given, then prints whatever STATUS_OUTPUT holds.
+STATUS_SCRIPT = f"""#!{sys.executable}
+import os, sys
+fd = next(int(a.split("=")[1]) for a in sys.argv if a.startswith("APT::Status-Fd="))
+with os.fdopen(fd, "w") as status:
+	for package in sys.argv[4:]:
+		status.write(f"pmstatus:{{package}}:50:Unpacking {{package}} (amd64)\\n")
+	status.write("not a status line\\n")
+sys.stdout.buffer.write(os.environb.get(b"STATUS_OUTPUT", b""))
+"""
+
+
+class ParseTest(unittest.TestCase):
+	def test_download_status(self):
+		from strapon._progress import parse_apt_status
+
+		event = parse_apt_status("dlstatus:3:42.5:Retrieving file 3 of 8")
+		self.assertEqual((event.kind, event.phase, event.package, event.percent),
+			("progress", "download", None, 42.5))
+		self.assertEqual(event.message, "Retrieving file 3 of 8")
+
+	def test_dpkg_phases(self):
+		from strapon._progress import parse_apt_status
+
+		for message, phase in (("Preparing to unpack", "unpack"), ("Unpacking krita", "unpack"),
+				("Setting up krita", "configure"), ("Running ldconfig", "trigger"),
+				("Removing krita", "remove"), ("Completely removed krita", "purge"),
+				("Something new", "dpkg")):
+			with self.subTest(message=message):
+				event = parse_apt_status(f"pmstatus:krita:60:{message}")
+				self.assertEqual((event.phase, event.package, event.percent), (phase, "krita", 60.0))
+
+	def test_errors(self):
+		from strapon._progress import parse_apt_status
+
+		event = parse_apt_status("pmerror:krita:60:trying to overwrite '/usr/bin/krita': exists")
+		self.assertEqual((event.kind, event.phase, event.package), ("error", "dpkg", "krita"))
+		# Only the first three colons split fields.
+		self.assertEqual(event.message, "trying to overwrite '/usr/bin/krita': exists")
+
+		event = parse_apt_status("dlerror::0:Failed to fetch http://example.com/a.deb")
+		self.assertEqual((event.kind, event.phase, event.package), ("error", "download", None))
+		self.assertEqual(event.message, "Failed to fetch http://example.com/a.deb")
+
+	def test_anything_else(self):
+		from strapon._progress import parse_apt_status
+
+		for line in ("", "garbage", "pmstatus:krita:sixty:Unpacking krita",
+				"media-change:cdrom:label:insert", "other:krita:60:Unpacking krita"):
+			with self.subTest(line=line):
+				self.assertIsNone(parse_apt_status(line))
+
+
+class StreamingTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		self.script = self.env.path("fake-apt")
+		with open(self.script, "wt") as file:
+			file.write(STATUS_SCRIPT)
+		os.chmod(self.script, 0o755)
+
+	def tearDown(self):
+		os.environ.pop("STATUS_OUTPUT", None)
+		self.env.__exit__(None, None, None)
+
+	def run_script(self, *packages, output=b"", **kwargs):
+		from strapon._progress import run_streaming
+
+		os.environ["STATUS_OUTPUT"] = output.decode()
+		events = []
+		result = run_streaming([self.script, "install", *packages],
+			status=lambda fd : ("-o", f"APT::Status-Fd={fd}"), emit=events.append, **kwargs)
+		return result, events
+
+	def test_status_events(self):
+		result, events = self.run_script("a", "b", output=b"done\n")
+		self.assertEqual(result["exit_code"], 0)
+		progress = [(e.phase, e.package) for e in events if e.kind == "progress"]
+		self.assertEqual(progress, [("unpack", "a"), ("unpack", "b")])
+		lines = [(e.stream, e.message) for e in events if e.kind == "line"]
+		self.assertEqual(lines, [("stdout", "done")])
+
+	def test_retained_lines(self):
+		output = "".join(f"line {i}\n" for i in range(25)).encode()
+		result, events = self.run_script(output=output, retain=10)
+		self.assertEqual(result["stdout"].splitlines(),
+			["[15 earlier lines dropped]", *(f"line {i}" for i in range(15, 25))])
+		# Every line is still handed to emit.
+		self.assertEqual(len([e for e in events if e.kind == "line"]), 25)
+
+		result, _ = self.run_script(output=output, retain=None)
+		self.assertEqual(result["stdout"], output.decode())
+
+	def test_line_breaks(self):
+		result, events = self.run_script(output=b"10%\r20%\r\nlast")
+		self.assertEqual([e.message for e in events if e.kind == "line"], ["10%", "20%", "last"])
+		self.assertEqual(result["stdout"], "10%\n20%\nlast\n")
+
+	def test_long_lines_are_cut(self):
+		from strapon._progress import MAXIMUM_LINE
+
+		_, events = self.run_script(output=b"x" * (MAXIMUM_LINE * 3) + b"\n")
+		lines = [e.message for e in events if e.kind == "line"]
+		self.assertTrue(lines)
+		self.assertTrue(all(len(line) <= MAXIMUM_LINE for line in lines))
+
+
+class InstallerProgressTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		os.environ["STRAPON_SUDO"] = ""
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def test_subscribers_see_apt_progress(self):
+		from strapon import SystemInstaller
+		from strapon._progress import subscribe, unsubscribe
+
+		for mode in ("direct", "worker"):
+			with self.subTest(mode=mode):
+				os.environ["STRAPON_BACKEND"] = mode
+				events = []
+				callback = subscribe(events.append)
+				try:
+					SystemInstaller("apt", self.env.root)._install("a", "b")
+				finally:
+					unsubscribe(callback)
+				self.assertEqual([(e.phase, e.package, e.percent) for e in events],
+					[("configure", "a", 10.0), ("configure", "b", 20.0)])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,119 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import PYTHON
+
+# standard imports
+import os, stat, shutil, tempfile, unittest
+import importlib.util
+
+
+
+def _load_meteor_os():
+	spec = importlib.util.spec_from_file_location("meteor_os", os.path.join(PYTHON, "meteor-os.py"))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+
+class RegionTest(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.regions = _load_meteor_os()
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix="strapon-regions-")
+		self.rc = os.path.join(self.directory, ".bashrc")
+		with open(self.rc, "wt") as file:
+			file.write("export A=1\n")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def read(self, path=None):
+		with open(path or self.rc, "rt") as file:
+			return file.read()
+
+	def test_operations(self):
+		edit = self.regions.edit_regions
+		self.assertTrue(edit(self.rc, [("add", "path", "export PATH=/opt/bin:$PATH\n")]))
+		self.assertFalse(edit(self.rc, [("add", "path", "ignored\n")]))
+		self.assertTrue(self.regions.has_region(self.rc, "path"))
+
+		self.assertTrue(edit(self.rc, [("replace", "path", "export PATH=/usr/local/bin:$PATH\n")]))
+		self.assertFalse(edit(self.rc, [("replace", "path", "export PATH=/usr/local/bin:$PATH\n")]))
+		self.assertIn("/usr/local/bin", self.read())
+		self.assertNotIn("/opt/bin", self.read())
+
+		self.assertTrue(edit(self.rc, [("remove", "path")]))
+		self.assertEqual(self.read(), "export A=1\n")
+		with self.assertRaises(ValueError):
+			edit(self.rc, [("rename", "path")])
+
+	def test_symlinked_dotfiles_stay_links(self):
+		target = os.path.join(self.directory, "dotfiles-bashrc")
+		os.rename(self.rc, target)
+		os.symlink(target, self.rc)
+
+		self.regions.add_region(self.rc, "path", "export PATH=/opt/bin:$PATH\n")
+		self.assertTrue(os.path.islink(self.rc))
+		self.assertIn("/opt/bin", self.read(target))
+
+	def test_mode_and_owner_are_kept(self):
+		os.chmod(self.rc, 0o640)
+		if os.geteuid() == 0:
+			os.chown(self.rc, 12345, 23456)
+
+		self.regions.add_region(self.rc, "path", "export PATH=/opt/bin:$PATH\n")
+		status = os.stat(self.rc)
+		self.assertEqual(stat.S_IMODE(status.st_mode), 0o640)
+		if os.geteuid() == 0:
+			self.assertEqual((status.st_uid, status.st_gid), (12345, 23456))
+
+	def test_missing_files(self):
+		missing = os.path.join(self.directory, "missing")
+		self.assertFalse(self.regions.remove_region(missing, "path"))
+		self.assertFalse(os.path.exists(missing))
+
+	def test_overlapping_regions_are_rejected(self):
+		for markers in (("a", "b", "a", "b"), ("a", "b", "b", "a")):
+			with self.subTest(markers=markers):
+				with open(self.rc, "wt") as file:
+					for marker, kind in zip(markers, "++--"):
+						file.write(f"###{kind}{marker}{kind}###\nline\n")
+				with self.assertRaises(ValueError):
+					self.regions.remove_region(self.rc, "a")
+
+		# Copies one after another are fine, and all removed.
+		with open(self.rc, "wt") as file:
+			file.write("###+a+###\none\n###-a-###\nkept\n###+a+###\ntwo\n###-a-###\n")
+		self.assertTrue(self.regions.remove_region(self.rc, "a"))
+		self.assertEqual(self.read(), "kept\n")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,153 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, json, time, unittest
+
+
+
+NODEJS = [
+	{"version": "v20.1.0", "date": "2023-05-03", "files": ["linux-x64", "src"], "lts": False},
+	{"version": "v18.16.0", "date": "2023-04-12", "files": ["linux-x64", "linux-arm64"], "lts": "Hydrogen"},
+	{"version": "v18.9.1", "date": "2022-10-12", "files": ["linux-x64"], "lts": False},
+	{"version": "v16.20.0", "date": "2023-03-28", "files": ["linux-x64"], "lts": "Gallium"},
+	{"version": "v16.3.0", "date": "2021-06-02", "files": ["linux-x64"], "lts": False},
+]
+
+GITHUB = [
+	{"tag_name": "v2.0.0-rc1", "prerelease": True, "assets": []},
+	{"tag_name": "v1.10.0", "assets": [{"name": "app-x86_64.AppImage",
+		"browser_download_url": "https://example.org/v1.10.0/app-x86_64.AppImage"}]},
+	{"tag_name": "v1.9.0", "assets": []},
+	{"tag_name": "v3.0.0", "draft": True, "assets": []},
+]
+
+
+class ReleaseIndexTest(unittest.TestCase):
+	def setUp(self):
+		from strapon._releases import ReleaseIndex, parse_releases
+
+		self.index = ReleaseIndex(parse_releases(NODEJS, "https://nodejs.org/dist/index.json"))
+
+	def versions(self, query):
+		return [r.version for r in self.index.select(query)]
+
+	def test_queries(self):
+		for query, version in (("latest", "v20.1.0"), ("lts", "v18.16.0"), ("lts/gallium", "v16.20.0"),
+				("18", "v18.16.0"), ("v16", "v16.20.0"), ("^16", "v16.20.0"), ("<18", "v16.20.0"),
+				("lts <18", "v16.20.0"), ("18.9", "v18.9.1")):
+			with self.subTest(query=query):
+				self.assertEqual(self.index.resolve(query).version, version)
+
+		self.assertEqual(self.versions("18"), ["v18.9.1", "v18.16.0"])
+		self.assertEqual(self.versions("lts"), ["v16.20.0", "v18.16.0"])
+
+	def test_no_match(self):
+		from strapon._releases import ReleaseError
+
+		for query in ("^21", "lts/argon", "lts >=20"):
+			with self.subTest(query=query), self.assertRaises(ReleaseError):
+				self.index.resolve(query)
+
+	def test_assets(self):
+		from strapon._releases import ReleaseError
+
+		release = self.index.resolve("lts")
+		self.assertEqual(release.asset("*-linux-arm64.tar.xz"),
+			"https://nodejs.org/dist/v18.16.0/node-v18.16.0-linux-arm64.tar.xz")
+		with self.assertRaises(ReleaseError):
+			release.asset("*.zip")
+
+	def test_github_releases(self):
+		from strapon._releases import ReleaseIndex, parse_releases
+
+		releases = parse_releases(GITHUB, "https://api.github.com/repos/o/r/releases")
+		self.assertEqual(ReleaseIndex(releases).resolve().version, "v1.10.0")
+		self.assertEqual(ReleaseIndex(releases, prereleases=True).resolve().version, "v2.0.0-rc1")
+		self.assertEqual(ReleaseIndex(releases).resolve().asset("*.AppImage"),
+			"https://example.org/v1.10.0/app-x86_64.AppImage")
+
+
+class ReleaseCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.env = BenchEnvironment().__enter__()
+		os.makedirs(self.env.path("www", "dist"))
+		self.publish(NODEJS)
+		self.url = f"{self.env.serve()}/dist/index.json"
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def publish(self, releases):
+		path = self.env.path("www", "dist", "index.json")
+		with open(path, "wt") as file:
+			json.dump(releases, file)
+		# NOTE: a fresh mtime, so the ETag changes even within a second.
+		os.utime(path, ns=(time.time_ns(), time.time_ns()))
+
+	def fetch(self, **kwargs):
+		from strapon._releases import fetch_release_index
+
+		before = self.env.requests()
+		index = fetch_release_index(self.url, **kwargs)
+		return index.resolve().version, self.env.requests() - before
+
+	def test_cached_within_the_ttl(self):
+		self.assertEqual(self.fetch(), ("v20.1.0", 1))
+		self.assertEqual(self.fetch(), ("v20.1.0", 0))
+
+	def test_revalidated_past_the_ttl(self):
+		self.fetch()
+		self.assertEqual(self.fetch(ttl=0), ("v20.1.0", 1))
+
+		self.publish([{"version": "v21.0.0", "files": ["linux-x64"], "lts": False}, *NODEJS])
+		self.assertEqual(self.fetch(), ("v20.1.0", 0))
+		self.assertEqual(self.fetch(ttl=0), ("v21.0.0", 1))
+
+	def test_stale_index_when_unreachable(self):
+		from strapon._download import DownloadError
+
+		self.fetch()
+		os.remove(self.env.path("www", "dist", "index.json"))
+		self.assertEqual(self.fetch(ttl=0), ("v20.1.0", 1))
+
+		self.url += ".missing"
+		with self.assertRaises(DownloadError):
+			self.fetch()
+
+	def test_web_installer_from_release(self):
+		from strapon import WebInstaller
+
+		installer = WebInstaller.from_release(self.url, "lts ^16", "*-linux-x64.tar.xz")
+		self.assertEqual(installer.release.version, "v16.20.0")
+		self.assertEqual(installer.resource, f"{self.url.rsplit('/', 1)[0]}/v16.20.0/node-v16.20.0-linux-x64.tar.xz")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,93 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import BenchEnvironment
+
+# standard imports
+import os, time, unittest
+
+
+
+class RegistrarTest(unittest.TestCase):
+	def setUp(self):
+		from strapon import SystemInstaller
+		from strapon._index_state import IndexState, _state_key, _sources
+
+		self.env = BenchEnvironment().__enter__()
+		self.env.stub(log=True)
+		self.installer = SystemInstaller("apt", self.env.root)
+		self.lists = os.path.join(self.env.root, "etc/apt/sources.list.d")
+		os.makedirs(self.lists)
+		with open(os.path.join(self.env.root, "etc/apt/sources.list"), "wt") as file:
+			file.write("deb http://archive.ubuntu.com/ubuntu jammy main\n")
+
+		self.key = _state_key(self.installer)
+		self.refreshed = time.time() - 600
+		IndexState().record(self.key, _sources(self.installer), now=self.refreshed)
+
+	def tearDown(self):
+		self.env.__exit__(None, None, None)
+
+	def register(self, *specs):
+		from strapon._repositories import AptRepositoryRegistrar
+		return AptRepositoryRegistrar(self.installer)(*specs)
+
+	def state(self):
+		from strapon._index_state import IndexState
+		return IndexState().state[self.key]
+
+	def test_configured_sources_are_skipped(self):
+		self.assertEqual(self.register("deb http://archive.ubuntu.com/ubuntu jammy main"), [])
+		added = self.register("deb http://example.org/repo jammy main",
+			"deb http://example.org/repo jammy main")
+		self.assertEqual([r.spec for r in added], ["deb http://example.org/repo jammy main"])
+		with open(os.path.join(self.lists, f"{added[0].name}.list"), "rt") as file:
+			self.assertEqual(file.read(), "deb http://example.org/repo jammy main\n")
+
+	def test_partial_refresh_keeps_the_index_age(self):
+		from strapon._index_state import index_is_fresh
+
+		self.register("deb http://example.org/repo jammy main")
+		self.assertEqual(self.state()["refreshed"], self.refreshed)
+		self.assertTrue(index_is_fresh(self.installer))
+
+	def test_partial_refresh_doesnt_extend_the_ttl(self):
+		from strapon._index_state import IndexState, _sources
+
+		self.register("deb http://example.org/repo jammy main")
+		with open(self.env.path("apt.log"), "rt") as file:
+			calls = [line.split() for line in file]
+		self.assertEqual(len(calls), 1)
+		self.assertIn("update", calls[0])
+
+		state = IndexState()
+		self.assertFalse(state.is_fresh(self.key, _sources(self.installer),
+			now=self.refreshed + state.ttl + 1))
+
+
+if __name__ == "__main__":
+	unittest.main()
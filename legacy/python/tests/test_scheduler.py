@@ -0,0 +1,121 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+# NOTE: only for putting strapon on sys.path.
+import _support
+
+# standard imports
+import time, threading, unittest
+
+
+
+class SchedulerTest(unittest.TestCase):
+	def test_order(self):
+		from strapon._scheduler import Scheduler, SchedulerError
+
+		scheduler = Scheduler()
+		scheduler.add("install", lambda : None, requires=("index", "download"))
+		scheduler.add("download", lambda : None, requires=("index",))
+		scheduler.add("index", lambda : None)
+		self.assertEqual(scheduler.order(), ["index", "download", "install"])
+		with self.assertRaises(SchedulerError):
+			scheduler.add("index", lambda : None)
+
+	def test_cycles(self):
+		from strapon._scheduler import Scheduler, SchedulerError
+
+		scheduler = Scheduler()
+		scheduler.add("a", lambda : None, requires=("b",))
+		scheduler.add("b", lambda : None, requires=("c",))
+		scheduler.add("c", lambda : None, requires=("a",))
+		with self.assertRaises(SchedulerError) as raised:
+			scheduler.run()
+		self.assertIn("a -> b -> c -> a", str(raised.exception))
+
+		scheduler = Scheduler()
+		scheduler.add("a", lambda : None, requires=("missing",))
+		with self.assertRaisesRegex(SchedulerError, "unknown task 'missing'"):
+			scheduler.order()
+
+	def test_requirements_finish_first(self):
+		from strapon._scheduler import Scheduler
+
+		finished, lock = [], threading.Lock()
+		def step(name, delay=0):
+			def action():
+				time.sleep(delay)
+				with lock: finished.append(name)
+				return name
+			return action
+
+		scheduler = Scheduler(workers=4)
+		scheduler.add("slow", step("slow", 0.05))
+		scheduler.add("fast", step("fast"))
+		scheduler.add("after", step("after"), requires=("slow", "fast"))
+		self.assertEqual(scheduler.run(), {"slow": "slow", "fast": "fast", "after": "after"})
+		self.assertEqual(finished[-1], "after")
+
+	def test_exclusive_tasks_run_one_at_a_time(self):
+		from strapon._scheduler import Scheduler
+
+		active, most, lock = [0], [0], threading.Lock()
+		def locked():
+			with lock:
+				active[0] += 1
+				most[0] = max(most[0], active[0])
+			time.sleep(0.02)
+			with lock: active[0] -= 1
+
+		overlapped = threading.Barrier(2, timeout=5)
+		scheduler = Scheduler(workers=8)
+		for i in range(4):
+			scheduler.add(f"apt{i}", locked, exclusive="native:apt")
+		# Tasks without the resource still run alongside each other.
+		scheduler.add("fetch0", overlapped.wait)
+		scheduler.add("fetch1", overlapped.wait)
+		scheduler.run()
+		self.assertEqual(most[0], 1)
+
+	def test_failures_stop_dependents(self):
+		from strapon._scheduler import Scheduler, SchedulerError
+
+		ran = []
+		def fail(): raise RuntimeError("no network")
+		scheduler = Scheduler(workers=1)
+		scheduler.add("download", fail)
+		scheduler.add("install", lambda : ran.append("install"), requires=("download",))
+		scheduler.add("configure", lambda : ran.append("configure"), requires=("install",))
+		with self.assertRaises(SchedulerError) as raised:
+			scheduler.run()
+
+		self.assertIn("'download' failed: no network", str(raised.exception))
+		self.assertIsInstance(raised.exception.__cause__, RuntimeError)
+		self.assertEqual(ran, [])
+
+
+if __name__ == "__main__":
+	unittest.main()
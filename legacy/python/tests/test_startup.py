@@ -0,0 +1,64 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+from _support import run_python
+
+# standard imports
+import os, json, unittest
+
+
+
+# Modules `strapon --help` has no use for; each one costs milliseconds.
+HEAVY = ("sh", "http.client", "ssl", "platform", "semver")
+
+CODE = """
+import sys, json, runpy
+sys.argv = ["strapon", "--help"]
+try:
+	runpy.run_module("strapon", run_name="__main__", alter_sys=True)
+except SystemExit:
+	pass
+print(json.dumps(sorted(sys.modules)), file=sys.stderr)
+"""
+
+
+class StartupTest(unittest.TestCase):
+	def imported(self, **environment):
+		result = run_python(CODE, env={**os.environ, **environment})
+		self.assertIn("usage: strapon", result.stdout)
+		return set(json.loads(result.stderr.splitlines()[-1]))
+
+	def test_help_imports_nothing_heavy(self):
+		for module in HEAVY:
+			self.assertNotIn(module, self.imported())
+
+	def test_optimized_mode_skips_contracts(self):
+		self.assertNotIn("dpcontracts", self.imported(STRAPON_OPTIMIZE="1"))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,149 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# external imports
+#...
+
+# internal imports
+from _support import PYTHON, run_python
+
+# standard imports
+import os, sys, json, tempfile, threading, subprocess, unittest
+
+
+
+class TraceTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.directory.name, "victim.py")
+		with open(self.path, "wt") as file:
+			file.write("original\n")
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+	def test_import_ignores_host_argv(self):
+		environment = {k: v for k, v in os.environ.items() if k != "STRAPON_TRACE"}
+		result = run_python("import sys; sys.argv = ['pytest', '--trace', %r]; import strapon"
+			% self.path, env=environment)
+		self.assertEqual(result.returncode, 0, result.stderr)
+		with open(self.path, "rt") as file:
+			self.assertEqual(file.read(), "original\n")
+
+	def test_environment_enables_tracing(self):
+		path = os.path.join(self.directory.name, "trace.json")
+		result = run_python("import strapon\nwith strapon.span('phase', 'test'): pass",
+			env={**os.environ, "STRAPON_TRACE": path})
+		self.assertEqual(result.returncode, 0, result.stderr)
+		with open(path, "rt") as file:
+			events = json.load(file)["traceEvents"]
+		self.assertIn("phase", [event["name"] for event in events])
+
+	def test_cli_option(self):
+		path = os.path.join(self.directory.name, "cli.json")
+		result = subprocess.run([sys.executable, "-m", "strapon", "--trace", path, "list"],
+			cwd=PYTHON, capture_output=True, text=True)
+		self.assertEqual(result.returncode, 0, result.stderr)
+		self.assertIn(f"trace written to {path}", result.stderr)
+		with open(path, "rt") as file:
+			self.assertIn("traceEvents", json.load(file))
+
+	def test_singleton_cli_option(self):
+		path = os.path.join(self.directory.name, "singleton.json")
+		result = run_python("import sys, strapon\n"
+			f"sys.argv = ['app.py', '--trace', {path!r}, 'system', 'install']\n"
+			"def system(args):\n"
+			"	with strapon.span('install', 'test', action=args.action): pass\n"
+			"strapon.singleton_CLI('app.py', system_fn=system)")
+		self.assertEqual(result.returncode, 0, result.stderr)
+		with open(path, "rt") as file:
+			events = json.load(file)["traceEvents"]
+		self.assertEqual([(e["name"], e["args"]) for e in events if e["cat"] == "test"],
+			[("install", {"action": "install"})])
+
+
+class SpanTest(unittest.TestCase):
+	def setUp(self):
+		from strapon import _trace
+
+		self.previous = _trace.disable()
+		self.tracer = _trace.enable()
+
+	def tearDown(self):
+		from strapon import _trace
+
+		_trace.disable()
+		if self.previous is not None: _trace._tracer = self.previous
+
+	def test_chrome_trace_events(self):
+		from strapon._trace import span
+
+		with span("outer", "test", step=1):
+			with span("inner", "test") as inner:
+				inner.set(exit_code=0, bytes=10)
+
+		inner, outer = self.tracer.chrome_trace()["traceEvents"]
+		for event in (inner, outer):
+			self.assertEqual((event["ph"], event["cat"], event["pid"], event["tid"]),
+				("X", "test", os.getpid(), threading.get_ident()))
+		self.assertEqual((outer["name"], outer["args"]), ("outer", {"step": 1}))
+		self.assertEqual((inner["name"], inner["args"]), ("inner", {"exit_code": 0, "bytes": 10}))
+		# Microseconds from the tracer's start, the inner span inside the outer.
+		self.assertGreaterEqual(inner["ts"], outer["ts"])
+		self.assertLessEqual(inner["ts"] + inner["dur"], outer["ts"] + outer["dur"])
+
+	def test_errors_are_recorded(self):
+		from strapon._trace import span
+
+		error = RuntimeError("failed\nwith details")
+		error.exit_code = 100
+		with self.assertRaises(RuntimeError):
+			with span("install", "apt"):
+				raise error
+
+		event, = self.tracer.events
+		self.assertEqual(event["args"], {"error": "RuntimeError: failed", "exit_code": 100})
+
+	def test_disabled_spans_record_nothing(self):
+		from strapon import _trace
+
+		self.assertIs(_trace.disable(), self.tracer)
+		with _trace.span("ignored") as ignored:
+			ignored.set(exit_code=1)
+		self.assertIsNone(_trace.get_tracer())
+		self.assertEqual(self.tracer.events, [])
+
+	def test_summary(self):
+		from strapon._trace import span
+
+		for i in range(3):
+			with span(f"fetch https://example.com/{i}", "download"): pass
+		with span("index", "apt"): pass
+
+		header, *rows = self.tracer.summary().splitlines()
+		self.assertEqual(header.split()[:3], ["category", "span", "count"])
+		self.assertEqual(sorted(row.split()[:3] for row in rows),
+			[["apt", "index", "1"], ["download", "fetch", "3"]])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,115 @@
+# -- encoding=utf-8 --
+# Copyright 2020 Ruby Allison Rose (aka. M3TIOR)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# external imports
+#...
+
+# internal imports
+# NOTE: only for putting strapon on sys.path.
+import _support
+
+# standard imports
+import shutil, subprocess, unittest
+
+
+
+# (a, b, how a compares to b) in dpkg's order.
+ORDER = [
+	("1.0", "1.0", 0),
+	("1.0", "1.0-0", 0),
+	("1.0", "1.00", 0),
+	("1.0", "1.1", -1),
+	("1.10", "1.9", 1),
+	("1.0", "1.0.1", -1),
+	# A tilde sorts before anything, even the end of the version.
+	("1.0~rc1", "1.0", -1),
+	("1.0~rc1", "1.0~rc2", -1),
+	("1.0~~", "1.0~", -1),
+	("1.0~", "1.0", -1),
+	("1.0", "1.0+b1", -1),
+	# Letters sort before other characters.
+	("1.0a", "1.0+", -1),
+	("1.0a", "1.0.", -1),
+	("1.0a", "1.0b", -1),
+	("1.0A", "1.0a", -1),
+	("1.0a", "1.0", 1),
+	# Epochs outweigh everything else.
+	("1:1.0", "2.0", 1),
+	("0:2.0", "2.0", 0),
+	("1:1.0", "2:0.1", -1),
+	# The epoch ends at the first colon.
+	("1:2:3", "1:2:4", -1),
+	("1:2:3", "2:1", -1),
+	# The revision starts after the last hyphen.
+	("1.0-1", "1.0-2", -1),
+	("1.0-1-2", "1.0-1-10", -1),
+	("1.0-10", "1.0-9", 1),
+	("1.0-1", "1.0-1ubuntu1", -1),
+	("1.0-1ubuntu1", "1.0-1build1", 1),
+	("2.30-0ubuntu2", "2.30-0ubuntu10", -1),
+	("20.04", "focal", 0),
+]
+
+
+def _dpkg_compare(a, b):
+	for operator, result in (("lt", -1), ("eq", 0)):
+		if subprocess.run(["dpkg", "--compare-versions", a, operator, b]).returncode == 0:
+			return result
+
+	return 1
+
+
+class VersionKeyTest(unittest.TestCase):
+	def test_order(self):
+		from strapon._versions import version_key
+
+		for a, b, expected in ORDER:
+			with self.subTest(a=a, b=b):
+				ka, kb = version_key(a), version_key(b)
+				self.assertEqual((ka > kb) - (ka < kb), expected)
+
+	@unittest.skipIf(shutil.which("dpkg") is None, "needs dpkg")
+	def test_order_matches_dpkg(self):
+		for a, b, expected in ORDER:
+			if "focal" in (a, b): continue
+			with self.subTest(a=a, b=b):
+				self.assertEqual(_dpkg_compare(a, b), expected)
+
+
+class ConstraintTest(unittest.TestCase):
+	def test_matches(self):
+		from strapon._versions import compile_constraint
+
+		for text, version, expected in (
+				(">=18.04 <22", "20.04", True), (">=18.04 <22", "22.04", False),
+				("<=focal", "18.04", True), ("bookworm", "12", True),
+				("^18", "18.9", True), ("^18", "19.0~rc1", False),
+				("~1.2", "1.2.9", True), ("~1.2", "1.3", False),
+				("1.x", "1.5", True), ("1 - 2", "2", True), ("!=2", "2", False), ("!=2", "2.0", True),
+				("<1 || >=3", "2", False), ("<1 || >=3", "3", True)):
+			with self.subTest(text=text, version=version):
+				self.assertEqual(compile_constraint(text).matches(version), expected)
+
+
+if __name__ == "__main__":
+	unittest.main()